@@ -0,0 +1,230 @@
+"""Archivage des LOGS remplacés (collection LOGS_ARCHIVES).
+
+Les logs « Remplacé » plus vieux que `--age` jours quittent LOGS pour des
+documents d'archive mensuels `AAAA-MM_000`, `AAAA-MM_001`... d'au plus
+TAILLE_PARTIE logs chacun (un document Firestore est limité à 1 Mio). Chaque
+partie est écrite dans le même batch que la suppression des logs qu'elle
+reçoit et que la mise à jour de l'index (PARAMETRES/archives_logs) : un arrêt
+en cours de route ne perd ni ne duplique aucun log.
+
+Les requêtes de l'application (dossiers ouverts, pages d'historique) ne
+portent plus que sur les logs récents ; l'historique complète ses pages avec
+les archives, mois par mois. Les agrégats STATS ne bougent pas (ils sont tenus
+à l'écriture) et `statistiques.py backfill` relit aussi les archives.
+
+    python archives.py compacter [--age 90] [--simulation]     (cron quotidien)
+"""
+import argparse
+from datetime import datetime, timedelta
+
+import chariots
+import statistiques
+import stockage
+
+COLLECTION = "LOGS_ARCHIVES"
+INDEX = ("PARAMETRES", "archives_logs")
+TAILLE_PARTIE = 200
+AGE_DEFAUT = 90
+# Champs recalculables à partir de Details_Struct : pas recopiés dans l'archive
+CHAMPS_OMIS = ("Details_Complets", "Nb_Produits")
+
+
+def id_partie(mois, n):
+    return f"{mois}_{n:03d}"
+
+
+def _ref_index(db):
+    return db.collection(INDEX[0]).document(INDEX[1])
+
+
+def lire_index(db):
+    """{mois: {Parties, Nb, Derniere, Premier, Dernier}} ; Derniere = nombre de logs de la dernière partie."""
+    doc = _ref_index(db).get()
+    return dict((doc.to_dict() or {}).get("Mois", {})) if doc.exists else {}
+
+
+# --- COMPACTION ---
+def compacter(db, age_jours=AGE_DEFAUT, taille_page=500, simulation=False, maintenant=None):
+    """Déplace les logs remplacés antérieurs à maintenant - age_jours vers les archives mensuelles."""
+    limite = (maintenant or datetime.now()) - timedelta(days=age_jours)
+    index = lire_index(db)
+    ouvertes = {}  # mois -> contenu de la dernière partie, relue au plus une fois par exécution
+    rapport = {"logs": 0, "parties": 0, "mois": set(), "simulation": simulation}
+    q = (db.collection("LOGS").where("Statut", "==", "Remplacé").where("Date", "<", limite)
+         .order_by("Date", direction=stockage.DESCENDING).limit(taille_page))
+    curseur = None
+    while True:
+        # Hors simulation, les logs archivés disparaissent de la requête : on la relance depuis le début
+        docs = list((q if curseur is None else q.start_after(curseur)).stream())
+        if not docs:
+            break
+        par_mois = {}
+        for doc in docs:
+            log = doc.to_dict() or {}
+            par_mois.setdefault(f"{statistiques.naif(log['Date']):%Y-%m}", []).append((doc.reference, log))
+        for mois, logs in par_mois.items():
+            rapport["parties"] += _archiver_mois(db, index, ouvertes, mois, logs, simulation)
+            rapport["logs"] += len(logs)
+            rapport["mois"].add(mois)
+        if len(docs) < taille_page:
+            break
+        if simulation:
+            curseur = docs[-1]
+    rapport["mois"] = sorted(rapport["mois"])
+    return rapport
+
+
+def _archiver_mois(db, index, ouvertes, mois, logs, simulation):
+    etat = index.setdefault(mois, {"Parties": 0, "Nb": 0, "Derniere": 0})
+    commits = 0
+    while logs:
+        if etat["Parties"] and etat["Derniere"] < TAILLE_PARTIE:
+            n = etat["Parties"] - 1
+            if mois not in ouvertes:
+                doc = db.collection(COLLECTION).document(id_partie(mois, n)).get()
+                ouvertes[mois] = list((doc.to_dict() or {}).get("Logs", [])) if doc.exists else []
+            contenu = ouvertes[mois]
+        else:
+            n, contenu = etat["Parties"], []
+        lot, logs = logs[:TAILLE_PARTIE - len(contenu)], logs[TAILLE_PARTIE - len(contenu):]
+        contenu = contenu + [{**{k: v for k, v in log.items() if k not in CHAMPS_OMIS}, "id": ref.id} for ref, log in lot]
+        dates = [statistiques.naif(l["Date"]) for l in contenu]
+        etat.update({"Parties": n + 1, "Nb": etat["Nb"] + len(lot), "Derniere": len(contenu)})
+        etat["Premier"] = min([d for d in (statistiques.naif(etat.get("Premier")),) if d] + dates)
+        etat["Dernier"] = max([d for d in (statistiques.naif(etat.get("Dernier")),) if d] + dates)
+        ouvertes[mois] = contenu
+        if not simulation:
+            ops = [("set", db.collection(COLLECTION).document(id_partie(mois, n)),
+                    {"Mois": mois, "Partie": n, "Nb": len(contenu), "Logs": contenu})]
+            ops += [("delete", ref, None) for ref, _ in lot]
+            ops.append(("merge", _ref_index(db), {"Mois": {mois: dict(etat)}}))
+            # Partie, suppressions et index dans un seul batch (au plus TAILLE_PARTIE + 2 opérations)
+            stockage.ecrire_par_lots(db, ops, taille=len(ops))
+        commits += 1
+    return commits
+
+
+# --- LECTURE ---
+def lire_mois(db, mois, info):
+    """Logs archivés d'un mois, Date décroissante (un get_all de `Parties` documents)."""
+    refs = [db.collection(COLLECTION).document(id_partie(mois, n)) for n in range(int(info.get("Parties", 0)))]
+    logs = []
+    for doc in db.get_all(refs):
+        if doc.exists:
+            for l in (doc.to_dict() or {}).get("Logs", []):
+                logs.append({**l, "id_doc": l.get("id"), "archive": doc.id})
+    logs.sort(key=lambda l: statistiques.naif(l.get("Date")) or datetime.min, reverse=True)
+    return logs
+
+
+def parcourir(db, debut=None, fin=None):
+    """Tous les logs archivés (dicts), mois par mois dans l'ordre chronologique."""
+    for mois, info in sorted(lire_index(db).items()):
+        if (debut and statistiques.naif(info.get("Dernier")) < debut) or (fin and statistiques.naif(info.get("Premier")) >= fin):
+            continue
+        for log in reversed(lire_mois(db, mois, info)):
+            d = statistiques.naif(log.get("Date"))
+            if (debut is None or d >= debut) and (fin is None or d < fin):
+                yield log
+
+
+def _cle(log):
+    """Ordre de l'historique, comme la requête sur LOGS : Date, puis ID du log."""
+    return statistiques.naif(log.get("Date")) or datetime.min, str(log.get("id_doc") or "")
+
+
+def _retenu(log, curseur, debut, fin, utilisateur, ip, statut):
+    d = statistiques.naif(log.get("Date"))
+    return (d is not None and (curseur is None or _cle(log) < curseur) and (debut is None or d >= debut)
+            and (fin is None or d < fin) and (utilisateur is None or log.get("Utilisateur") == utilisateur)
+            and (ip is None or log.get("IP_Patient") == ip) and (statut is None or log.get("Statut") == statut))
+
+
+def completer_page(chauds, taille, index, lire, curseur=None, debut=None, fin=None, utilisateur=None, ip=None, statut=None):
+    """Fusionne une page de LOGS (Date décroissante) avec les archives qui s'y intercalent.
+
+    lire(mois) renvoie les logs archivés du mois (lire_mois, caché par l'appelant).
+    Les mois sont lus du plus récent au plus ancien et seulement tant qu'ils
+    peuvent encore entrer dans la page. Le curseur est le couple (Date, ID) du
+    dernier log de la page précédente. Renvoie (logs, curseur suivant ou None).
+    """
+    debut, fin = statistiques.naif(debut), statistiques.naif(fin)
+    if curseur is not None:
+        curseur = (statistiques.naif(curseur[0]), str(curseur[1]))
+    # Une page de LOGS pleine : les archives plus anciennes que son dernier log attendront la page suivante
+    plancher = statistiques.naif(chauds[-1].get("Date")) if len(chauds) >= taille else None
+    candidats = []
+    if statut != "Non remplacé":  # seuls des logs remplacés sont archivés
+        for mois, info in sorted(index.items(), reverse=True):
+            premier, dernier = statistiques.naif(info.get("Premier")), statistiques.naif(info.get("Dernier"))
+            if (curseur and premier > curseur[0]) or (fin and premier >= fin):
+                continue
+            if (debut and dernier < debut) or (plancher and dernier < plancher) or len(candidats) >= taille:
+                break
+            candidats += [l for l in lire(mois) if _retenu(l, curseur, debut, fin, utilisateur, ip, statut)]
+    vus = {l.get("id_doc") for l in chauds}
+    page = chauds + [l for l in candidats if l.get("id_doc") not in vus]
+    page.sort(key=_cle, reverse=True)
+    page = page[:taille]
+    return page, ((page[-1].get("Date"), page[-1].get("id_doc")) if len(page) == taille else None)
+
+
+def supprimer_log(db, archive_id, log_id):
+    """Retire un log d'une partie d'archive (suppression depuis l'historique), index du mois compris.
+
+    Derniere suit la dernière partie (la compaction suivante la complète au lieu
+    d'en ouvrir une nouvelle) ; si le log bornait le mois, Premier / Dernier sont
+    recalculés sur les autres parties.
+    """
+    def _transaction(transaction):
+        ref = db.collection(COLLECTION).document(archive_id)
+        ref_index = _ref_index(db)
+        docs = {d.reference.path: d for d in db.get_all([ref, ref_index], transaction=transaction)}
+        doc = docs.get(ref.path)
+        if doc is None or not doc.exists:
+            return
+        data = doc.to_dict() or {}
+        retires = [l for l in data.get("Logs", []) if l.get("id") == log_id]
+        if not retires:
+            return
+        logs = [l for l in data.get("Logs", []) if l.get("id") != log_id]
+        mois = data.get("Mois", archive_id.rsplit("_", 1)[0])
+        partie = int(data.get("Partie", archive_id.rsplit("_", 1)[-1]))
+        idx = docs.get(ref_index.path)
+        etat = ((idx.to_dict() or {}).get("Mois", {}) if idx is not None and idx.exists else {}).get(mois, {})
+        parties = int(etat.get("Parties", 0))
+
+        maj = {"Nb": db.increment(-len(retires))}
+        if partie == parties - 1:
+            maj["Derniere"] = len(logs)
+        bornes = {statistiques.naif(etat.get("Premier")), statistiques.naif(etat.get("Dernier"))}
+        if any(statistiques.naif(l.get("Date")) in bornes for l in retires):
+            autres = [db.collection(COLLECTION).document(id_partie(mois, n)) for n in range(parties) if n != partie]
+            restants = logs + [l for d in db.get_all(autres, transaction=transaction) if d.exists
+                               for l in (d.to_dict() or {}).get("Logs", [])]
+            dates = [d for d in (statistiques.naif(l.get("Date")) for l in restants) if d]
+            if dates:
+                maj["Premier"], maj["Dernier"] = min(dates), max(dates)
+        transaction.update(ref, {"Logs": logs, "Nb": len(logs)})
+        transaction.set(ref_index, {"Mois": {mois: maj}}, merge=True)
+    db.executer_transaction(_transaction)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("commande", choices=["compacter"])
+    parser.add_argument("--backend", choices=["firestore", "memoire"], default=None)
+    parser.add_argument("--age", type=int, default=AGE_DEFAUT, help="jours avant archivage d'un log remplacé")
+    parser.add_argument("--page", type=int, default=500, help="logs lus par requête")
+    parser.add_argument("--simulation", action="store_true", help="compte sans écrire")
+    parser.add_argument("--chariot", default=chariots.DEFAUT, help="id du chariot, ou « tous »")
+    args = parser.parse_args(argv)
+    db = stockage.connecter(args.backend)
+    for dbc in chariots.vues(db, args.chariot):
+        r = compacter(dbc, args.age, args.page, args.simulation)
+        print(f"[{dbc.chariot_id}] {r['logs']} logs {'à archiver' if r['simulation'] else 'archivés'} en {r['parties']} écritures de parties "
+              f"({', '.join(r['mois']) or 'aucun mois'}).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,686 @@
+"""Banc de mesure du chariot sur le backend mémoire (stockage.MemoireStockage).
+
+Chaque page (Consommation, Remplacer, Historique, Checkliste) est exécutée via
+streamlit.testing.v1.AppTest pour plusieurs tailles d'inventaire ; on relève
+les lectures / écritures de documents et le temps mur par rerun.
+
+Le scénario `panier` mesure la transaction de validation rejouée par le journal
+(appliquer_consommation) : allers-retours et latence selon la taille du panier
+(objectif : une seule lecture groupée), puis validations concurrentes sur le
+même article (aucun décrément perdu), puis une coupure réseau : les validations
+sont confirmées tout de suite, synchronisées au retour du réseau, et un rejeu
+des mêmes clés ne décrémente pas une seconde fois.
+
+Le scénario `clic` mesure, avec une latence réseau simulée, le temps entre un
+clic d'enregistrement et la fin du rendu, comparé à un simple rerun de la
+même page : l'écriture part en arrière-plan, le rendu n'attend plus le réseau.
+Le délai jusqu'à la synchronisation effective est rapporté à part.
+
+Le scénario `recherche` mesure la construction de l'index de recherche et le
+temps par requête (objectif : sous la milliseconde à 10k articles).
+
+Le scénario `snapshot` compare, par rerun, l'ancien chemin (copie picklée du
+DataFrame par st.cache_data, six filtres par tiroir, iterrows) au snapshot
+partagé, et rapporte l'empreinte mémoire des deux représentations.
+
+Le scénario `demarrage` lance des processus neufs et mesure le premier rendu
+de la page de login (pandas, fpdf et firebase_admin ne doivent pas encore
+être chargés), la connexion jusqu'à la première page, et le coût d'import de
+chaque module lourd.
+
+Le scénario `peremption` compare la recherche des lots qui périment dans les
+30 jours (globale et par tiroir) par l'index trié du snapshot à un parcours de
+tous les articles, et rapporte le surcoût de construction de l'index.
+
+Le scénario `repliques` simule N répliques Streamlit (réplique d'inventaire,
+logs ouverts, première page d'historique, cache local par version) sur une même
+base, sans puis avec le tier partagé de cache.py : lectures Firestore totales,
+et nombre de répliques qui voient une écriture faite sur la première.
+
+Usage : python bench.py [pages|panier|clic|recherche|snapshot|demarrage|peremption|repliques] [--tailles 100 1000 10000] [--reruns 3] [--json]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault("CHARIOT_BACKEND", "memoire")
+
+import streamlit as st
+from streamlit.logger import set_log_level
+from streamlit.testing.v1 import AppTest
+
+import journal
+import stockage
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chariot.py")
+TIROIRS = ["Dessus", "Tiroir 1", "Tiroir 2", "Tiroir 3", "Tiroir 4", "Tiroir 5"]
+PRODUITS = ["Adrénaline", "Atropine", "Amiodarone", "Sérum physiologique", "Glucosé 10%",
+            "Seringue 5ml", "Cathéter 22G", "Sonde d'intubation", "Lame laryngo", "Compresses"]
+TIMEOUT = 600
+
+
+# --- JEU DE DONNÉES ---
+def peupler(db, n_items, n_logs_ouverts=20, n_logs_remplaces=100, n_checklists=5, graine=42, avec_lots=False):
+    """Remplit le backend mémoire avec un jeu de données reproductible."""
+    rnd = random.Random(graine)
+    db.vider()
+    items = {}
+    for i in range(n_items):
+        dotation = rnd.randint(1, 10)
+        items[f"ART{i:05d}"] = {
+            "Nom": f"{PRODUITS[i % len(PRODUITS)]} {i}",
+            "Tiroir": TIROIRS[i % len(TIROIRS)],
+            "Dotation": dotation,
+            "Stock_Actuel": rnd.randint(0, dotation),
+        }
+    if avec_lots:
+        # Générateur à part : le reste du jeu de données ne change pas
+        rnd_lots = random.Random(graine + 1)
+        for i, item in enumerate(items.values()):
+            reste, lots = item["Stock_Actuel"], []
+            while reste:
+                q = rnd_lots.randint(1, reste)
+                jour = datetime.now().date() + timedelta(days=rnd_lots.randint(-10, 720))
+                lots.append({"Lot": f"L{i}-{len(lots)}", "Peremption": jour.isoformat(), "Qte": q})
+                reste -= q
+            item["Lots"] = sorted(lots, key=lambda l: (l["Peremption"], l["Lot"]))  # forme écrite par lots.normaliser
+    db.charger("INVENTAIRE", items)
+
+    ids = list(items)
+    debut = datetime.now() - timedelta(days=30)
+    logs = {}
+    for n in range(n_logs_ouverts + n_logs_remplaces):
+        details = []
+        for item_id in rnd.sample(ids, min(len(ids), rnd.randint(1, 4))):
+            details.append({"ID": item_id, "Nom": items[item_id]["Nom"], "Qte": 1,
+                            "Tiroir": items[item_id]["Tiroir"], "EstRemplace": n >= n_logs_ouverts})
+        logs[f"LOG{n:06d}"] = {
+            "Date": debut + timedelta(minutes=17 * n), "Utilisateur": "Bench", "IP_Patient": f"IP{n}",
+            "Action": "Consommation", "Details_Complets": [f"{d['Qte']}x {d['Nom']}" for d in details],
+            "Details_Struct": details, "Nb_Produits": len(details),
+            "Statut": "Non remplacé" if n < n_logs_ouverts else "Remplacé",
+            "Historique_Remplacements": [],
+        }
+    db.charger("LOGS", logs)
+
+    contenu = [{"Nom": d["Nom"], "Tiroir": d["Tiroir"], "Dotation": d["Dotation"]} for d in items.values()]
+    db.charger("CHECKLISTS", {f"CHK{n:03d}": {"Date": debut + timedelta(days=n), "Utilisateur": "Bench",
+                                               "Statut": "Validé", "Contenu": contenu}
+                              for n in range(n_checklists)})
+    db.charger("UTILISATEURS", {"admin": {"password": "admin", "prenom": "Admin", "role": "Admin"}})
+    db.reinitialiser_stats()
+    return items
+
+
+# --- EXÉCUTION ---
+def nouvelle_session(page):
+    at = AppTest.from_file(SCRIPT, default_timeout=TIMEOUT)
+    at.session_state["logged_in"] = True
+    at.session_state["user"] = "Bench"
+    at.session_state["user_id"] = "admin"
+    at.session_state["role"] = "Admin"
+    at.session_state["nav"] = page
+    return at
+
+
+def mesurer(db, action):
+    """Exécute action() et renvoie le coût (lectures, écritures, temps) du rerun."""
+    db.reinitialiser_stats()
+    t0 = time.perf_counter()
+    at = action()
+    duree = time.perf_counter() - t0
+    if at is not None and at.exception:
+        raise RuntimeError(at.exception[0].message)
+    return {
+        "lectures": db.stats["lectures"],
+        "ecritures": db.stats["ecritures"] + db.stats["suppressions"],
+        "allers_retours": db.stats["allers_retours"],
+        "ms": round(duree * 1000, 1),
+    }
+
+
+def synchroniser(at=None):
+    """Attend que le journal local ait poussé ses écritures vers la base."""
+    journal.partage(os.environ.get("CHARIOT_JOURNAL", ":memory:")).attendre(TIMEOUT)
+    return at
+
+
+def bouton(at, label):
+    return next(b for b in at.button if b.label == label)
+
+
+def scenario_page(db, page, reruns):
+    """Premier affichage (cache vide) puis reruns à cache chaud."""
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    at = nouvelle_session(page)
+    resultats = {"froid": mesurer(db, at.run)}
+    chauds = [mesurer(db, at.run) for _ in range(reruns)]
+    resultats["chaud"] = {k: round(sum(c[k] for c in chauds) / len(chauds), 1) for k in chauds[0]}
+    return resultats, at
+
+
+def scenario_quantite(db, at, items):
+    """Saisie de quantités : seul le fragment du bandeau panier doit se relancer."""
+    choix = [i for i, d in items.items() if d["Stock_Actuel"] > 0][:3]
+    mesures = []
+    for item_id in choix:
+        at.number_input(key=f"input_{item_id}").set_value(1)
+        mesures.append(mesurer(db, at.run))
+        # AppTest ne garde que les éléments du fragment relancé : on resynchronise l'arbre
+        at.run()
+    return {k: round(sum(m[k] for m in mesures) / len(mesures), 1) for k in mesures[0]}
+
+
+def scenario_validation(db, at):
+    """Clic sur 🚀 ENREGISTRER avec le panier déjà rempli."""
+    next(t for t in at.text_input if t.label == "🏥 IP PATIENT").input("IP-BENCH").run()
+    return mesurer(db, lambda: synchroniser(bouton(at, "🚀 ENREGISTRER").click().run()))
+
+
+def scenario_remplacement(db, at):
+    """Remplacement d'une ligne du premier dossier ouvert."""
+    case = next(c for c in at.checkbox if c.key and c.key.startswith("c_"))
+    case.check()
+    return mesurer(db, lambda: synchroniser(bouton(at, "💾 Valider Remplacement").click().run()))
+
+
+def scenario_panier(tailles_panier=(1, 5, 20, 50), latence=0.02, n_threads=8, n_par_thread=25):
+    """Coût de la validation synchronisée, course entre postes, puis coupure réseau."""
+    import chariot
+    db = stockage.memoire_partagee()
+    items = peupler(db, max(tailles_panier) * 2)
+    db.latence = latence
+    rapport = {"latence_simulee_ms": latence * 1000, "tailles": {}}
+    try:
+        for taille in tailles_panier:
+            panier = {item_id: 1 for item_id in list(items)[:taille]}
+            charge = {"Panier": panier, "IP": "IP-BENCH", "Utilisateur": "Bench", "Date": datetime.now()}
+            res = mesurer(db, lambda: chariot.appliquer_consommation(journal.nouvelle_cle(), charge))
+            rapport["tailles"][taille] = res
+
+        # Concurrence : n_threads postes valident en boucle le même article
+        stock_initial = n_threads * n_par_thread
+        db.charger("INVENTAIRE", {"CIBLE": {"Nom": "Cible", "Tiroir": "Dessus",
+                                            "Dotation": stock_initial, "Stock_Actuel": stock_initial}})
+        db.reinitialiser_stats()
+        succes = []
+
+        def poste():
+            for _ in range(n_par_thread):
+                charge = {"Panier": {"CIBLE": 1}, "IP": "IP-CONC", "Utilisateur": "Bench", "Date": datetime.now()}
+                try:
+                    chariot.appliquer_consommation(journal.nouvelle_cle(), charge)
+                    succes.append(True)
+                except Exception:
+                    succes.append(False)
+
+        threads = [threading.Thread(target=poste) for _ in range(n_threads)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        stock_final = db.collection("INVENTAIRE").document("CIBLE").get().to_dict()["Stock_Actuel"]
+        n_ok = sum(succes)
+        rapport["concurrence"] = {
+            "validations": len(succes), "reussies": n_ok, "conflits_rejoues": db.stats["conflits"],
+            "stock_initial": stock_initial, "stock_final": stock_final,
+            "decrements_perdus": (stock_initial - n_ok) - stock_final,
+        }
+        rapport["coupure"] = scenario_coupure(db, chariot)
+    finally:
+        db.latence = 0.0
+        db.panne = False
+    return rapport
+
+
+def scenario_coupure(db, chariot, n_validations=5):
+    """Validations pendant une panne réseau, puis rejeu des mêmes clés après synchronisation."""
+    db.charger("INVENTAIRE", {"COUPURE": {"Nom": "Coupure", "Tiroir": "Dessus", "Dotation": 100, "Stock_Actuel": 100}})
+    j = chariot.get_journal()
+    db.panne = True
+    t0 = time.perf_counter()
+    cles = [journal.nouvelle_cle() for _ in range(n_validations)]
+    confirmees = sum(chariot.valider_panier({"COUPURE": 1}, "IP-COUPURE", "Bench", cle) for cle in cles)
+    confirmation_ms = (time.perf_counter() - t0) / n_validations * 1000
+    time.sleep(0.2)
+    en_attente = j.en_attente()
+    db.panne = False
+    t0 = time.perf_counter()
+    synchronise = j.attendre(TIMEOUT)
+    delai_synchro = time.perf_counter() - t0
+    stock = db.collection("INVENTAIRE").document("COUPURE").get().to_dict()["Stock_Actuel"]
+    # Rejeu des mêmes clés (accusés de réception perdus) : ne doit rien changer
+    for cle in cles:
+        chariot.valider_panier({"COUPURE": 1}, "IP-COUPURE", "Bench", cle)
+        chariot.appliquer_consommation(cle, {"Panier": {"COUPURE": 1}, "IP": "IP-COUPURE",
+                                             "Utilisateur": "Bench", "Date": datetime.now()})
+    j.attendre(TIMEOUT)
+    stock_rejeu = db.collection("INVENTAIRE").document("COUPURE").get().to_dict()["Stock_Actuel"]
+    return {
+        "validations": n_validations, "confirmees": confirmees, "confirmation_ms": round(confirmation_ms, 2),
+        "en_attente_pendant_panne": en_attente, "synchronise": synchronise,
+        "synchro_s": round(delai_synchro, 2), "stock_apres_synchro": stock, "stock_apres_rejeu": stock_rejeu,
+    }
+
+
+def scenario_clic(tailles, latence=0.05, reruns=3):
+    """Clic -> rendu (écriture en arrière-plan) comparé à un rerun sans écriture."""
+    db = stockage.memoire_partagee()
+    rapport = {"latence_simulee_ms": latence * 1000, "tailles": {}}
+    for n in tailles:
+        items = peupler(db, n)
+        res = rapport["tailles"][n] = {}
+        try:
+            at = nouvelle_session("Consommation")
+            at.run()
+            db.latence = latence
+            res["Consommation"] = _clic(db, at, reruns, lambda: _remplir_panier(at, items), "🚀 ENREGISTRER")
+            db.latence = 0.0
+            st.cache_data.clear()
+            at = nouvelle_session("Remplacer")
+            at.run()
+            db.latence = latence
+
+            def cocher():
+                next(c for c in at.checkbox if c.key and c.key.startswith("c_")).check()
+            res["Remplacer"] = _clic(db, at, reruns, cocher, "💾 Valider Remplacement")
+            at.session_state["mode_rempl"] = "Tout remplacer"
+            at.run()
+            res["Tout remplacer"] = _clic(db, at, reruns, lambda: None, "✅ Tout remplacer", attente=_attendre_executeur)
+        finally:
+            db.latence = 0.0
+    return rapport
+
+
+def _remplir_panier(at, items):
+    item_id = next(i for i, d in items.items() if at.session_state["panier"].get(i) is None and d["Stock_Actuel"] > 0)
+    at.number_input(key=f"input_{item_id}").set_value(1).run()
+    at.run()
+    next(t for t in at.text_input if t.label == "🏥 IP PATIENT").input("IP-CLIC").run()
+
+
+def _attendre_executeur():
+    # Le remplacement global passe par le pool de threads, pas par le journal
+    fin = time.monotonic() + TIMEOUT
+    while stockage.memoire_partagee().collection("LOGS").where("Statut", "==", "Non remplacé").limit(1).get():
+        if time.monotonic() > fin: break
+        time.sleep(0.01)
+
+
+def _clic(db, at, reruns, preparer, libelle, attente=None):
+    rendus = []
+    for _ in range(reruns):
+        t0 = time.perf_counter()
+        at.run()
+        rendus.append(time.perf_counter() - t0)
+    preparer()
+    t0 = time.perf_counter()
+    at = bouton(at, libelle).click().run()
+    clic = time.perf_counter() - t0
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    (attente or synchroniser)()
+    synchro = time.perf_counter() - t0
+    return {"rendu_ms": round(sum(rendus) / len(rendus) * 1000, 1), "clic_ms": round(clic * 1000, 1),
+            "synchro_ms": round(synchro * 1000, 1)}
+
+
+def afficher_clic(rapport):
+    print(f"Latence simulée par aller-retour : {rapport['latence_simulee_ms']} ms")
+    print(f"{'Articles':>8} | {'Action':<16} | {'Rerun seul':>10} | {'Clic->rendu':>11} | {'Synchronisé':>11}")
+    print("-" * 68)
+    for n, res in rapport["tailles"].items():
+        for nom, m in res.items():
+            print(f"{n:>8} | {nom:<16} | {m['rendu_ms']:>10} | {m['clic_ms']:>11} | {m['synchro_ms']:>11}")
+
+
+REQUETES = ["adre", "serum physio", "SÉRUM", "cathe 22", "amidarone", "sonde intub", "zzz"]
+
+
+def scenario_recherche(tailles, repetitions=200):
+    """Construction de l'index puis temps moyen par requête (accents, préfixes, fautes)."""
+    import recherche
+    rapport = {}
+    for n in tailles:
+        items = [dict(d, ID=i) for i, d in peupler(stockage.MemoireStockage(), n).items()]
+        t0 = time.perf_counter()
+        index = recherche.IndexRecherche(items)
+        construction = time.perf_counter() - t0
+        requetes = {}
+        for q in REQUETES:
+            t0 = time.perf_counter()
+            for _ in range(repetitions):
+                res = index.chercher(q, limite=100)
+            requetes[q] = {"resultats": len(res), "ms": round((time.perf_counter() - t0) / repetitions * 1000, 3)}
+        rapport[n] = {"construction_ms": round(construction * 1000, 1), "requetes": requetes}
+    return rapport
+
+
+def scenario_snapshot(tailles, repetitions=20):
+    """Coût par rerun et mémoire : DataFrame copié à chaque appel vs snapshot partagé."""
+    import pickle
+    import pandas as pd
+    import inventaire
+    rapport = {}
+    for n in tailles:
+        items = peupler(stockage.MemoireStockage(), n)
+        df = pd.DataFrame([dict(d, ID=i) for i, d in items.items()])
+        blob = pickle.dumps(df)
+
+        def ancien():
+            # st.cache_data : unpickle d'une copie par appel, puis filtre par tiroir
+            copie = pickle.loads(blob)
+            for t in TIROIRS:
+                for _, r in copie[copie['Tiroir'] == t].iterrows():
+                    r['ID']
+
+        snap = inventaire.SnapshotInventaire(df)
+
+        def nouveau():
+            for t in snap.tiroirs:
+                for r in snap.lignes_tiroir(t):
+                    r['ID']
+
+        res = {}
+        for nom, fn in (("ancien", ancien), ("snapshot", nouveau)):
+            t0 = time.perf_counter()
+            for _ in range(repetitions):
+                fn()
+            res[nom] = round((time.perf_counter() - t0) / repetitions * 1000, 2)
+        rapport[n] = {
+            "ms_par_rerun": res,
+            "memoire_ko": {
+                "dataframe_brut": round(df.memory_usage(deep=True).sum() / 1024, 1),
+                "copie_par_rerun_ancien": round(len(blob) / 1024, 1),
+                "snapshot_dataframe": round(snap.memoire()["dataframe"] / 1024, 1),
+                "snapshot_total_partage": round(snap.memoire()["total"] / 1024, 1),
+            },
+        }
+    return rapport
+
+
+def scenario_peremption(tailles, repetitions=200, jours=30):
+    """Lots périmant dans `jours` jours : index trié du snapshot vs parcours de tous les articles."""
+    import pandas as pd
+    import inventaire
+    import lots
+    rapport = {}
+    limite = (datetime.now() + timedelta(days=jours)).date().isoformat()
+    for n in tailles:
+        items = peupler(stockage.MemoireStockage(), n, avec_lots=True)
+        df = pd.DataFrame([dict(d, ID=i) for i, d in items.items()])
+        t0 = time.perf_counter()
+        sans = inventaire.SnapshotInventaire(df.drop(columns=["Lots"]))
+        construction_sans = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        snap = inventaire.SnapshotInventaire(df)
+        construction = time.perf_counter() - t0
+        # Sans lots, l'index est vide : aucun article ne périme
+        assert not sans.peremptions(limite)
+
+        def parcours():
+            res = [l for r in snap.lignes for l in lots.normaliser(r.get('Lots')) if l["Peremption"] <= limite]
+            badges = {t: sum(1 for r in snap.lignes_tiroir(t) for l in lots.normaliser(r.get('Lots')) if l["Peremption"] <= limite)
+                      for t in snap.tiroirs}
+            return len(res), badges
+
+        def index():
+            badges = {t: snap.peremptions_tiroir(t, limite) for t in snap.tiroirs}
+            return len(snap.peremptions(limite)), badges
+
+        assert parcours() == index()
+        res = {}
+        for nom, fn in (("parcours", parcours), ("index", index)):
+            t0 = time.perf_counter()
+            for _ in range(repetitions):
+                fn()
+            res[nom] = round((time.perf_counter() - t0) / repetitions * 1000, 3)
+        rapport[n] = {"lots": len(snap._lots), "perimant": index()[0], "ms_par_rerun": res,
+                      "construction_ms": {"sans_lots": round(construction_sans * 1000, 1), "avec_index": round(construction * 1000, 1)}}
+    return rapport
+
+
+def afficher_peremption(rapport):
+    print(f"{'Articles':>8} | {'Lots':>6} | {'< 30 j':>6} | {'Parcours ms':>11} | {'Index ms':>9} | {'Snapshot ms (sans / avec lots)':>30}")
+    print("-" * 86)
+    for n, m in rapport.items():
+        c = m["construction_ms"]
+        print(f"{n:>8} | {m['lots']:>6} | {m['perimant']:>6} | {m['ms_par_rerun']['parcours']:>11} | "
+              f"{m['ms_par_rerun']['index']:>9} | {c['sans_lots']:>14} / {c['avec_index']:<13}")
+
+
+def scenario_repliques(tailles_groupe=(1, 2, 4, 8), n_items=1000, n_ecritures=3):
+    """Lectures de N répliques (inventaire + logs ouverts + historique), cache par processus vs tier partagé."""
+    import cache
+    import inventaire
+    cache.FRAICHEUR = 0.05  # propagation rapide pour le banc (2 s en production)
+    rapport = {}
+    for mode in ("processus", "partage"):
+        rapport[mode] = {}
+        for n in tailles_groupe:
+            db = stockage.MemoireStockage()
+            peupler(db, n_items, n_logs_ouverts=20, n_logs_remplaces=100, n_checklists=0)
+            tier = cache.TierRedis(cache.RedisLocal()) if mode == "partage" else None
+            db.reinitialiser_stats()
+            repliques = []
+            for _ in range(n):
+                r = inventaire.ReplicaPartagee(db, "INVENTAIRE", tier, "principal") if tier else inventaire.ReplicaInventaire(db)
+                r.SONDAGE = 0.05
+                r.demarrer()
+                repliques.append({"inventaire": r, "versions": cache.VersionsChariots(tier).chariot("principal"), "local": {}})
+
+            def ouverts():
+                q = db.collection("LOGS").where("Statut", "==", "Non remplacé").order_by("Date", direction=stockage.DESCENDING)
+                return [d.id for d in q.stream()]
+
+            def historique():
+                return [d.id for d in db.collection("LOGS").order_by("Date", direction=stockage.DESCENDING).limit(50).stream()]
+
+            def lire(rep):
+                # Comme chariot.py : cache local par version, puis tier partagé sous la même clé versionnée
+                vus = {}
+                for portee, calcul in ((cache.LOGS_OUVERTS, ouverts), (cache.LOGS_HISTORIQUE, historique)):
+                    cle = (portee, rep["versions"].version(portee))
+                    if cle not in rep["local"]:
+                        rep["local"][cle] = tier.obtenir(f"principal/{cle}", calcul) if tier else calcul()
+                    vus[portee] = rep["local"][cle]
+                return vus
+
+            for rep in repliques:
+                lire(rep)
+            a_jour = []
+            for k in range(n_ecritures):
+                log_id = f"NOUVEAU{k}"
+                db.collection("LOGS").document(log_id).set({"Date": datetime.now(), "Statut": "Non remplacé", "Utilisateur": "Bench"})
+                db.collection("INVENTAIRE").document("ART00000").update({"Stock_Actuel": k})
+                repliques[0]["versions"].invalider(cache.LOGS_OUVERTS, cache.LOGS_HISTORIQUE, cache.INVENTAIRE)
+                time.sleep(0.3)
+                a_jour.append(sum(log_id in lire(rep)[cache.LOGS_OUVERTS]
+                                  and rep["inventaire"].snapshot().ligne("ART00000")["Stock_Actuel"] == k for rep in repliques))
+            for rep in repliques:
+                rep["inventaire"].arreter()
+            rapport[mode][n] = {"lectures": int(db.stats.get("lectures", 0)), "a_jour": min(a_jour)}
+    return rapport
+
+
+def afficher_repliques(rapport):
+    print(f"{'Répliques':>9} | {'Lectures (processus)':>20} | {'À jour':>6} | {'Lectures (partagé)':>18} | {'À jour':>6}")
+    print("-" * 72)
+    for n in rapport["processus"]:
+        a, b = rapport["processus"][n], rapport["partage"][n]
+        print(f"{n:>9} | {a['lectures']:>20} | {a['a_jour']:>3}/{n:<2} | {b['lectures']:>18} | {b['a_jour']:>3}/{n:<2}")
+
+
+# Exécuté dans un processus neuf : rien n'est encore importé ni en cache
+_SONDE_DEMARRAGE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+from streamlit.logger import set_log_level
+from streamlit.testing.v1 import AppTest
+set_log_level("error")
+import stockage
+stockage.memoire_partagee().charger("UTILISATEURS", {"admin": {"password": "admin", "prenom": "Admin", "role": "Admin"}})
+t1 = time.perf_counter()
+at = AppTest.from_file(sys.argv[1], default_timeout=600).run()
+t2 = time.perf_counter()
+lourds = [m for m in ("pandas", "fpdf", "firebase_admin") if m in sys.modules]
+time.sleep(float(sys.argv[2]))  # saisie de l'identifiant et du mot de passe
+at.text_input[0].input("admin")
+at.text_input[1].input("admin")
+t_clic = time.perf_counter()
+at = next(b for b in at.button if b.label == "SE CONNECTER").click().run()
+t3 = time.perf_counter()
+print(json.dumps({"streamlit_ms": (t1 - t0) * 1000, "premier_rendu_ms": (t2 - t1) * 1000, "connexion_ms": (t3 - t_clic) * 1000,
+                  "modules_au_login": lourds, "connecte": bool(at.session_state["logged_in"])}))
+"""
+
+_SONDE_IMPORT = "import time; t = time.perf_counter(); import {module}; print((time.perf_counter() - t) * 1000)"
+
+
+def _processus(code, *args):
+    sortie = subprocess.run([sys.executable, "-c", code, *args], capture_output=True, text=True, timeout=TIMEOUT,
+                            cwd=os.path.dirname(SCRIPT), env={**os.environ, "CHARIOT_BACKEND": "memoire"})
+    if sortie.returncode != 0:
+        raise RuntimeError(sortie.stderr.strip().splitlines()[-1] if sortie.stderr.strip() else "échec")
+    return sortie.stdout.strip().splitlines()[-1]
+
+
+def scenario_demarrage(repetitions=3, saisie=2.0):
+    """Démarrage à froid (processus neuf) : premier rendu de la page de login, puis connexion
+    après `saisie` secondes de frappe.
+
+    Médianes sur `repetitions` processus ; le coût d'import des modules lourds est
+    mesuré à part, chacun dans son propre processus.
+    """
+    essais = [json.loads(_processus(_SONDE_DEMARRAGE, SCRIPT, str(saisie))) for _ in range(repetitions)]
+    rapport = {cle: round(statistics.median(e[cle] for e in essais), 1)
+               for cle in ("streamlit_ms", "premier_rendu_ms", "connexion_ms")}
+    rapport["modules_au_login"] = essais[-1]["modules_au_login"]
+    rapport["connecte"] = all(e["connecte"] for e in essais)
+    rapport["saisie_s"] = saisie
+    rapport["imports_ms"] = {m: round(statistics.median(float(_processus(_SONDE_IMPORT.format(module=m)))
+                                                          for _ in range(repetitions)), 1)
+                             for m in ("pandas", "fpdf", "firebase_admin.firestore")}
+    return rapport
+
+
+def afficher_demarrage(rapport):
+    print(f"Import streamlit + AppTest : {rapport['streamlit_ms']} ms")
+    print(f"Premier rendu (page de login) : {rapport['premier_rendu_ms']} ms ; "
+          f"modules lourds déjà chargés : {', '.join(rapport['modules_au_login']) or 'aucun'}")
+    print(f"Connexion (après {rapport['saisie_s']} s de saisie) jusqu'au rendu de la première page : {rapport['connexion_ms']} ms"
+          + ("" if rapport["connecte"] else " (ÉCHEC de connexion)"))
+    print("Coût d'import, processus neuf : " + ", ".join(f"{m} {ms} ms" for m, ms in rapport["imports_ms"].items()))
+
+
+def afficher_snapshot(rapport):
+    for n, r in rapport.items():
+        ms, mem = r["ms_par_rerun"], r["memoire_ko"]
+        print(f"{n} articles : {ms['ancien']} ms/rerun -> {ms['snapshot']} ms/rerun")
+        print(f"    DataFrame brut {mem['dataframe_brut']} Ko (copié à chaque rerun : "
+              f"{mem['copie_par_rerun_ancien']} Ko picklés) ; snapshot {mem['snapshot_dataframe']} Ko, "
+              f"{mem['snapshot_total_partage']} Ko avec les lignes, une fois par processus")
+
+
+def afficher_recherche(rapport):
+    for n, r in rapport.items():
+        print(f"{n} articles : index construit en {r['construction_ms']} ms")
+        for q, m in r["requetes"].items():
+            print(f"    {q!r:<16} {m['resultats']:>5} résultats  {m['ms']:>8} ms")
+
+
+def afficher_panier(rapport):
+    print(f"Latence simulée par aller-retour : {rapport['latence_simulee_ms']} ms")
+    print(f"{'Lignes':>6} | {'Lectures':>8} | {'Écritures':>9} | {'A/R':>5} | {'ms':>9}")
+    print("-" * 48)
+    for taille, m in rapport["tailles"].items():
+        print(f"{taille:>6} | {m['lectures']:>8} | {m['ecritures']:>9} | {m['allers_retours']:>5} | {m['ms']:>9}")
+    c = rapport["concurrence"]
+    print(f"\nConcurrence : {c['reussies']}/{c['validations']} validations, {c['conflits_rejoues']} conflits rejoués, "
+          f"stock {c['stock_initial']} -> {c['stock_final']}, décréments perdus : {c['decrements_perdus']}")
+    c = rapport["coupure"]
+    print(f"Coupure réseau : {c['confirmees']}/{c['validations']} confirmées en {c['confirmation_ms']} ms, "
+          f"{c['en_attente_pendant_panne']} en attente, synchronisées en {c['synchro_s']} s ; "
+          f"stock 100 -> {c['stock_apres_synchro']} (après rejeu des clés : {c['stock_apres_rejeu']})")
+
+
+def scenario_remplacement_global(db):
+    """Vue « Tout remplacer » : un clic pour tous les dossiers ouverts."""
+    st.cache_data.clear()
+    at = nouvelle_session("Remplacer")
+    at.session_state["mode_rempl"] = "Tout remplacer"
+    at.run()
+    return mesurer(db, bouton(at, "✅ Tout remplacer").click().run)
+
+
+def executer(tailles, reruns):
+    db = stockage.memoire_partagee()
+    rapport = {}
+    for n in tailles:
+        res = rapport[n] = {}
+        items = peupler(db, n)
+        res["Consommation"], at = scenario_page(db, "Consommation", reruns)
+        res["Consommation + quantité"] = scenario_quantite(db, at, items)
+        res["Consommation + validation"] = scenario_validation(db, at)
+        peupler(db, n)
+        res["Remplacer"], at = scenario_page(db, "Remplacer", reruns)
+        res["Remplacer + validation"] = scenario_remplacement(db, at)
+        peupler(db, n)
+        res["Remplacer tout"] = scenario_remplacement_global(db)
+        res["Historique"], _ = scenario_page(db, "Historique", reruns)
+        # La checkliste est bloquée tant qu'il reste des consommations non remplacées
+        peupler(db, n, n_logs_ouverts=0)
+        res["Checkliste"], _ = scenario_page(db, "Checkliste", reruns)
+    return rapport
+
+
+def afficher(rapport):
+    print(f"{'Articles':>8} | {'Scénario':<26} | {'Lectures':>8} | {'Écritures':>9} | {'A/R':>5} | {'ms':>9}")
+    print("-" * 80)
+    for n, res in rapport.items():
+        for nom, r in res.items():
+            lignes = [(nom + " (froid)", r["froid"]), (nom + " (chaud)", r["chaud"])] if "froid" in r else [(nom, r)]
+            for libelle, m in lignes:
+                print(f"{n:>8} | {libelle:<26} | {m['lectures']:>8} | {m['ecritures']:>9} | "
+                      f"{m['allers_retours']:>5} | {m['ms']:>9}")
+
+
+def main(argv=None):
+    set_log_level("error")
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenario", nargs="?", choices=["pages", "panier", "clic", "recherche", "snapshot", "demarrage", "peremption", "repliques"], default="pages")
+    parser.add_argument("--tailles", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--reruns", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="sortie JSON (pour comparer deux versions)")
+    args = parser.parse_args(argv)
+    if args.scenario == "panier":
+        rapport, affichage = scenario_panier(), afficher_panier
+    elif args.scenario == "clic":
+        rapport, affichage = scenario_clic(args.tailles), afficher_clic
+    elif args.scenario == "snapshot":
+        rapport, affichage = scenario_snapshot(args.tailles), afficher_snapshot
+    elif args.scenario == "demarrage":
+        rapport, affichage = scenario_demarrage(args.reruns), afficher_demarrage
+    elif args.scenario == "repliques":
+        rapport, affichage = scenario_repliques(), afficher_repliques
+    elif args.scenario == "peremption":
+        rapport, affichage = scenario_peremption(args.tailles), afficher_peremption
+    elif args.scenario == "recherche":
+        rapport, affichage = scenario_recherche(args.tailles), afficher_recherche
+    else:
+        rapport, affichage = executer(args.tailles, args.reruns), afficher
+    if args.json:
+        json.dump(rapport, sys.stdout, indent=2)
+        print()
+    else:
+        affichage(rapport)
+
+
+if __name__ == "__main__":
+    main()
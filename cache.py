@@ -0,0 +1,317 @@
+"""Versions de cache par collection.
+
+Chaque fonction cachée de chariot.py reçoit la version courante de la
+collection qu'elle lit ; une écriture n'incrémente que les versions qu'elle
+touche, les autres entrées de cache restent valides. Les versions sont tenues
+par chariot : une écriture sur un chariot ne vide pas les caches des autres.
+
+Avec plusieurs répliques Streamlit derrière un répartiteur, un tier partagé
+(CHARIOT_CACHE_PARTAGE) porte les versions et les valeurs lues en base :
+  - sqlite:///chemin.db : fichier SQLite (WAL) commun aux répliques d'un hôte ;
+  - redis://hote:6379/0 : serveur Redis (paquet `redis`, chargé à la demande) ;
+  - memoire : Redis local du processus (RedisLocal), pour les essais.
+Une invalidation incrémente la version dans le tier : les autres répliques la
+voient au plus FRAICHEUR secondes plus tard. Les valeurs sont rangées sous des
+clés versionnées, calculées par une seule réplique (verrou à durée limitée) et
+relues par les autres.
+"""
+import pickle
+import sqlite3
+import threading
+import time
+
+# Portées de cache : une par collection (LOGS est coupée en deux vues)
+INVENTAIRE = "INVENTAIRE"
+LOGS_OUVERTS = "LOGS_OUVERTS"
+LOGS_HISTORIQUE = "LOGS_HISTORIQUE"
+CHECKLISTS = "CHECKLISTS"
+STATS = "STATS"
+ARCHIVES = "ARCHIVES"
+PORTEES = (INVENTAIRE, LOGS_OUVERTS, LOGS_HISTORIQUE, CHECKLISTS, STATS, ARCHIVES)
+
+FRAICHEUR = 2.0      # s : une réplique relit les versions partagées au plus toutes les 2 s
+ATTENTE_CALCUL = 5.0  # s : délai maximal d'attente d'une valeur calculée par une autre réplique
+
+
+class VersionsCache:
+    """Compteurs de version en mémoire du processus."""
+
+    def __init__(self):
+        self._versions = dict.fromkeys(PORTEES, 0)
+        self._verrou = threading.Lock()
+
+    def version(self, portee):
+        with self._verrou:
+            return self._versions.get(portee, 0)
+
+    def invalider(self, *portees):
+        with self._verrou:
+            for p in portees:
+                self._versions[p] = self._versions.get(p, 0) + 1
+
+    def tout_invalider(self):
+        self.invalider(*PORTEES)
+
+
+class VersionsPartagees:
+    """Même interface que VersionsCache, compteurs tenus dans le tier partagé."""
+
+    def __init__(self, tier, espace):
+        self.tier = tier
+        self.espace = espace
+        self._lues = {}
+        self._verrou = threading.Lock()
+
+    def _cle(self, portee):
+        return f"{self.espace}/version/{portee}"
+
+    def version(self, portee):
+        maintenant = time.monotonic()
+        with self._verrou:
+            lue = self._lues.get(portee)
+            if lue and maintenant - lue[1] < FRAICHEUR:
+                return lue[0]
+        try:
+            v = self.tier.version(self._cle(portee))
+        except Exception as e:
+            print("Erreur tier partagé (version):", e)
+            return lue[0] if lue else 0
+        with self._verrou:
+            self._lues[portee] = (v, maintenant)
+        return v
+
+    def invalider(self, *portees):
+        for p in portees:
+            try:
+                v = self.tier.incrementer(self._cle(p))
+            except Exception as e:
+                print("Erreur tier partagé (invalidation):", e)
+                continue
+            with self._verrou:
+                self._lues[p] = (v, time.monotonic())
+
+    def tout_invalider(self):
+        self.invalider(*PORTEES)
+
+
+class VersionsChariots:
+    """Un VersionsCache par chariot, créé au premier usage (partagé entre répliques si un tier est donné)."""
+
+    def __init__(self, tier=None):
+        self.tier = tier
+        self._chariots = {}
+        self._verrou = threading.Lock()
+
+    def chariot(self, chariot_id):
+        with self._verrou:
+            if chariot_id not in self._chariots:
+                self._chariots[chariot_id] = VersionsPartagees(self.tier, chariot_id) if self.tier else VersionsCache()
+            return self._chariots[chariot_id]
+
+
+# --- TIER PARTAGÉ ---
+class Tier:
+    """Stockage clé -> octets commun aux répliques, avec compteurs et verrous à durée limitée."""
+    nom = "?"
+
+    def lire(self, cle):
+        raise NotImplementedError
+
+    def ecrire(self, cle, donnees, ttl=None):
+        raise NotImplementedError
+
+    def version(self, cle):
+        raise NotImplementedError
+
+    def incrementer(self, cle):
+        """Incrément atomique ; renvoie la nouvelle valeur."""
+        raise NotImplementedError
+
+    def verrouiller(self, cle, titulaire, duree):
+        """Prend (ou prolonge, pour le même titulaire) un verrou de `duree` s ; faux s'il est tenu par un autre."""
+        raise NotImplementedError
+
+    def liberer(self, cle, titulaire):
+        raise NotImplementedError
+
+    # Valeurs Python (pickle : le tier n'est lisible que par les répliques de l'application)
+    def charger(self, cle):
+        donnees = self.lire(cle)
+        return None if donnees is None else pickle.loads(donnees)
+
+    def ranger(self, cle, valeur, ttl=None):
+        self.ecrire(cle, pickle.dumps(valeur, protocol=pickle.HIGHEST_PROTOCOL), ttl)
+
+    def obtenir(self, cle, calcul, ttl=600, titulaire=None):
+        """Valeur sous `cle` (versionnée par l'appelant), calculée par une seule réplique à la fois."""
+        try:
+            donnees = self.lire(cle)
+            if donnees is not None:
+                return pickle.loads(donnees)
+            titulaire = titulaire or f"{id(self)}-{threading.get_ident()}"
+            if not self.verrouiller(f"{cle}/calcul", titulaire, ATTENTE_CALCUL):
+                # Une autre réplique lit déjà la base : on attend sa valeur plutôt que de relire
+                fin = time.monotonic() + ATTENTE_CALCUL
+                while time.monotonic() < fin:
+                    time.sleep(0.05)
+                    donnees = self.lire(cle)
+                    if donnees is not None:
+                        return pickle.loads(donnees)
+        except Exception as e:
+            print("Erreur tier partagé (lecture):", e)
+            return calcul()
+        valeur = calcul()
+        try:
+            self.ranger(cle, valeur, ttl)
+            self.liberer(f"{cle}/calcul", titulaire)
+        except Exception as e:
+            print("Erreur tier partagé (écriture):", e)
+        return valeur
+
+
+class TierSQLite(Tier):
+    """Fichier SQLite en mode WAL : répliques d'un même hôte (ou volume partagé)."""
+    nom = "sqlite"
+
+    def __init__(self, chemin):
+        self.chemin = chemin
+        self._conn = sqlite3.connect(chemin, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS valeurs (cle TEXT PRIMARY KEY, donnees BLOB NOT NULL, expire REAL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS compteurs (cle TEXT PRIMARY KEY, valeur INTEGER NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS verrous (cle TEXT PRIMARY KEY, titulaire TEXT NOT NULL, expire REAL NOT NULL)")
+        self._verrou = threading.Lock()
+
+    def lire(self, cle):
+        with self._verrou:
+            ligne = self._conn.execute("SELECT donnees, expire FROM valeurs WHERE cle = ?", (cle,)).fetchone()
+        if ligne is None or (ligne[1] is not None and ligne[1] < time.time()):
+            return None
+        return ligne[0]
+
+    def ecrire(self, cle, donnees, ttl=None):
+        expire = time.time() + ttl if ttl else None
+        with self._verrou:
+            self._conn.execute("INSERT OR REPLACE INTO valeurs (cle, donnees, expire) VALUES (?, ?, ?)", (cle, donnees, expire))
+            # Ménage des valeurs expirées (anciennes versions) au fil des écritures
+            self._conn.execute("DELETE FROM valeurs WHERE expire < ?", (time.time(),))
+
+    def version(self, cle):
+        with self._verrou:
+            ligne = self._conn.execute("SELECT valeur FROM compteurs WHERE cle = ?", (cle,)).fetchone()
+        return ligne[0] if ligne else 0
+
+    def incrementer(self, cle):
+        with self._verrou:
+            self._conn.execute("INSERT INTO compteurs (cle, valeur) VALUES (?, 1) "
+                               "ON CONFLICT(cle) DO UPDATE SET valeur = valeur + 1", (cle,))
+            return self._conn.execute("SELECT valeur FROM compteurs WHERE cle = ?", (cle,)).fetchone()[0]
+
+    def verrouiller(self, cle, titulaire, duree):
+        maintenant = time.time()
+        with self._verrou:
+            cur = self._conn.execute(
+                "INSERT INTO verrous (cle, titulaire, expire) VALUES (?, ?, ?) "
+                "ON CONFLICT(cle) DO UPDATE SET titulaire = excluded.titulaire, expire = excluded.expire "
+                "WHERE verrous.titulaire = excluded.titulaire OR verrous.expire < ?",
+                (cle, titulaire, maintenant + duree, maintenant))
+            return cur.rowcount == 1
+
+    def liberer(self, cle, titulaire):
+        with self._verrou:
+            self._conn.execute("DELETE FROM verrous WHERE cle = ? AND titulaire = ?", (cle, titulaire))
+
+
+class TierRedis(Tier):
+    """Adaptateur Redis : n'utilise que get / set (nx, xx, px) / incr / delete, comme RedisLocal."""
+    nom = "redis"
+
+    def __init__(self, client, prefixe="chariot:"):
+        self.client = client
+        self.prefixe = prefixe
+
+    def lire(self, cle):
+        return self.client.get(self.prefixe + cle)
+
+    def ecrire(self, cle, donnees, ttl=None):
+        self.client.set(self.prefixe + cle, donnees, px=int(ttl * 1000) if ttl else None)
+
+    def version(self, cle):
+        v = self.client.get(self.prefixe + "n:" + cle)
+        return int(v) if v is not None else 0
+
+    def incrementer(self, cle):
+        return int(self.client.incr(self.prefixe + "n:" + cle))
+
+    def verrouiller(self, cle, titulaire, duree):
+        k, px = self.prefixe + "v:" + cle, int(duree * 1000)
+        if self.client.set(k, titulaire, nx=True, px=px):
+            return True
+        tenu = self.client.get(k)
+        if tenu is not None and (tenu.decode() if isinstance(tenu, bytes) else tenu) == titulaire:
+            return bool(self.client.set(k, titulaire, xx=True, px=px))
+        return False
+
+    def liberer(self, cle, titulaire):
+        k = self.prefixe + "v:" + cle
+        tenu = self.client.get(k)
+        if tenu is not None and (tenu.decode() if isinstance(tenu, bytes) else tenu) == titulaire:
+            self.client.delete(k)
+
+
+class RedisLocal:
+    """Sous-ensemble du client redis-py en mémoire du processus (essais, bench)."""
+
+    def __init__(self):
+        self._donnees = {}
+        self._verrou = threading.Lock()
+
+    def _vivant(self, cle):
+        v = self._donnees.get(cle)
+        if v is not None and v[1] is not None and v[1] < time.monotonic():
+            del self._donnees[cle]
+            return None
+        return v
+
+    def get(self, cle):
+        with self._verrou:
+            v = self._vivant(cle)
+            return None if v is None else v[0]
+
+    def set(self, cle, valeur, ex=None, px=None, nx=False, xx=False):
+        with self._verrou:
+            existe = self._vivant(cle) is not None
+            if (nx and existe) or (xx and not existe):
+                return None
+            expire = time.monotonic() + (px / 1000 if px else ex) if (px or ex) else None
+            self._donnees[cle] = (valeur.encode() if isinstance(valeur, str) else valeur, expire)
+            return True
+
+    def incr(self, cle):
+        with self._verrou:
+            v = self._vivant(cle)
+            n = int(v[0]) + 1 if v else 1
+            self._donnees[cle] = (str(n).encode(), v[1] if v else None)
+            return n
+
+    def delete(self, *cles):
+        with self._verrou:
+            return sum(self._donnees.pop(c, None) is not None for c in cles)
+
+
+_redis_local = RedisLocal()
+
+
+def connecter_tier(url):
+    """Tier partagé d'après CHARIOT_CACHE_PARTAGE ; None (cache par processus) si vide."""
+    if not url:
+        return None
+    if url == "memoire":
+        return TierRedis(_redis_local)
+    if url.startswith("sqlite:///"):
+        return TierSQLite(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        import redis
+        return TierRedis(redis.Redis.from_url(url))
+    raise ValueError(f"Cache partagé inconnu : {url}")
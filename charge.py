@@ -0,0 +1,325 @@
+"""Test de charge : N sessions AppTest simultanées sur le backend mémoire.
+
+Chaque session virtuelle se connecte par le formulaire de login_page, puis
+enchaîne au hasard (graine fixe) : remplir un panier et l'enregistrer,
+remplacer une ligne, consulter l'historique, faire la checkliste (en passant
+par « Tout remplacer » si des dossiers sont ouverts). Les articles sont tirés
+dans un petit ensemble « chaud » pour provoquer des courses entre sessions.
+
+Rapport : latence des reruns (p50 / p95 / p99) par action, opérations de
+stockage, transactions rejouées, et bilan de stock par article : stock final
+comparé à stock initial - consommations + remplacements lus dans les LOGS.
+Un écart négatif est un sur-décrément, un écart positif un décrément perdu.
+
+AppTest n'est pas réentrant (il pose et retire Runtime._instance à chaque
+run) : les exécutions de script sont sérialisées par un verrou, les sessions
+s'entrelacent action par action pendant que le journal et le pool de threads
+écrivent en parallèle. Les latences excluent l'attente du verrou, rapportée à
+part.
+
+Usage : python charge.py [--sessions 8] [--iterations 10] [--articles 300]
+                         [--chauds 10] [--latence 0.01] [--graine 1] [--json]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import wait
+
+os.environ.setdefault("CHARIOT_BACKEND", "memoire")
+
+import numpy as np
+from streamlit.logger import set_log_level
+from streamlit.testing.v1 import AppTest
+
+import bench
+import mesures
+import stockage
+
+ACTIONS = {"consommation": 5, "remplacement": 3, "historique": 1, "checkliste": 1}
+PERCENTILES = (50, 95, 99)
+
+_VERROU_APPTEST = threading.Lock()
+
+
+class SessionVirtuelle:
+    def __init__(self, numero, iterations, chauds, graine):
+        self.numero = numero
+        self.identifiant = f"charge{numero:02d}"
+        self.iterations = iterations
+        self.chauds = chauds
+        self.rnd = random.Random(graine * 1000 + numero)
+        self.at = AppTest.from_file(bench.SCRIPT, default_timeout=bench.TIMEOUT)
+        self.latences = defaultdict(list)
+        self.attentes = []
+        self.erreurs = []
+        self.actions = Counter()
+
+    # --- Outils ---
+    def _run(self, action, fn):
+        t0 = time.perf_counter()
+        with _VERROU_APPTEST:
+            t1 = time.perf_counter()
+            at = fn()
+            self.latences[action].append((time.perf_counter() - t1) * 1000)
+        self.attentes.append((t1 - t0) * 1000)
+        if at.exception:
+            self.erreurs.append(f"{action}: {at.exception[0].message}")
+        # AppTest ne garde que les éléments d'un fragment relancé seul : on resynchronise
+        self.at = at
+        return at
+
+    def _naviguer(self, page):
+        if self.at.session_state["nav"] != page:
+            self._run("navigation", self.at.sidebar.radio(key="nav").set_value(page).run)
+
+    def _mode_remplacement(self, mode):
+        """Choisit la vue de la page Remplacer ; False s'il n'y a aucun dossier ouvert."""
+        radio = next((r for r in self.at.radio if r.key == "mode_rempl"), None)
+        if radio is None:
+            return False
+        if radio.value != mode:
+            self._run("navigation", radio.set_value(mode).run)
+        return True
+
+    def _bouton(self, libelle):
+        return next((b for b in self.at.button if b.label == libelle), None)
+
+    # --- Parcours ---
+    def connexion(self):
+        self._run("chargement", self.at.run)
+        self.at.text_input[0].input(self.identifiant)
+        self.at.text_input[1].input("mdp")
+        self._run("connexion", self._bouton("SE CONNECTER").click().run)
+        if not self.at.session_state["logged_in"]:
+            self.erreurs.append("connexion refusée")
+            return False
+        return True
+
+    def consommation(self):
+        self._naviguer("Consommation")
+        saisies = {n.key: n for n in self.at.number_input if n.key and n.key[6:] in self.chauds and (n.max or 0) >= 1}
+        for cle in self.rnd.sample(sorted(saisies), min(len(saisies), self.rnd.randint(1, 3))):
+            self._run("quantité", self.at.number_input(key=cle).set_value(1).run)
+            self._run("quantité", self.at.run)
+        ip = next((t for t in self.at.text_input if t.label == "🏥 IP PATIENT"), None)
+        if ip is None:
+            return
+        self._run("quantité", ip.input(f"IP-{self.identifiant}-{self.actions['consommation']}").run)
+        self._run("consommation", self._bouton("🚀 ENREGISTRER").click().run)
+
+    def remplacement(self):
+        self._naviguer("Remplacer")
+        if not self._mode_remplacement("Par dossier"):
+            return
+        cases = [c for c in self.at.checkbox if c.key and c.key.startswith("c_")]
+        if not cases:
+            return
+        case = self.rnd.choice(cases)
+        case.check()
+        # Le bouton du formulaire qui contient la case cochée
+        log_id = case.key.split("_")[1]
+        bouton = next((b for b in self.at.button if b.label == "💾 Valider Remplacement" and b.form_id == f"f_{log_id}"), None)
+        self._run("remplacement", (bouton or self._bouton("💾 Valider Remplacement")).click().run)
+
+    def historique(self):
+        self._naviguer("Historique")
+
+    def checkliste(self):
+        self._naviguer("Checkliste")
+        if any("Impossible" in e.value for e in self.at.error):
+            self._naviguer("Remplacer")
+            if not self._mode_remplacement("Tout remplacer"):
+                return
+            bouton = self._bouton("✅ Tout remplacer")
+            if bouton is None:
+                return
+            self._run("tout remplacer", bouton.click().run)
+            attendre_ecritures([self])
+            self._naviguer("Checkliste")
+            self._run("checkliste", self.at.run)
+            if any("Impossible" in e.value for e in self.at.error):
+                return
+        for b in [b for b in self.at.button if b.label.startswith("✅ Valider ")]:
+            self._run("checkliste", self.at.button(key=b.key).click().run)
+        confirmation = next((c for c in self.at.checkbox if c.label.startswith("✅ Je confirme")), None)
+        if confirmation is None:
+            return
+        self._run("checkliste", confirmation.check().run)
+        bouton = self._bouton("💾 VALIDER ET TERMINER")
+        if bouton is not None:
+            self._run("checkliste", bouton.click().run)
+
+    def jouer(self, depart):
+        depart.wait()
+        try:
+            if not self.connexion():
+                return
+            actions, poids = zip(*ACTIONS.items())
+            for _ in range(self.iterations):
+                action = self.rnd.choices(actions, poids)[0]
+                self.actions[action] += 1
+                getattr(self, action)()
+        except Exception as e:
+            self.erreurs.append(f"{type(e).__name__}: {e}")
+
+
+def attendre_ecritures(sessions, delai=bench.TIMEOUT):
+    """Journal vidé et remplacements globaux (pool de threads) terminés."""
+    bench.synchroniser()
+    futurs = []
+    for s in sessions:
+        if "ecritures" in s.at.session_state:
+            futurs += [e["futur"] for e in s.at.session_state["ecritures"]]
+    wait(futurs, timeout=delai)
+    bench.synchroniser()
+
+
+# --- JEU DE DONNÉES ---
+def preparer(db, n_sessions, n_articles, n_chauds, graine):
+    """Inventaire cohérent avec les dossiers ouverts (stock + quantités ouvertes = dotation)."""
+    items = bench.peupler(db, n_articles, graine=graine)
+    ouverts = Counter()
+    for doc in db.collection("LOGS").where("Statut", "==", "Non remplacé").stream():
+        for ligne in doc.to_dict().get("Details_Struct", []):
+            ouverts[ligne["ID"]] += int(ligne.get("Qte", 0))
+    dotation = 200
+    for item_id, d in items.items():
+        d["Dotation"] = dotation
+        d["Stock_Actuel"] = dotation - ouverts[item_id]
+    db.charger("INVENTAIRE", items)
+    db.charger("UTILISATEURS", {f"charge{i:02d}": {"password": "mdp", "prenom": "Charge", "nom": f"{i:02d}",
+                                                   "role": "Utilisateur"} for i in range(n_sessions)})
+    chauds = set(random.Random(graine).sample(sorted(items), min(n_chauds, len(items))))
+    db.reinitialiser_stats()
+    return {i: d["Stock_Actuel"] for i, d in items.items()}, _lignes_remplacees(db), chauds
+
+
+def _lignes_remplacees(db):
+    return {(doc.id, n) for doc in db.collection("LOGS").stream()
+            for n, l in enumerate(doc.to_dict().get("Details_Struct", [])) if l.get("EstRemplace")}
+
+
+def bilan_stock(db, initial, remplacees_avant):
+    """Écart par article entre le stock final et ce que disent les LOGS."""
+    attendu = Counter(initial)
+    for doc in db.collection("LOGS").stream():
+        log = doc.to_dict()
+        for n, l in enumerate(log.get("Details_Struct", [])):
+            if str(log.get("Utilisateur", "")).startswith("Charge"):
+                attendu[l["ID"]] -= int(l.get("Qte", 0))
+            if l.get("EstRemplace") and (doc.id, n) not in remplacees_avant:
+                attendu[l["ID"]] += int(l.get("Qte", 0))
+    final = {doc.id: doc.to_dict()["Stock_Actuel"] for doc in db.collection("INVENTAIRE").stream()}
+    ecarts = {i: final.get(i, 0) - attendu[i] for i in initial if final.get(i, 0) != attendu[i]}
+    return {
+        "articles_en_ecart": len(ecarts),
+        "sur_decrements": -sum(e for e in ecarts.values() if e < 0),
+        "decrements_perdus": sum(e for e in ecarts.values() if e > 0),
+        "stocks_negatifs": sum(1 for v in final.values() if v < 0),
+        "ecarts": dict(sorted(ecarts.items())[:20]),
+    }
+
+
+def percentiles(valeurs):
+    if not valeurs:
+        return {}
+    p = np.percentile(valeurs, PERCENTILES)
+    return {"n": len(valeurs), **{f"p{q}": round(float(v), 1) for q, v in zip(PERCENTILES, p)},
+            "max": round(max(valeurs), 1)}
+
+
+def executer(n_sessions=8, iterations=10, n_articles=300, n_chauds=10, latence=0.01, graine=1):
+    db = stockage.memoire_partagee()
+    initial, remplacees_avant, chauds = preparer(db, n_sessions, n_articles, n_chauds, graine)
+    avant = {c: len(db.collection(c).select([]).get()) for c in ("LOGS", "CHECKLISTS")}
+    mesures.MESURES.reinitialiser()
+    sessions = [SessionVirtuelle(i, iterations, chauds, graine) for i in range(n_sessions)]
+    depart = threading.Event()
+    threads = [threading.Thread(target=s.jouer, args=(depart,), name=s.identifiant) for s in sessions]
+    db.latence = latence
+    t0 = time.perf_counter()
+    try:
+        for t in threads: t.start()
+        depart.set()
+        for t in threads: t.join()
+        duree = time.perf_counter() - t0
+        attendre_ecritures(sessions)
+    finally:
+        db.latence = 0.0
+
+    latences = defaultdict(list)
+    for s in sessions:
+        for action, vals in s.latences.items():
+            latences[action] += vals
+    tous = [v for vals in latences.values() for v in vals]
+    attentes = [v for s in sessions for v in s.attentes]
+    reruns = mesures.MESURES.derniers_reruns(n=10**9)
+    return {
+        "sessions": n_sessions, "iterations": iterations, "articles": n_articles, "chauds": n_chauds,
+        "latence_simulee_ms": latence * 1000, "duree_s": round(duree, 2),
+        "actions": dict(sum((s.actions for s in sessions), Counter())),
+        "attente_verrou_ms": percentiles(attentes),
+        "latences_ms": {"toutes": percentiles(tous), **{a: percentiles(v) for a, v in sorted(latences.items())}},
+        "documents_crees": {c: len(db.collection(c).select([]).get()) - n for c, n in avant.items()},
+        "operations": {k: db.stats[k] for k in ("lectures", "ecritures", "suppressions", "allers_retours")},
+        "lectures_par_rerun": percentiles([r.get("lectures", 0) for r in reruns]),
+        "transactions_rejouees": db.stats["conflits"],
+        "stock": bilan_stock(db, initial, remplacees_avant),
+        "erreurs": [f"{s.identifiant} {e}" for s in sessions for e in s.erreurs][:20],
+    }
+
+
+def afficher(r):
+    print(f"{r['sessions']} sessions x {r['iterations']} actions, {r['articles']} articles ({r['chauds']} chauds), "
+          f"latence simulée {r['latence_simulee_ms']} ms, durée {r['duree_s']} s")
+    print(f"Actions : {r['actions']} ; documents créés : {r['documents_crees']}")
+    print(f"\n{'Action':<16} | {'n':>5} | {'p50':>8} | {'p95':>8} | {'p99':>8} | {'max':>8}")
+    print("-" * 66)
+    for action, p in r["latences_ms"].items():
+        if p:
+            print(f"{action:<16} | {p['n']:>5} | {p['p50']:>8} | {p['p95']:>8} | {p['p99']:>8} | {p['max']:>8}")
+    a = r["attente_verrou_ms"]
+    if a:
+        print(f"(attente du verrou AppTest : p50 {a['p50']} / p95 {a['p95']} ms, non comptée)")
+    o = r["operations"]
+    lp = r["lectures_par_rerun"]
+    print(f"\nStockage : {o['lectures']} lectures, {o['ecritures']} écritures, {o['suppressions']} suppressions, "
+          f"{o['allers_retours']} allers-retours ; lectures par rerun p50 {lp.get('p50')} / p95 {lp.get('p95')} / max {lp.get('max')}")
+    print(f"Transactions rejouées (conflits) : {r['transactions_rejouees']}")
+    s = r["stock"]
+    print(f"Stock : {s['articles_en_ecart']} articles en écart, sur-décréments {s['sur_decrements']}, "
+          f"décréments perdus {s['decrements_perdus']}, stocks négatifs {s['stocks_negatifs']}")
+    if s["ecarts"]:
+        print(f"  écarts (final - attendu) : {s['ecarts']}")
+    if r["erreurs"]:
+        print("Erreurs :")
+        for e in r["erreurs"]:
+            print(f"  {e}")
+
+
+def main(argv=None):
+    set_log_level("error")
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--articles", type=int, default=300)
+    parser.add_argument("--chauds", type=int, default=10, help="articles que toutes les sessions se disputent")
+    parser.add_argument("--latence", type=float, default=0.01, help="secondes par aller-retour simulé")
+    parser.add_argument("--graine", type=int, default=1)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+    rapport = executer(args.sessions, args.iterations, args.articles, args.chauds, args.latence, args.graine)
+    if args.json:
+        json.dump(rapport, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+    else:
+        afficher(rapport)
+
+
+if __name__ == "__main__":
+    main()
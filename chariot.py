@@ -1,13 +1,25 @@
 import streamlit as st
-import pandas as pd
-import firebase_admin
-from firebase_admin import credentials, firestore
-from datetime import datetime
-import time
-from fpdf import FPDF
+from datetime import datetime, timedelta
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 import os
+import io
 import traceback
+import threading
+import importlib
+import time
 import json
+import stockage
+import cache
+import recherche
+import statistiques
+import comptes
+import journal
+import mesures
+import archives
+import checklists
+import chariots
+import lots
 
 # --- 0. CONFIGURATION ET SESSION ---
 st.set_page_config(
@@ -46,71 +58,151 @@ st.markdown("""
 # --- CONSTANTES ---
 SHARED_ACCOUNTS = ["infirmier", "resident", "interne"]
 DEBUG_LOGIN = False
+JOURS_PEREMPTION = 30  # fenêtre des badges "périme bientôt"
+# "firestore" (production) ou "memoire" (stand-in local, voir stockage.py / bench.py)
+BACKEND = os.environ.get("CHARIOT_BACKEND", "firestore")
 
 # --- 1. BACKEND (FIRESTORE) ---
-@st.cache_resource
-def get_db():
-    try:
-        if firebase_admin._apps:
-            return firestore.client()
-
-        cred = None
-        source = None
-        # 1) Fichier local
-        local_path = "firestore_key.json"
-        if os.path.exists(local_path):
-            cred = credentials.Certificate(local_path)
-            source = f"local file: {local_path}"
-        # 2) Secrets Streamlit
-        else:
-            try:
-                secret_keys = list(st.secrets.keys())
-                key_dict = None
-                if "firestore" in st.secrets:
-                    key_dict = dict(st.secrets["firestore"])
-                else:
-                    required = ["type", "project_id", "private_key", "client_email", "token_uri"]
-                    if all(k in st.secrets for k in required):
-                        key_dict = {k: st.secrets[k] for k in st.secrets.keys()}
-
-                if key_dict is None:
-                    st.error("🚨 Secrets non trouvés.")
-                    return None
-
-                pk = key_dict.get("private_key", "")
-                if isinstance(pk, str):
-                    if "\\n" in pk:
-                        key_dict["private_key"] = pk.replace("\\n", "\n")
-                
-                cred = credentials.Certificate(key_dict)
-                source = "streamlit secrets"
-            except Exception as se:
-                st.error(f"🚨 Erreur lecture secrets: {se}")
-                return None
+# pandas, fpdf et firebase_admin sont importés là où ils servent : la page de login s'affiche sans les attendre
+def ouvrir_firestore():
+    """Identifiants + client Firestore ; tourne dans un thread de fond (aucun appel st.* d'affichage ici)"""
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+    if firebase_admin._apps:
+        return mesures.instrumenter(stockage.FirestoreStockage(firestore.client()))
+
+    cred = None
+    source = None
+    # 1) Fichier local
+    local_path = "firestore_key.json"
+    if os.path.exists(local_path):
+        cred = credentials.Certificate(local_path)
+        source = f"local file: {local_path}"
+    # 2) Secrets Streamlit
+    else:
+        try:
+            key_dict = None
+            if "firestore" in st.secrets:
+                key_dict = dict(st.secrets["firestore"])
+            else:
+                required = ["type", "project_id", "private_key", "client_email", "token_uri"]
+                if all(k in st.secrets for k in required):
+                    key_dict = {k: st.secrets[k] for k in st.secrets.keys()}
+        except Exception as se:
+            raise RuntimeError(f"🚨 Erreur lecture secrets: {se}")
+        if key_dict is None:
+            raise RuntimeError("🚨 Secrets non trouvés.")
 
+        pk = key_dict.get("private_key", "")
+        if isinstance(pk, str):
+            if "\\n" in pk:
+                key_dict["private_key"] = pk.replace("\\n", "\n")
+
+        cred = credentials.Certificate(key_dict)
+        source = "streamlit secrets"
+
+    try:
         firebase_admin.initialize_app(cred)
         print(f"Firebase initialized from {source}")
-        return firestore.client()
+        return mesures.instrumenter(stockage.FirestoreStockage(firestore.client()))
     except Exception as e:
-        st.error(f"🚨 Erreur BDD: {e}")
-        return None
+        raise RuntimeError(f"🚨 Erreur BDD: {e}")
+
+@st.cache_resource
+def get_db():
+    """Connexion ouverte en arrière-plan dès le premier rerun ; le premier accès à db (login, lecture) attend la fin"""
+    if BACKEND == "memoire":
+        return stockage.ConnexionDifferee.prete(mesures.instrumenter(stockage.memoire_partagee()))
+    return stockage.ConnexionDifferee.ouvrir(ouvrir_firestore)
 
 db = get_db()
 
+def chariot_courant():
+    return st.session_state.get('chariot', chariots.DEFAUT)
+
+def db_chariot(chariot):
+    """Stockage limité aux collections du chariot (CHARIOTS/{id}/...)"""
+    return chariots.vue(db, chariot)
+
+@mesures.cache_data(ttl=600, max_entries=1)
+def get_chariots():
+    """{id: {Nom, Tiroirs}} : un document par chariot, relu toutes les 10 min"""
+    try:
+        if db: return chariots.lister(db)
+    except Exception as e:
+        print("Erreur chariots:", e)
+    return {chariots.DEFAUT: chariots.config(None)}
+
+def config_chariot(chariot):
+    return get_chariots().get(chariot) or chariots.config(None)
+
+@st.cache_resource
+def prechauffer():
+    """Importe en fond les modules des pages connectées pendant la saisie du login (une fois par processus)"""
+    def _importer():
+        try:
+            time.sleep(0.5)  # laisse partir le rendu du login avant de disputer le GIL
+            for module in ("pandas", "inventaire"): importlib.import_module(module)
+        except Exception as e: print("Erreur préchauffage", e)
+    threading.Thread(target=_importer, name="prechauffage", daemon=True).start()
+    return True
+
 # --- 2. FONCTIONS DE LECTURE (OPTIMISÉES / CACHÉES) ---
 
-# OPTIMISATION MAJEURE : On met en cache l'inventaire pour ne pas lire la BDD à chaque clic
-@st.cache_data(ttl=600) # Garde en mémoire 10 minutes ou jusqu'à vidange manuelle
-def get_inventaire_cached():
-    if db is None:
-        return pd.DataFrame()
+@st.cache_resource
+def get_tier_partage():
+    """Cache commun aux répliques Streamlit (CHARIOT_CACHE_PARTAGE), None pour un cache par processus"""
     try:
-        docs = db.collection("INVENTAIRE").stream()
+        return cache.connecter_tier(os.environ.get("CHARIOT_CACHE_PARTAGE", ""))
+    except Exception as e:
+        print("Erreur cache partagé, cache par processus:", e)
+        return None
+
+def lire_partage(chariot, portee, version, cle, calcul, ttl=600):
+    """Résultat de calcul() lu en base par une seule réplique, sous une clé versionnée ; calcul local sans tier"""
+    tier = get_tier_partage()
+    if tier is None: return calcul()
+    return tier.obtenir(f"{chariot}/{portee}/{version}/{cle!r}", calcul, ttl)
+
+@st.cache_resource
+def get_replica_inventaire(chariot):
+    """Réplique process-wide tenue à jour par écouteur (une par chariot ouvert dans le processus)."""
+    import inventaire
+    tier = get_tier_partage()
+    if tier is not None:  # une seule réplique Streamlit écoute la base, les autres relisent le tier
+        replica = inventaire.ReplicaPartagee(db_chariot(chariot), "INVENTAIRE", tier, chariot)
+    else:
+        replica = inventaire.ReplicaInventaire(db_chariot(chariot), "INVENTAIRE")
+    if not replica.demarrer():
+        print("Replica inventaire : snapshot initial non reçu, lecture directe en attendant")
+    return replica
+
+# OPTIMISATION MAJEURE : l'inventaire vient de la réplique partagée ; seuls les documents modifiés sont relus.
+# Le snapshot est le même objet pour toutes les sessions (pas de copie par rerun) : lecture seule.
+def get_inventaire_snapshot():
+    import pandas as pd
+    import inventaire
+    if not db:
+        return inventaire.SnapshotInventaire(pd.DataFrame())
+    chariot = chariot_courant()
+    ordre = config_chariot(chariot)['Tiroirs']
+    replica = get_replica_inventaire(chariot)
+    if replica.pret():
+        return replica.snapshot(ordre)
+    return inventaire.SnapshotInventaire(lire_inventaire_direct(chariot, version_cache(cache.INVENTAIRE)), ordre_tiroirs=ordre)
+
+@mesures.cache_data(ttl=600, max_entries=16) # Secours si l'écouteur n'a pas encore répondu
+def lire_inventaire_direct(chariot, version):
+    import pandas as pd
+    def lire():
         items = []
-        for doc in docs:
+        for doc in db_chariot(chariot).collection("INVENTAIRE").stream():
             data = doc.to_dict() or {}
             data['ID'] = doc.id
             items.append(data)
+        return items
+    try:
+        items = lire_partage(chariot, cache.INVENTAIRE, version, None, lire)
         if not items:
             return pd.DataFrame()
         df = pd.DataFrame(items)
@@ -118,247 +210,447 @@ def get_inventaire_cached():
             df = df.drop_duplicates(subset=['ID'], keep='first').sort_values(by='ID')
         return df
     except Exception as e:
-        print("Erreur get_inventaire_cached:", e)
+        print("Erreur lire_inventaire_direct:", e)
         return pd.DataFrame()
 
-@st.cache_data(ttl=300)
-def get_logs_remplacement_cached():
-    if db is None: return []
-    try:
+def get_index_recherche(snap):
+    replica = get_replica_inventaire(chariot_courant())
+    if replica.pret():
+        return replica.index_recherche()
+    return recherche.IndexRecherche(snap.lignes)
+
+@mesures.cache_data(ttl=300, max_entries=16)
+def get_logs_remplacement_cached(chariot, version):
+    if not db: return []
+    def lire():
         # On ne récupère que les logs "Non remplacé" pour économiser
-        logs_ref = db.collection("LOGS").where("Statut", "==", "Non remplacé").order_by("Date", direction=firestore.Query.DESCENDING).stream()
+        logs_ref = db_chariot(chariot).collection("LOGS").where("Statut", "==", "Non remplacé").order_by("Date", direction=stockage.DESCENDING).stream()
         data = []
         for doc in logs_ref:
             l = doc.to_dict()
             l['id_doc'] = doc.id
             data.append(l)
         return data
+    try:
+        return lire_partage(chariot, cache.LOGS_OUVERTS, version, None, lire, ttl=300)
     except Exception as e:
         print("Erreur logs remplacement:", e)
         return []
 
-@st.cache_data(ttl=300)
-def get_historique_cached(limit=50):
-    if db is None: return []
+@mesures.cache_data(ttl=300, max_entries=64)
+def get_historique_page(chariot, version, taille=50, curseur=None, debut=None, fin=None, utilisateur=None, ip=None, statut=None):
+    """Une page de LOGS (Date décroissante), filtres appliqués côté Firestore.
+
+    `curseur` est le couple (Date, ID) du dernier log de la page précédente : l'ID
+    départage les logs écrits au même instant (validation d'un panier). Une page coûte
+    `taille` lectures quelle que soit la taille de LOGS, plus les parties
+    d'archive des mois qu'elle atteint (cachées une heure). Chaque combinaison de
+    filtres d'égalité + Date a son index composite dans firestore.indexes.json.
+    Renvoie (logs, curseur de la page suivante ou None).
+    """
+    if not db: return [], None
     try:
-        logs_ref = db.collection("LOGS").order_by("Date", direction=firestore.Query.DESCENDING).limit(limit).stream()
-        data = []
-        for doc in logs_ref:
-            l = doc.to_dict()
-            l['id_doc'] = doc.id
-            data.append(l)
-        return data
+        return lire_partage(chariot, cache.LOGS_HISTORIQUE, version, (taille, curseur, debut, fin, utilisateur, ip, statut),
+                            lambda: lire_historique(chariot, version, taille, curseur, debut, fin, utilisateur, ip, statut), ttl=300)
     except Exception as e:
         print("Erreur historique:", e)
+        return [], None
+
+def lire_historique(chariot, version, taille, curseur, debut, fin, utilisateur, ip, statut):
+    """Requête d'une page d'historique, complétée par les archives (appelée via le tier partagé)"""
+    q = db_chariot(chariot).collection("LOGS")
+    if utilisateur: q = q.where("Utilisateur", "==", utilisateur)
+    if ip: q = q.where("IP_Patient", "==", ip)
+    if statut: q = q.where("Statut", "==", statut)
+    if debut: q = q.where("Date", ">=", debut)
+    if fin: q = q.where("Date", "<", fin)
+    q = q.order_by("Date", direction=stockage.DESCENDING).order_by(stockage.ID_DOCUMENT, direction=stockage.DESCENDING)
+    if curseur is not None: q = q.start_after({"Date": curseur[0], stockage.ID_DOCUMENT: curseur[1]})
+    data = []
+    for doc in q.limit(taille).stream():
+        l = doc.to_dict()
+        l['id_doc'] = doc.id
+        data.append(l)
+    # Les logs archivés (archives.py) s'intercalent par Date ; version = (LOGS_HISTORIQUE, ARCHIVES)
+    v_archives = version[1]
+    index = get_index_archives(chariot, v_archives)
+    if not index:
+        return data, ((data[-1].get('Date'), data[-1]['id_doc']) if len(data) == taille else None)
+    return archives.completer_page(data, taille, index, lambda m: get_archive_mois(chariot, v_archives, m, index[m]),
+                                   curseur, debut, fin, utilisateur, ip, statut)
+
+@mesures.cache_data(ttl=600, max_entries=16)
+def get_index_archives(chariot, version):
+    """Index des archives de LOGS : 1 lecture, les mois archivés ne changent qu'au passage du job de compaction"""
+    if not db: return {}
+    try:
+        return archives.lire_index(db_chariot(chariot))
+    except Exception as e:
+        print("Erreur index archives:", e)
+        return {}
+
+@mesures.cache_data(ttl=3600, max_entries=48)
+def get_archive_mois(chariot, version, mois, info):
+    if not db: return []
+    try:
+        return archives.lire_mois(db_chariot(chariot), mois, info)
+    except Exception as e:
+        print("Erreur archive:", e)
+        return []
+
+@mesures.cache_data(ttl=600, max_entries=16)
+def get_checklists_cached(chariot, version, limit=5):
+    """Date et Utilisateur des dernières checklistes (projection) : le contenu n'est lu que pour un PDF"""
+    if not db: return []
+    try:
+        return checklists.lister(db_chariot(chariot), limit)
+    except Exception as e:
+        print("Erreur checklists:", e)
         return []
 
+@mesures.cache_data(ttl=600, max_entries=16)
+def get_checklist_cached(chariot, version, doc_id):
+    if not db: return None
+    try:
+        return checklists.charger(db_chariot(chariot), doc_id)
+    except Exception as e:
+        print("Erreur checkliste:", e)
+        return None
+
+@mesures.cache_data(ttl=600, max_entries=32)
+def get_stats_cached(chariot, version, vue, jour):
+    """Documents d'agrégats STATS : 30 jours ou 12 mois = 30 / 12 lectures, quel que soit le volume de LOGS"""
+    if not db: return []
+    try:
+        fin = datetime.combine(jour, datetime.min.time())
+        dbc = db_chariot(chariot)
+        if vue == "mois": return statistiques.lire_mois(dbc, fin, 12)
+        return statistiques.lire_jours(dbc, fin, 30)
+    except Exception as e:
+        print("Erreur stats:", e)
+        return []
+
+@st.cache_resource
+def get_versions_cache():
+    # Avec un tier partagé, une invalidation (écriture, bouton Actualiser) atteint toutes les répliques
+    return cache.VersionsChariots(get_tier_partage())
+
+def version_cache(portee):
+    return get_versions_cache().chariot(chariot_courant()).version(portee)
+
+def invalider_cache(*portees, chariot=None):
+    """Invalide uniquement les caches des collections touchées par une écriture (chariot de la session par défaut)"""
+    get_versions_cache().chariot(chariot or chariot_courant()).invalider(*portees)
+
 def clear_cache_app():
-    """Vide le cache pour forcer une relecture après une modification"""
+    """Vide tout le cache (bouton Actualiser) pour forcer une relecture complète"""
+    get_versions_cache().chariot(chariot_courant()).tout_invalider()
     st.cache_data.clear()
 
 # --- 3. FONCTIONS D'ÉCRITURE (ACTIONS) ---
 
-def valider_panier(panier, ip, utilisateur):
-    if db is None: return False
+def _transaction_panier(transaction, dbc, cle, panier, ip, utilisateur, date):
+    # Une seule lecture groupée (get_all) : le log (clé d'idempotence) + les articles ;
+    # rejouée telle quelle par Firestore si un article est modifié entre-temps
+    log_ref = dbc.collection("LOGS").document(cle)
+    refs = [log_ref] + [dbc.collection("INVENTAIRE").document(item_id) for item_id in panier]
+    docs = {doc.reference.path: doc for doc in dbc.get_all(refs, transaction=transaction)}
+    log_doc = docs.get(log_ref.path)
+    if log_doc is not None and log_doc.exists:
+        return  # Déjà appliqué (accusé de réception perdu) : pas de second décrément
+    details_list = []
+    details_texte = []
+
+    for item_ref, (item_id, qte) in zip(refs[1:], panier.items()):
+        doc = docs.get(item_ref.path)
+        if doc is not None and doc.exists:
+            data = doc.to_dict() or {}
+            nom = data.get('Nom', 'Inconnu')
+            stock_actuel = int(data.get('Stock_Actuel', 0))
+            tiroir = data.get('Tiroir', '?')
+            nouveau_stock = max(0, stock_actuel - int(qte))
+            maj = {"Stock_Actuel": nouveau_stock}
+            detail = {"ID": item_id, "Nom": nom, "Qte": int(qte), "Tiroir": tiroir, "EstRemplace": False}
+            if data.get('Lots'):
+                # FEFO : premiers périmés, premiers sortis ; le log garde les lots sortis
+                restants, sortis = lots.sortir(data['Lots'], int(qte))
+                maj["Lots"] = lots.plafonner(restants, nouveau_stock)
+                if sortis: detail["Lots"] = sortis
+            transaction.update(doc.reference, maj)
+
+            details_texte.append(f"{qte}x {nom}")
+            details_list.append(detail)
+
+    log_data = {
+        "Date": date, "Utilisateur": utilisateur, "IP_Patient": ip,
+        "Action": "Consommation", "Details_Complets": details_texte,
+        "Details_Struct": details_list, "Nb_Produits": len(panier),
+        "Statut": "Non remplacé", "Historique_Remplacements": []
+    }
+    # Le log part dans le même commit que les décréments : tout ou rien
+    transaction.set(log_ref, log_data)
+    # Agrégats du jour et du mois, dans le même commit
+    for op, ref, data in statistiques.ecritures_consommation(dbc, date, details_list):
+        stockage.appliquer(transaction, op, ref, data)
+
+def appliquer_consommation(cle, charge):
+    """Gestionnaire du journal : rejouable sans risque (le log porte la clé)"""
+    dbc = db_chariot(charge.get('Chariot', chariots.DEFAUT))
+    dbc.executer_transaction(_transaction_panier, dbc, cle, charge['Panier'], charge['IP'], charge['Utilisateur'], charge['Date'])
+
+def valider_panier(panier, ip, utilisateur, cle=None):
+    """Journalise la consommation ; la synchronisation avec la base se fait en arrière-plan"""
+    if not db: return False
     try:
-        batch = db.batch()
-        details_list = []
-        details_texte = []
-        
-        # On lit les docs nécessaires (lecture unitaire inévitable pour la sécurité du stock)
-        for item_id, qte in panier.items():
-            doc_ref = db.collection("INVENTAIRE").document(item_id)
-            doc = doc_ref.get()
-            if doc.exists:
-                data = doc.to_dict() or {}
-                nom = data.get('Nom', 'Inconnu')
-                stock_actuel = int(data.get('Stock_Actuel', 0))
-                tiroir = data.get('Tiroir', '?')
-                nouveau_stock = max(0, stock_actuel - int(qte))
-                batch.update(doc_ref, {"Stock_Actuel": nouveau_stock})
-                
-                details_texte.append(f"{qte}x {nom}")
-                details_list.append({
-                    "ID": item_id, "Nom": nom, "Qte": int(qte), 
-                    "Tiroir": tiroir, "EstRemplace": False
-                })
-
-        log_data = {
-            "Date": datetime.now(), "Utilisateur": utilisateur, "IP_Patient": ip,
-            "Action": "Consommation", "Details_Complets": details_texte,
-            "Details_Struct": details_list, "Nb_Produits": len(panier),
-            "Statut": "Non remplacé", "Historique_Remplacements": []
-        }
-        db.collection("LOGS").add(log_data)
-        batch.commit()
-        
-        # CRITIQUE : On vide le cache car le stock a changé
-        clear_cache_app()
+        get_journal().ajouter("consommation", {
+            "Panier": dict(panier), "IP": ip, "Utilisateur": utilisateur, "Date": datetime.now(), "Chariot": chariot_courant()
+        }, cle)
         return True
     except Exception as e:
         print("Erreur valider_panier:", e)
         return False
 
-def effectuer_remplacement_partiel(log_id, log_data, items_coches, user_remplacant):
-    if db is None: return False
-    try:
-        batch = db.batch()
-        items_struct = log_data.get('Details_Struct', [])
-        tout_est_remplace = True
-        nouveaux_items_struct = []
-        items_modifies_noms = []
+def _transaction_remplacement(transaction, dbc, cle, log_id, items_coches, user_remplacant, date, lots_declares=None):
+    log_ref = dbc.collection("LOGS").document(log_id)
+    refs = [log_ref] + [dbc.collection("INVENTAIRE").document(i) for i in sorted(set(items_coches))]
+    docs = {doc.reference.path: doc for doc in dbc.get_all(refs, transaction=transaction)}
+    log_doc = docs.get(log_ref.path)
+    if log_doc is None or not log_doc.exists: return  # Log supprimé entre-temps
+    log_data = log_doc.to_dict() or {}
+    histo = log_data.get('Historique_Remplacements', [])
+    if not isinstance(histo, list): histo = []
+    if any(isinstance(t, dict) and t.get('Cle') == cle for t in histo): return  # Déjà appliqué
 
-        for item in items_struct:
-            item_id = item.get('ID')
-            if not item_id or item.get('EstRemplace', False):
-                nouveaux_items_struct.append(item)
-                continue
-
-            if item_id in items_coches:
-                qte_a_rendre = int(item.get('Qte', 0))
-                doc_ref = db.collection("INVENTAIRE").document(item_id)
-                doc = doc_ref.get()
-                if doc.exists:
-                    current = doc.to_dict() or {}
-                    stock_now = int(current.get('Stock_Actuel', 0))
-                    dotation = int(current.get('Dotation', 0))
-                    nouveau_stock = min(dotation, stock_now + qte_a_rendre)
-                    batch.update(doc_ref, {"Stock_Actuel": nouveau_stock})
-                
-                item['EstRemplace'] = True
-                items_modifies_noms.append(item.get('Nom', item_id))
-            else:
-                tout_est_remplace = False
+    tout_est_remplace = True
+    nouveaux_items_struct = []
+    items_modifies_noms = []
+    lignes_remplacees = []
+    stocks = {}
+    lots_articles = {}
+    lots_declares = lots_declares or {}
+
+    for item in log_data.get('Details_Struct', []):
+        item_id = item.get('ID')
+        if not item_id or item.get('EstRemplace', False):
             nouveaux_items_struct.append(item)
+            continue
 
-        log_ref = db.collection("LOGS").document(log_id)
-        updates = {"Details_Struct": nouveaux_items_struct}
-        trace = {"Date": datetime.now(), "User": user_remplacant, "Items": items_modifies_noms}
-        
-        histo = log_data.get('Historique_Remplacements', [])
-        if not isinstance(histo, list): histo = []
-        histo.append(trace)
-        updates["Historique_Remplacements"] = histo
-
-        if tout_est_remplace:
-            updates["Statut"] = "Remplacé"
-            updates["Date_Remplacement"] = datetime.now()
-            updates["Utilisateur_Remplacement"] = user_remplacant
-
-        batch.update(log_ref, updates)
-        batch.commit()
-        
-        # CRITIQUE : On vide le cache
-        clear_cache_app()
-        return tout_est_remplace
+        if item_id in items_coches:
+            qte_a_rendre = int(item.get('Qte', 0))
+            doc = docs.get(dbc.collection("INVENTAIRE").document(item_id).path)
+            if doc is not None and doc.exists:
+                current = doc.to_dict() or {}
+                # Cumul si le même article apparaît deux fois dans le log
+                stock_now = stocks.get(item_id, int(current.get('Stock_Actuel', 0)))
+                dotation = int(current.get('Dotation', 0))
+                nouveau_stock = min(dotation, stock_now + qte_a_rendre)
+                stocks[item_id] = nouveau_stock
+                maj = {"Stock_Actuel": nouveau_stock}
+                # Lot déclaré au réassort, sinon les lots sortis par la consommation
+                ajouts = [{**lots_declares[item_id], "Qte": qte_a_rendre}] if item_id in lots_declares else item.get('Lots', [])
+                lots_now = lots_articles.get(item_id, current.get('Lots', []))
+                if lots_now or ajouts:
+                    lots_articles[item_id] = lots.rentrer(lots_now, ajouts, nouveau_stock - stock_now)
+                    maj["Lots"] = lots_articles[item_id]
+                transaction.update(doc.reference, maj)
+
+            item['EstRemplace'] = True
+            items_modifies_noms.append(item.get('Nom', item_id))
+            lignes_remplacees.append((item, log_data.get('Date')))
+        else:
+            tout_est_remplace = False
+        nouveaux_items_struct.append(item)
+
+    updates = {"Details_Struct": nouveaux_items_struct}
+    histo.append({"Date": date, "User": user_remplacant, "Items": items_modifies_noms, "Cle": cle})
+    updates["Historique_Remplacements"] = histo
+
+    if tout_est_remplace:
+        updates["Statut"] = "Remplacé"
+        updates["Date_Remplacement"] = date
+        updates["Utilisateur_Remplacement"] = user_remplacant
+
+    transaction.update(log_ref, updates)
+    for op, ref, data in statistiques.ecritures_remplacement(dbc, date, lignes_remplacees):
+        stockage.appliquer(transaction, op, ref, data)
+
+def appliquer_remplacement(cle, charge):
+    """Gestionnaire du journal : la trace du remplacement porte la clé, un rejeu ne rend pas le stock deux fois"""
+    dbc = db_chariot(charge.get('Chariot', chariots.DEFAUT))
+    dbc.executer_transaction(_transaction_remplacement, dbc, cle, charge['Log'], charge['Items'], charge['Utilisateur'], charge['Date'],
+                             charge.get('Lots'))
+
+def effectuer_remplacement_partiel(log_id, items_coches, user_remplacant, lots_declares=None):
+    """Journalise le remplacement des lignes cochées d'un log ; renvoie la clé de l'entrée (None si échec)
+
+    lots_declares : {ID: {"Lot", "Peremption"}} du matériel remis, quand il est renseigné.
+    """
+    if not db: return None
+    try:
+        return get_journal().ajouter("remplacement", {
+            "Log": log_id, "Items": list(items_coches), "Utilisateur": user_remplacant, "Date": datetime.now(),
+            "Chariot": chariot_courant(), "Lots": lots_declares or {}
+        }, groupe=log_id)  # rejoué après la consommation qui a créé le log (sa clé est l'ID du log)
     except Exception as e:
         print("Erreur remplacement:", e)
-        return False
+        return None
+
+def agreger_remplacements(logs):
+    """Liste de prélèvement : quantités à remettre par article, tous dossiers ouverts confondus"""
+    lignes = {}
+    for l in logs:
+        for item in l.get('Details_Struct', []):
+            item_id = item.get('ID')
+            if not item_id or item.get('EstRemplace', False): continue
+            ligne = lignes.setdefault(item_id, {
+                "ID": item_id, "Nom": item.get('Nom', item_id), "Tiroir": item.get('Tiroir', '?'),
+                "Qte": 0, "Dossiers": 0, "Lots": []
+            })
+            ligne["Qte"] += int(item.get('Qte', 0))
+            ligne["Dossiers"] += 1
+            ligne["Lots"] += item.get('Lots', [])
+    return sorted(lignes.values(), key=lambda r: (str(r['Tiroir']), str(r['Nom'])))
+
+def remplacer_tout(chariot, log_ids, user_remplacant, cle=None):
+    """Remplace toutes les lignes ouvertes des logs donnés, un log par transaction
 
-def supprimer_log(log_id):
+    Chaque log passe par _transaction_remplacement : stock relu et réécrit dans la
+    transaction (une validation concurrente n'est pas écrasée), et la trace du
+    remplacement porte la clé `{cle}-{log}`, un rejeu ne rend pas le stock deux fois.
+    """
+    if not db: return False
+    dbc = db_chariot(chariot)
+    cle = cle or journal.nouvelle_cle()
+    ok = True
+    try:
+        # Lecture groupée des logs : seulement pour connaître les lignes ouvertes,
+        # chaque transaction relit son log
+        logs = []
+        for doc in stockage.lire_par_lots(dbc, [dbc.collection("LOGS").document(i) for i in log_ids]):
+            if doc.exists:
+                l = doc.to_dict() or {}
+                if l.get('Statut') != "Remplacé": logs.append((doc.id, l))
+        maintenant = datetime.now()
+        for log_id, l in logs:
+            items = sorted({i.get('ID') for i in l.get('Details_Struct', []) if i.get('ID') and not i.get('EstRemplace', False)})
+            if not items: continue
+            try:
+                dbc.executer_transaction(_transaction_remplacement, dbc, f"{cle}-{log_id}", log_id, items, user_remplacant, maintenant)
+            except Exception as e:
+                print("Erreur remplacement global:", log_id, e)
+                ok = False
+    except Exception as e:
+        print("Erreur remplacement global:", e)
+        ok = False
+    # Même en échec, une partie des logs a pu passer : on relit
+    invalider_cache(cache.INVENTAIRE, cache.LOGS_OUVERTS, cache.LOGS_HISTORIQUE, cache.STATS, chariot=chariot)
+    return ok
+
+def supprimer_log(log_id, archive=None):
     if db:
+        dbc = db_chariot(chariot_courant())
         try:
-            db.collection("LOGS").document(log_id).delete()
-            clear_cache_app()
+            if archive:
+                archives.supprimer_log(dbc, archive, log_id)
+                invalider_cache(cache.ARCHIVES)
+                return
+            dbc.collection("LOGS").document(log_id).delete()
+            invalider_cache(cache.LOGS_OUVERTS, cache.LOGS_HISTORIQUE)
         except Exception as e:
             print("Erreur suppr:", e)
 
+def appliquer_checklist(cle, charge):
+    """Gestionnaire du journal : la clé sert d'ID de document, un rejeu réécrit le même document"""
+    checklists.enregistrer(db_chariot(charge.get('Chariot', chariots.DEFAUT)), cle, {
+        "Date": charge['Date'], "Utilisateur": charge['Utilisateur'], "Statut": "Validé",
+        "Securite_Verrou": True, "Securite_Attache": True
+    }, charge['Contenu'])
+
 def save_checklist_history(user, data_items):
     if db:
         try:
-            doc_data = {
-                "Date": datetime.now(), "Utilisateur": user, "Statut": "Validé",
-                "Contenu": data_items, "Securite_Verrou": True, "Securite_Attache": True
-            }
-            db.collection("CHECKLISTS").add(doc_data)
-            clear_cache_app()
+            return get_journal().ajouter("checkliste", {"Date": datetime.now(), "Utilisateur": user, "Contenu": data_items,
+                                                        "Chariot": chariot_courant()})
         except Exception as e:
             print("Erreur save checklist:", e)
 
-# --- GENERATION PDF ---
-class PDF(FPDF):
-    def header(self):
-        if os.path.exists("logo_chu.png"): self.image("logo_chu.png", 170, 8, 30)
-        if os.path.exists("logo_service.png"): self.image("logo_service.png", 10, 8, 30)
-        self.set_font('Helvetica', 'B', 15)
-        self.cell(0, 10, 'CHECKLISTE CHARIOT URGENCE', 0, 1, 'C')
-        self.set_font('Helvetica', 'I', 10)
-        self.cell(0, 10, 'Service Réanimation Mère-Enfant - CHU Hassan II', 0, 1, 'C')
-        self.ln(20)
-    def footer(self):
-        self.set_y(-15)
-        self.set_font('Helvetica', 'I', 8)
-        self.cell(0, 10, f'Page {self.page_no()}', 0, 0, 'C')
+# Portées de cache à invalider quand une entrée du journal est synchronisée
+PORTEES_JOURNAL = {
+    "consommation": (cache.INVENTAIRE, cache.LOGS_OUVERTS, cache.LOGS_HISTORIQUE, cache.STATS),
+    "remplacement": (cache.INVENTAIRE, cache.LOGS_OUVERTS, cache.LOGS_HISTORIQUE, cache.STATS),
+    "checkliste": (cache.CHECKLISTS,),
+}
+
+@st.cache_resource
+def get_journal():
+    """Journal local des écritures + thread de synchronisation, un par processus"""
+    chemin = os.environ.get("CHARIOT_JOURNAL", ":memory:" if BACKEND == "memoire" else "journal_chariot.sqlite")
+    j = journal.partage(chemin)
+    j.enregistrer("consommation", appliquer_consommation)
+    j.enregistrer("remplacement", appliquer_remplacement)
+    j.enregistrer("checkliste", appliquer_checklist)
+    versions = get_versions_cache()
+    j.apres = lambda type_op, charge: versions.chariot(charge.get('Chariot', chariots.DEFAUT)).invalider(*PORTEES_JOURNAL[type_op])
+    return j.demarrer()
 
+@st.cache_resource
+def get_executeur():
+    """Pool partagé pour les écritures hors journal (Tout remplacer) : le script n'attend pas le réseau"""
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="ecritures")
+
+# --- GENERATION PDF ---
 def generer_pdf_checklist(data_checklist, user, date_check):
-    pdf = PDF()
-    pdf.add_page()
-    pdf.set_font("Helvetica", size=12)
-    date_fmt = date_check.strftime("%d/%m/%Y à %H:%M")
-    pdf.multi_cell(0, 10, f"Checkliste faite le {date_fmt} par {user}.\nStatut : VALIDÉE (Conforme)", align='C')
-    pdf.ln(10)
-    pdf.set_fill_color(200, 220, 255)
-    pdf.set_font("Helvetica", 'B', 10)
-    pdf.cell(90, 10, "Matériel", 1, 0, 'C', True)
-    pdf.cell(30, 10, "Tiroir", 1, 0, 'C', True)
-    pdf.cell(30, 10, "Dotation", 1, 0, 'C', True)
-    pdf.cell(30, 10, "État", 1, 1, 'C', True)
-    pdf.set_font("Helvetica", size=9)
-    for item in data_checklist:
-        nom = str(item.get('Nom', '')).encode('latin-1', 'replace').decode('latin-1')
-        pdf.cell(90, 8, nom, 1)
-        pdf.cell(30, 8, str(item.get('Tiroir', '')), 1, 0, 'C')
-        pdf.cell(30, 8, str(item.get('Dotation', '')), 1, 0, 'C')
-        pdf.cell(30, 8, "[X] OK", 1, 1, 'C')
-    
-    pdf.ln(5)
-    pdf.set_font("Helvetica", 'B', 9)
-    pdf.cell(0, 8, "Sécurité : Tiroirs verrouillés + Clé/Ciseaux attachés [X] OUI", 0, 1, 'L')
-    
-    pdf_str = pdf.output(dest='S')
-    if isinstance(pdf_str, str): return pdf_str.encode('latin-1', 'replace')
-    return bytes(pdf_str)
+    import pdf_checklist  # fpdf n'est chargé qu'à la première génération de PDF
+    return pdf_checklist.generer(data_checklist, user, date_check)
+
+@mesures.cache_data(max_entries=32)
+def get_pdf_checklist(doc_id, empreinte, _contenu, _user, _date):
+    """PDF d'une checkliste archivée, adressé par (ID, empreinte du contenu) : un seul rendu par version"""
+    return generer_pdf_checklist(_contenu, _user, _date)
+
+def pdf_archive(c):
+    import pdf_checklist
+    contenu, user, date = c.get('Contenu', []), c.get('Utilisateur'), c.get('Date')
+    return get_pdf_checklist(c.get('id_doc'), pdf_checklist.empreinte(contenu, user, date), contenu, user, date)
+
+@st.cache_resource
+def get_pool_pdf():
+    """Processus de rendu des exports par lot (spawn : on ne forke pas un serveur plein de threads)"""
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    return ProcessPoolExecutor(max_workers=min(4, os.cpu_count() or 1), mp_context=multiprocessing.get_context("spawn"))
+
+def exporter_checklists(pool, dbc, debut, fin, format):
+    """Checklistes de [debut, fin) en un PDF ou un ZIP ; appelé au clic par le bouton de téléchargement, hors du rerun"""
+    import echanges, pdf_checklist
+    try:
+        checks = [{**d, 'id_doc': doc_id} for page in echanges.pages(dbc, "CHECKLISTS", 500, debut, fin) for doc_id, d in page]
+        tampon = io.BytesIO()
+        pdf_checklist.exporter_lot(checks, tampon, format, pool)
+        return tampon.getvalue()
+    except Exception as e:
+        print("Erreur export checklistes:", e)
+        raise
 
 # --- AUTHENTIFICATION ROBUSTE ---
+@st.cache_resource
+def get_index_comptes():
+    """Index identifiant -> compte, partagé par toutes les sessions (TTL 5 min)"""
+    return comptes.IndexAlias(db, ttl=300)
+
 def check_login(username, password):
-    if db is None: return None, "DB_NONE"
-    if not username: return None, "Vide"
+    if not db: return None, None, "DB_NONE"
+    if not username: return None, None, "Vide"
     try:
-        u, p = str(username).strip(), str(password).strip()
-        user_doc, user_data = None, {}
-        
-        # 1. ID Doc
-        doc = db.collection("UTILISATEURS").document(u).get()
-        if doc.exists:
-            user_doc, user_data = doc, doc.to_dict()
-        else:
-            # 2. Username
-            docs = list(db.collection("UTILISATEURS").where("username", "==", u).limit(1).stream())
-            if docs:
-                user_doc, user_data = docs[0], docs[0].to_dict()
-            else:
-                # 3. Identifiant
-                docs = list(db.collection("UTILISATEURS").where("identifiant", "==", u).limit(1).stream())
-                if docs: user_doc, user_data = docs[0], docs[0].to_dict()
-        
-        if not user_doc: return None, "Utilisateur introuvable"
-        
-        # Recherche mot de passe flexible
-        pwd_db = ""
-        for champ in ["password", "mdp", "pass", "code", "motdepasse"]:
-            if champ in user_data:
-                pwd_db = str(user_data[champ]).strip()
-                break
-        
-        if pwd_db == p: return user_data, None
-        return None, "Mot de passe incorrect"
+        return comptes.authentifier(db, get_index_comptes(), username, password)
     except Exception as e:
-        return None, str(e)
+        return None, None, str(e)
 
 def login_page():
     st.markdown("<h1 style='text-align: center;'>🚑 Chariot Urgence</h1>", unsafe_allow_html=True)
-    if db is None:
-        st.error("Base de données non connectée.")
+    # Connexion encore en cours : le formulaire s'affiche quand même, la validation attendra
+    if db.pret() and not db:
+        st.error(db.erreur or "Base de données non connectée.")
         st.stop()
     
     c1, c2, c3 = st.columns([1, 2, 1])
@@ -367,26 +659,116 @@ def login_page():
             user_id = st.text_input("Identifiant")
             pwd = st.text_input("Mot de passe", type="password")
             if st.form_submit_button("SE CONNECTER", type="primary"):
-                user_info, err = check_login(user_id, pwd)
-                if user_info:
+                id_compte, user_info, err = check_login(user_id, pwd)
+                if user_info is not None:
                     st.session_state['logged_in'] = True
-                    st.session_state['user_id'] = str(user_id).strip()
+                    # ID canonique du compte, quel que soit l'identifiant saisi
+                    st.session_state['user_id'] = id_compte
                     display = f"{user_info.get('prenom','')} {user_info.get('nom','')}".strip()
-                    st.session_state['user'] = display or str(user_id).strip()
+                    st.session_state['user'] = display or id_compte
                     st.session_state['role'] = user_info.get('role', 'Utilisateur')
+                    st.session_state['chariot'] = user_info.get('chariot') or chariots.DEFAUT
                     st.rerun()
                 else:
                     st.error(f"Erreur : {err}")
+    # Formulaire déjà envoyé au navigateur : pandas se charge pendant que l'utilisateur tape
+    prechauffer()
 
 # --- INTERFACES ---
-def maj_panier():
-    for key in list(st.session_state.keys()):
-        if key.startswith("input_"):
-            item_id = key.replace("input_", "", 1)
-            try: qty = int(st.session_state.get(key, 0))
-            except: qty = 0
-            if qty > 0: st.session_state['panier'][item_id] = qty
-            elif item_id in st.session_state['panier']: del st.session_state['panier'][item_id]
+@st.fragment(run_every=5)
+def surveiller_inventaire():
+    """Relance la page quand la réplique a reçu des changements (autre session, autre poste)."""
+    if not db: return
+    version = get_replica_inventaire(chariot_courant()).version
+    vue = st.session_state.get('inventaire_version')
+    st.session_state['inventaire_version'] = version
+    if vue is not None and vue != version:
+        st.rerun()
+
+def maj_panier(item_id):
+    # Mise à jour O(1) de la seule ligne modifiée
+    try: qty = int(st.session_state.get(f"input_{item_id}", 0))
+    except: qty = 0
+    if qty > 0: st.session_state['panier'][item_id] = qty
+    else: st.session_state['panier'].pop(item_id, None)
+    # Seul le bandeau panier est redessiné : la ligne est déjà à jour côté navigateur
+    st.rerun("panier")
+
+def vider_panier():
+    for item_id in st.session_state['panier']:
+        st.session_state.pop(f"input_{item_id}", None)
+    st.session_state['panier'] = {}
+    st.session_state.pop('cle_panier', None)
+
+# --- ÉCRITURES EN ARRIÈRE-PLAN (VUE DE LA SESSION) ---
+def annoncer(message, icone="✅"):
+    """Toast affiché au rendu suivant (celui d'avant un st.rerun() serait perdu)"""
+    st.session_state.setdefault('toasts', []).append((message, icone))
+
+def afficher_toasts():
+    for message, icone in st.session_state.pop('toasts', []):
+        st.toast(message, icon=icone)
+
+def suivre_ecriture(libelle, futur, cle=None, optimiste=None):
+    """Écriture en cours de la session : vue optimiste en attendant, toast quand elle aboutit"""
+    chariot = chariot_courant()
+    st.session_state.setdefault('ecritures', []).append({
+        "libelle": libelle, "futur": futur, "cle": cle, "optimiste": optimiste or {}, "chariot": chariot,
+        "version": get_replica_inventaire(chariot).version, "notifie": False, "signale": False
+    })
+
+def notifier_ecritures():
+    """Toasts de fin (ou de retard réseau) ; oublie les écritures devenues visibles"""
+    restantes = []
+    for e in st.session_state.get('ecritures', []):
+        f = e['futur']
+        replica = get_replica_inventaire(e['chariot'])
+        if f.done() and not e['notifie']:
+            e['notifie'] = True
+            if f.exception() is None and f.result() is not False: st.toast(f"{e['libelle']} : synchronisé", icon="✅")
+            else: st.toast(f"{e['libelle']} : échec de l'enregistrement", icon="❌")
+        elif not f.done() and e['cle'] and not e['signale'] and get_journal().erreur(e['cle']):
+            e['signale'] = True
+            st.toast(f"{e['libelle']} : réseau indisponible, nouvel essai automatique", icon="⏳")
+        # Le décrément optimiste reste affiché tant que la réplique n'a pas reçu l'écriture (jamais, si elle a échoué)
+        echec = f.done() and (f.exception() is not None or f.result() is False)
+        visible = echec or not e['optimiste'].get('stock') or replica.version > e['version'] or not replica.pret()
+        if not (e['notifie'] and visible): restantes.append(e)
+    st.session_state['ecritures'] = restantes
+
+def stock_optimiste():
+    """{ID: quantité} consommée par la session et pas encore visible dans la réplique"""
+    deltas = Counter()
+    for e in st.session_state.get('ecritures', []):
+        if e['chariot'] == chariot_courant(): deltas.update(e['optimiste'].get('stock', {}))
+    return deltas
+
+def vue_optimiste(lignes, deltas):
+    if not deltas: return lignes
+    return [dict(r, Stock_Actuel=max(0, int(r['Stock_Actuel']) - deltas[r['ID']])) if r['ID'] in deltas else r for r in lignes]
+
+def logs_optimistes(logs):
+    """Masque les lignes (ou dossiers) dont le remplacement est en cours de synchronisation"""
+    masques = {}
+    for e in st.session_state.get('ecritures', []):
+        if e['futur'].done(): continue
+        for log_id, items in e['optimiste'].get('logs', {}).items():
+            if items is None or masques.get(log_id, set()) is None: masques[log_id] = None
+            else: masques[log_id] = masques.get(log_id, set()) | set(items)
+    if not masques: return logs
+    out = []
+    for l in logs:
+        if l['id_doc'] not in masques: out.append(l); continue
+        items = masques[l['id_doc']]
+        if items is None: continue
+        details = [dict(i, EstRemplace=True) if i.get('ID') in items else i for i in l.get('Details_Struct', [])]
+        if all(i.get('EstRemplace') for i in details if i.get('ID')): continue
+        out.append(dict(l, Details_Struct=details))
+    return out
+
+def limite_peremption(jours=JOURS_PEREMPTION):
+    """Date ISO au-delà de laquelle un lot ne « périme pas bientôt »"""
+    return (datetime.now() + timedelta(days=jours)).date().isoformat()
 
 def afficher_ligne_conso(row):
     try: s, d = int(row.get('Stock_Actuel', 0)), int(row.get('Dotation', 0))
@@ -395,57 +777,86 @@ def afficher_ligne_conso(row):
     
     with st.container(border=True):
         c1, c2, c3, c4 = st.columns([3, 1, 0.3, 1.5])
-        c1.markdown(f"**{row.get('Nom', 'Inconnu')}**")
+        per = row.get('Peremption')
+        alerte = f" · :orange[⏳ {per[8:10]}/{per[5:7]}/{per[:4]}]" if per and per <= limite_peremption() else ""
+        c1.markdown(f"**{row.get('Nom', 'Inconnu')}**{alerte}")
         c2.markdown(f":{color}[**{s}/{d}**]")
         c3.markdown("📉")
         curr = st.session_state['panier'].get(row['ID'], 0)
         st.number_input("Qté", min_value=0, max_value=max(s, 0), value=min(curr, max(s, 0)), 
-                        key=f"input_{row['ID']}", label_visibility="collapsed", on_change=maj_panier, step=1)
+                        key=f"input_{row['ID']}", label_visibility="collapsed",
+                        on_change=maj_panier, args=(row['ID'],), step=1)
+
+@st.fragment(key="panier")
+def afficher_panier():
+    if not st.session_state.get('panier'): return
+    st.markdown(f"""<div class="panier-box">🛒 PANIER : {sum(st.session_state['panier'].values())}</div>""", unsafe_allow_html=True)
+    with st.expander("✅ VALIDER", expanded=True):
+        ip = st.text_input("🏥 IP PATIENT")
+        user_f = st.session_state['user']
+        if st.session_state.get('user_id') in SHARED_ACCOUNTS:
+            user_f = st.text_input("👤 Votre Nom (Obligatoire)", key="u_conso")
+        
+        c1, c2 = st.columns([2, 1])
+        if c1.button("🚀 ENREGISTRER", type="primary"):
+            if ip and user_f:
+                # Même clé tant que le panier n'est pas vidé : un double clic ne journalise qu'une fois
+                cle = st.session_state.setdefault('cle_panier', journal.nouvelle_cle())
+                panier = dict(st.session_state['panier'])
+                if valider_panier(panier, ip, user_f, cle):
+                    suivre_ecriture(f"Consommation {ip}", get_journal().suivre(cle), cle, {"stock": panier})
+                    vider_panier()
+                    annoncer("Enregistré !"); st.rerun()
+                else: st.error("Erreur technique.")
+            else: st.error("IP et Nom obligatoires.")
+        if c2.button("🗑️ Vider"):
+            vider_panier(); st.rerun()
+
+@st.fragment
+def liste_conso(titre, lignes, n_sous_dotation=0, n_peremption=0):
+    # Un fragment par tiroir : ses widgets ne relancent jamais toute la page
+    if titre is None:
+        for r in lignes: afficher_ligne_conso(r)
+        return
+    badge = f" · 🔴 {n_sous_dotation}" if n_sous_dotation else ""
+    if n_peremption: badge += f" · ⏳ {n_peremption}"
+    with st.expander(f"🗄️ {titre}{badge}"):
+        for r in lignes: afficher_ligne_conso(r)
 
 def interface_consommateur():
     st.header("💊 Consommation")
-    df = get_inventaire_cached() # UTILISE LE CACHE
-    if df.empty:
+    surveiller_inventaire()
+    snap = get_inventaire_snapshot() # UTILISE LA RÉPLIQUE
+    if snap.empty:
         st.info("Inventaire vide ou erreur lecture.")
         return
+    deltas = stock_optimiste()
 
-    if st.session_state.get('panier'):
-        st.markdown(f"""<div class="panier-box">🛒 PANIER : {sum(st.session_state['panier'].values())}</div>""", unsafe_allow_html=True)
-        with st.expander("✅ VALIDER", expanded=True):
-            ip = st.text_input("🏥 IP PATIENT")
-            user_f = st.session_state['user']
-            if st.session_state.get('user_id') in SHARED_ACCOUNTS:
-                user_f = st.text_input("👤 Votre Nom (Obligatoire)", key="u_conso")
-            
-            c1, c2 = st.columns([2, 1])
-            if c1.button("🚀 ENREGISTRER", type="primary"):
-                if ip and user_f:
-                    if valider_panier(st.session_state['panier'], ip, user_f):
-                        st.session_state['panier'] = {}
-                        st.success("Enregistré !"); time.sleep(0.5); st.rerun()
-                    else: st.error("Erreur technique.")
-                else: st.error("IP et Nom obligatoires.")
-            if c2.button("🗑️ Vider"):
-                st.session_state['panier'] = {}; st.rerun()
+    afficher_panier()
 
     rech = st.text_input("🔍 Rechercher...")
     if rech:
-        for _, r in df[df['Nom'].astype(str).str.contains(rech, case=False, na=False)].iterrows(): afficher_ligne_conso(r)
+        ids = get_index_recherche(snap).chercher(rech, limite=100)
+        liste_conso(None, vue_optimiste([snap.ligne(i) for i in ids if snap.ligne(i) is not None], deltas))
     else:
-        for t in ["Dessus", "Tiroir 1", "Tiroir 2", "Tiroir 3", "Tiroir 4", "Tiroir 5"]:
-            sub = df[df['Tiroir'] == t]
-            if not sub.empty:
-                with st.expander(f"🗄️ {t}"):
-                    for _, r in sub.iterrows(): afficher_ligne_conso(r)
+        limite = limite_peremption()
+        for t in snap.tiroirs:
+            liste_conso(t, vue_optimiste(snap.lignes_tiroir(t), deltas), snap.sous_dotation_tiroir(t),
+                        snap.peremptions_tiroir(t, limite))
 
 def interface_remplacement():
     st.header("🔄 Remplacer")
-    data_logs = get_logs_remplacement_cached() # UTILISE LE CACHE
+    data_logs = logs_optimistes(get_logs_remplacement_cached(chariot_courant(), version_cache(cache.LOGS_OUVERTS))) # UTILISE LE CACHE
     
     if not data_logs:
         st.success("Tout est à jour ! (Aucun produit manquant)")
         return
 
+    mode = st.radio("Vue", ["Par dossier", "Tout remplacer"], horizontal=True, key="mode_rempl", label_visibility="collapsed")
+    if mode == "Tout remplacer":
+        interface_remplacement_global(data_logs)
+        return
+
     for l in data_logs:
         log_id = l['id_doc']
         d_str = l.get('Date').strftime("%d/%m %H:%M") if l.get('Date') else "?"
@@ -453,25 +864,87 @@ def interface_remplacement():
         with st.container(border=True):
             st.markdown(f"📅 **{d_str}** | 👤 {l.get('Utilisateur')} | IP: **{l.get('IP_Patient')}**")
             with st.form(key=f"f_{log_id}"):
-                to_repl = []
+                to_repl, lots_repl = [], {}
                 for item in l.get('Details_Struct', []):
                     nom = f"{item.get('Qte')}x {item.get('Nom')}"
                     if item.get('EstRemplace'): st.markdown(f"~~✅ {nom}~~")
                     else:
-                        if st.checkbox(f"🔴 {nom}", key=f"c_{log_id}_{item.get('ID')}"): to_repl.append(item.get('ID'))
+                        c1, c2, c3 = st.columns([3, 1.2, 1.3])
+                        coche = c1.checkbox(f"🔴 {nom}", key=f"c_{log_id}_{item.get('ID')}")
+                        # Lot et péremption du matériel remis (facultatifs)
+                        num = c2.text_input("Lot", key=f"lot_{log_id}_{item.get('ID')}", placeholder="Lot", label_visibility="collapsed")
+                        per = c3.date_input("Péremption", value=None, key=f"per_{log_id}_{item.get('ID')}", format="DD/MM/YYYY", label_visibility="collapsed")
+                        if coche:
+                            to_repl.append(item.get('ID'))
+                            if per: lots_repl[item.get('ID')] = {"Lot": num.strip(), "Peremption": per.isoformat()}
                 
                 uf = st.session_state['user']
                 if st.session_state.get('user_id') in SHARED_ACCOUNTS: uf = st.text_input("Votre Nom", key=f"ur_{log_id}")
                 
                 if st.form_submit_button("💾 Valider Remplacement"):
                     if to_repl and uf:
-                        effectuer_remplacement_partiel(log_id, l, to_repl, uf)
-                        st.success("Enregistré"); time.sleep(0.5); st.rerun()
+                        cle = effectuer_remplacement_partiel(log_id, to_repl, uf, lots_repl)
+                        if cle:
+                            suivre_ecriture(f"Remplacement {l.get('IP_Patient')}", get_journal().suivre(cle), cle, {"logs": {log_id: to_repl}})
+                            annoncer("Enregistré"); st.rerun()
+                        else: st.error("Erreur technique.")
                     else: st.warning("Cochez des items et mettez votre nom.")
 
+def interface_remplacement_global(data_logs):
+    import pandas as pd
+    pick = agreger_remplacements(data_logs)
+    st.markdown(f"**{sum(r['Qte'] for r in pick)} unités** à remettre : {len(pick)} articles, {len(data_logs)} dossiers")
+    df = pd.DataFrame(pick)
+    for t, sub in df.groupby('Tiroir', sort=True):
+        with st.expander(f"🗄️ {t} ({int(sub['Qte'].sum())})", expanded=True):
+            st.dataframe(sub[["Nom", "Qte", "Dossiers"]], hide_index=True, use_container_width=True)
+
+    with st.form(key="f_tout"):
+        uf = st.session_state['user']
+        if st.session_state.get('user_id') in SHARED_ACCOUNTS: uf = st.text_input("Votre Nom", key="ur_tout")
+        if st.form_submit_button("✅ Tout remplacer", type="primary"):
+            if uf:
+                ids = [l['id_doc'] for l in data_logs]
+                suivre_ecriture("Remplacement global", get_executeur().submit(remplacer_tout, chariot_courant(), ids, uf),
+                                optimiste={"logs": dict.fromkeys(ids)})
+                annoncer("Remplacement lancé", "🔄"); st.rerun()
+            else: st.warning("Mettez votre nom.")
+
+def filtres_historique():
+    with st.expander("🔎 Filtres"):
+        c1, c2, c3 = st.columns([2, 2, 1])
+        periode = c1.date_input("Période", value=(), format="DD/MM/YYYY", key="h_periode")
+        statut = c2.selectbox("Statut", ["Tous", "Non remplacé", "Remplacé"], key="h_statut")
+        taille = c3.selectbox("Par page", [25, 50, 100], index=1, key="h_taille")
+        c4, c5 = st.columns(2)
+        user = c4.text_input("Utilisateur (exact)", key="h_user").strip()
+        ip = c5.text_input("IP Patient (exacte)", key="h_ip").strip()
+    debut = fin = None
+    if len(periode) >= 1:
+        debut = datetime.combine(periode[0], datetime.min.time())
+        fin = datetime.combine(periode[-1], datetime.min.time()) + timedelta(days=1)
+    return taille, debut, fin, user or None, ip or None, (None if statut == "Tous" else statut)
+
 def interface_historique():
+    import pandas as pd
     st.header("📜 Historique Global")
-    raw_data = get_historique_cached(50) # UTILISE LE CACHE
+    taille, *filtres = filtres_historique()
+    # Pile des curseurs : un par page déjà vue, remise à zéro si les filtres changent
+    if st.session_state.get('h_filtres') != (taille, *filtres):
+        st.session_state['h_filtres'] = (taille, *filtres)
+        st.session_state['h_curseurs'] = [None]
+    curseurs = st.session_state['h_curseurs']
+
+    versions = (version_cache(cache.LOGS_HISTORIQUE), version_cache(cache.ARCHIVES))
+    raw_data, suivant = get_historique_page(chariot_courant(), versions, taille, curseurs[-1], *filtres) # UTILISE LE CACHE
+
+    c1, c2, c3 = st.columns([1, 2, 1])
+    if c1.button("◀ Précédent", disabled=len(curseurs) == 1):
+        curseurs.pop(); st.rerun()
+    c2.markdown(f"<p style='text-align: center;'>Page {len(curseurs)}</p>", unsafe_allow_html=True)
+    if c3.button("Suivant ▶", disabled=suivant is None):
+        curseurs.append(suivant); st.rerun()
+
     if not raw_data:
         st.info("Aucun historique.")
         return
@@ -481,22 +954,22 @@ def interface_historique():
         det = ", ".join([f"{i.get('Qte')}x {i.get('Nom')}" for i in l.get('Details_Struct', [])])
         st_txt = "🟢 Remplacé" if "Remplac" in l.get('Statut','') else "🟠 En cours"
         clean_data.append({
-            "Date": l.get('Date').strftime("%d/%m %H:%M") if l.get('Date') else "?",
+            "Date": l.get('Date').strftime("%d/%m/%y %H:%M") if l.get('Date') else "?",
             "User": l.get('Utilisateur'), "IP": l.get('IP_Patient'),
-            "Details": det, "Statut": st_txt, "ID": l['id_doc'], "Suppr": False
+            "Details": det, "Statut": st_txt, "ID": l['id_doc'], "Archive": l.get('archive'), "Suppr": False
         })
     
     df = pd.DataFrame(clean_data)
-    cfg = {"Details": st.column_config.TextColumn("Détail", width="large"), "ID": None}
+    cfg = {"Details": st.column_config.TextColumn("Détail", width="large"), "ID": None, "Archive": None}
     
     if st.session_state.get('user_id') == 'admin':
         res = st.data_editor(df, column_config=cfg, hide_index=True, use_container_width=True, disabled=["Date","User","IP","Details","Statut"])
         to_del = res[res["Suppr"] == True]
         if not to_del.empty and st.button("Confirmer Suppression"):
-            for _, r in to_del.iterrows(): supprimer_log(r['ID'])
+            for _, r in to_del.iterrows(): supprimer_log(r['ID'], r['Archive'])
             st.rerun()
     else:
-        st.dataframe(df.drop(columns=["Suppr", "ID"]), column_config=cfg, hide_index=True, use_container_width=True)
+        st.dataframe(df.drop(columns=["Suppr", "ID", "Archive"]), column_config=cfg, hide_index=True, use_container_width=True)
 
 def interface_checklist():
     st.header("📋 Checkliste")
@@ -504,40 +977,65 @@ def interface_checklist():
     # Historique Checklists
     if db:
         try:
-            # On lit l'historique direct (faible volume)
-            checks = list(db.collection("CHECKLISTS").order_by("Date", direction=firestore.Query.DESCENDING).limit(5).stream())
+            checks = get_checklists_cached(chariot_courant(), version_cache(cache.CHECKLISTS), 5) # UTILISE LE CACHE
             if checks:
-                opts = [f"{c.to_dict().get('Date').strftime('%d/%m %H:%M')} - {c.to_dict().get('Utilisateur')}" for c in checks]
+                opts = [f"{c.get('Date').strftime('%d/%m %H:%M')} - {c.get('Utilisateur')}" for c in checks]
                 sel = st.selectbox("Archives", opts)
                 if st.button("📄 PDF Archive"):
                     idx = opts.index(sel)
-                    d = checks[idx].to_dict()
-                    pdf = generer_pdf_checklist(d.get('Contenu',[]), d.get('Utilisateur'), d.get('Date'))
+                    d = get_checklist_cached(chariot_courant(), version_cache(cache.CHECKLISTS), checks[idx]['id_doc'])
+                    pdf = pdf_archive(d)
                     st.download_button("Télécharger", data=pdf, file_name="Arch.pdf", mime="application/pdf")
+            with st.expander("📚 Checklistes d'un mois (inspection)"):
+                c1, c2 = st.columns(2)
+                premier = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+                mois = [premier]
+                for _ in range(11): mois.append((mois[-1] - timedelta(days=1)).replace(day=1))
+                debut = c1.selectbox("Mois", mois, format_func=lambda m: m.strftime("%m/%Y"), key="lot_mois")
+                fmt = c2.radio("Format", ["pdf", "zip"], format_func=lambda f: "PDF unique" if f == "pdf" else "ZIP (un PDF par checkliste)", key="lot_fmt")
+                fin = (debut + timedelta(days=32)).replace(day=1)
+                pool, dbc = get_pool_pdf(), db_chariot(chariot_courant())
+                # Rendu lancé au clic, dans le pool de processus : le rerun n'attend pas
+                st.download_button(f"📥 Checklistes {debut:%m/%Y}", data=lambda: exporter_checklists(pool, dbc, debut, fin, fmt),
+                                   file_name=f"Checklistes_{debut:%Y_%m}.{fmt}", mime="application/pdf" if fmt == "pdf" else "application/zip")
         except: pass
 
     st.divider()
     # Blocage si stock pas à jour
-    logs_missing = get_logs_remplacement_cached()
+    logs_missing = get_logs_remplacement_cached(chariot_courant(), version_cache(cache.LOGS_OUVERTS))
     if logs_missing:
         st.error(f"⛔ Impossible : Il reste {len(logs_missing)} dossiers de consommation non remplacés.")
         return
 
-    df = get_inventaire_cached()
-    if df.empty: return
+    surveiller_inventaire()
+    snap = get_inventaire_snapshot()
+    if snap.empty: return
+
+    with st.expander("⏳ Péremptions à venir"):
+        jours = st.number_input("Dans les prochains (jours)", min_value=0, max_value=730, value=JOURS_PEREMPTION, step=15, key="per_jours")
+        proches = snap.peremptions(limite_peremption(jours))
+        if proches:
+            st.dataframe(proches, column_order=["Peremption", "Nom", "Tiroir", "Lot", "Qte"], hide_index=True, use_container_width=True)
+        else: st.caption("Aucun lot ne périme sur la période.")
+
+    # La revue complète reste le défaut : « Écarts seulement » tient pour conformes les articles sans écart enregistré
+    mode = st.radio("Mode", ["Complète", "Écarts seulement"], horizontal=True, key="chk_mode", label_visibility="collapsed")
+    if mode == "Écarts seulement":
+        checklist_ecarts(snap)
+        return
 
     # Logique de validation par lots
-    for t in ["Dessus", "Tiroir 1", "Tiroir 2", "Tiroir 3", "Tiroir 4", "Tiroir 5"]:
-        sub = df[df['Tiroir'] == t]
-        if not sub.empty:
+    for t in snap.tiroirs:
+        sub = snap.lignes_tiroir(t)
+        if sub:
             with st.expander(f"🗄️ {t}", expanded=True):
                 if st.button(f"✅ Valider {t}", key=f"b_{t}"):
-                    for _, r in sub.iterrows():
+                    for r in sub:
                         st.session_state['check_state'][r['ID']] = "OK"
                         st.session_state[f"rad_{r['ID']}"] = "Conforme"
                     st.rerun()
                 
-                for _, r in sub.iterrows():
+                for r in sub:
                     c1, c2, c3 = st.columns([3, 1, 2])
                     c1.markdown(f"**{r['Nom']}**")
                     c2.markdown(f"Dot: {r['Dotation']}")
@@ -553,10 +1051,73 @@ def interface_checklist():
                         st.session_state['check_state'][r['ID']] = "OK"
 
     # Validation Finale
-    all_ids = df['ID'].tolist()
+    all_ids = snap.ids
     missing = sum(1 for i in all_ids if st.session_state['check_state'].get(i) == "KO")
     pending = sum(1 for i in all_ids if st.session_state['check_state'].get(i) not in ["OK", "KO"])
+    validation_checklist(snap, pending, missing)
+
+# --- CHECKLISTE PAR ÉCARTS ---
+# Les articles sans écart (stock = dotation, pas de péremption proche) sont conformes d'office ;
+# seuls les écarts sont affichés, et les compteurs par tiroir suivent les clics au lieu d'être recomptés.
+def compteurs_ecarts(snap, ecarts, limite):
+    """Compteurs {tiroir: {"OK", "KO"}} des écarts déjà vus, recalculés seulement quand le précontrôle change"""
+    cle = (chariot_courant(), snap.version, limite)
+    if st.session_state.get('chk_ecarts') != cle:
+        etat = st.session_state['check_state']
+        st.session_state['chk_ecarts'] = cle
+        st.session_state['chk_compteurs'] = {t: {"OK": sum(etat.get(i) == "OK" for i in ids), "KO": sum(etat.get(i) == "KO" for i in ids)}
+                                             for t, ids in ecarts.items()}
+    return st.session_state['chk_compteurs']
+
+def noter_ecart(item_id, tiroir, statut):
+    etat, compteurs = st.session_state['check_state'], st.session_state['chk_compteurs']
+    ancien = etat.get(item_id)
+    if ancien == statut: return
+    if ancien in ("OK", "KO"): compteurs[tiroir][ancien] -= 1
+    compteurs[tiroir][statut] += 1
+    etat[item_id] = statut
+
+def choix_ecart(item_id, tiroir):
+    noter_ecart(item_id, tiroir, "OK" if st.session_state[f"ecart_{item_id}"] == "Conforme" else "KO")
 
+def valider_ecarts_tiroir(ids, tiroir):
+    for i in ids:
+        noter_ecart(i, tiroir, "OK")
+        st.session_state[f"ecart_{i}"] = "Conforme"
+
+@st.fragment(key="checkliste")
+def checklist_ecarts(snap):
+    # Fragment : un choix ne redessine que les écarts, pas toute la page
+    limite = limite_peremption()
+    ecarts, tailles = snap.controle(limite)
+    compteurs = compteurs_ecarts(snap, ecarts, limite)
+    etat = st.session_state['check_state']
+    for t in snap.tiroirs:
+        ids, c = ecarts[t], compteurs[t]
+        if not ids:
+            st.markdown(f"🗄️ **{t}** : ✅ {tailles[t]} conformes")
+            continue
+        badge = f" · 🔴 {c['KO']}" if c['KO'] else ""
+        with st.expander(f"🗄️ {t} : {tailles[t] - len(ids)} conformes · {c['OK'] + c['KO']}/{len(ids)} écarts vus{badge}",
+                         expanded=c['OK'] + c['KO'] < len(ids)):
+            st.button(f"✅ Valider {t}", key=f"be_{t}", on_click=valider_ecarts_tiroir, args=(ids, t))
+            for i in ids:
+                r = snap.ligne(i)
+                per = r.get('Peremption')
+                motifs = [f"Stock {r['Stock_Actuel']}/{r['Dotation']}"] if r['Stock_Actuel'] < r['Dotation'] else []
+                if per and per <= limite: motifs.append(f"⏳ {per[8:10]}/{per[5:7]}/{per[:4]}")
+                c1, c2, c3 = st.columns([3, 1.5, 2])
+                c1.markdown(f"**{r['Nom']}**")
+                c2.markdown(" · ".join(motifs))
+                idx = {"OK": 0, "KO": 1}.get(etat.get(i))
+                c3.radio(f"e_{i}", ["Conforme", "Manquant"], index=idx, key=f"ecart_{i}", horizontal=True,
+                         label_visibility="collapsed", on_change=choix_ecart, args=(i, t))
+
+    missing = sum(c['KO'] for c in compteurs.values())
+    pending = sum(len(ids) for ids in ecarts.values()) - missing - sum(c['OK'] for c in compteurs.values())
+    validation_checklist(snap, pending, missing)
+
+def validation_checklist(snap, pending, missing):
     st.divider()
     if pending == 0 and missing == 0:
         st.markdown("<div class='security-box'><h5>🔒 Sécurisation</h5>", unsafe_allow_html=True)
@@ -569,8 +1130,10 @@ def interface_checklist():
             
             if st.button("💾 VALIDER ET TERMINER", type="primary"):
                 if uf:
-                    export = [{"Nom": r['Nom'], "Tiroir": r['Tiroir'], "Dotation": r['Dotation']} for _, r in df.iterrows()]
-                    save_checklist_history(uf, export)
+                    export = [{"ID": r['ID'], "Nom": r['Nom'], "Tiroir": r['Tiroir'], "Dotation": r['Dotation'],
+                               **({"Peremption": r['Peremption']} if r.get('Peremption') else {})} for r in snap.lignes]
+                    cle = save_checklist_history(uf, export)
+                    if cle: suivre_ecriture("Checkliste", get_journal().suivre(cle), cle)
                     st.session_state['pdf_ready'] = generer_pdf_checklist(export, uf, datetime.now())
                     st.success("Validé !"); st.balloons(); st.rerun()
                 else: st.error("Nom requis")
@@ -581,31 +1144,230 @@ def interface_checklist():
         if pending > 0: st.warning(f"Reste à voir : {pending}")
         if missing > 0: st.error(f"Manquants : {missing}")
 
+def interface_statistiques():
+    import pandas as pd
+    st.header("📊 Statistiques")
+    vue = st.radio("Période", ["30 derniers jours", "12 derniers mois"], horizontal=True, key="stats_vue")
+    par_mois = vue.startswith("12")
+    docs = get_stats_cached(chariot_courant(), version_cache(cache.STATS), "mois" if par_mois else "jour", datetime.now().date()) # UTILISE LE CACHE
+    if not any(d.get('Nb_Consommations') for d in docs):
+        st.info("Aucune consommation sur la période (historique antérieur : `python statistiques.py backfill`).")
+        return
+
+    conso = statistiques.tableau(docs, "Conso_Articles")
+    nb_jours = (datetime.now().date() - datetime.strptime(docs[0]['Libelle'], "%Y-%m").date()).days + 1 if par_mois else len(docs)
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Consommations", int(sum(d.get('Nb_Consommations', 0) for d in docs)))
+    c2.metric("Unités consommées", int(conso.to_numpy().sum()))
+    n_rempl = sum(d.get('Nb_Lignes_Remplacees', 0) for d in docs)
+    delai = sum(d.get('Delai_Remplacement_h', 0) for d in docs) / n_rempl if n_rempl else None
+    c3.metric("Délai moyen de remplacement", f"{delai:.1f} h" if delai is not None else "-")
+
+    st.subheader("Consommation par période")
+    st.bar_chart(conso.sum(axis=1).rename("Unités"))
+
+    st.subheader("Articles les plus consommés")
+    snap = get_inventaire_snapshot()
+    totaux = conso.sum().sort_values(ascending=False).head(15)
+    top = pd.DataFrame({
+        "Nom": [(snap.ligne(i) or {}).get('Nom', i) for i in totaux.index],
+        "Tiroir": [str((snap.ligne(i) or {}).get('Tiroir', '?')) for i in totaux.index],
+        "Total": totaux.astype(int).to_numpy(),
+        "Moyenne / jour": (totaux / max(nb_jours, 1)).round(2).to_numpy(),
+    })
+    st.dataframe(top, hide_index=True, use_container_width=True)
+
+    c1, c2 = st.columns(2)
+    with c1:
+        st.subheader("Par tiroir")
+        st.bar_chart(statistiques.tableau(docs, "Conso_Tiroirs").sum().rename("Unités"))
+    with c2:
+        st.subheader("Délai de remplacement (h)")
+        delais = pd.DataFrame.from_records(docs, columns=['Libelle', 'Delai_Remplacement_h', 'Nb_Lignes_Remplacees']).set_index('Libelle').fillna(0)
+        st.line_chart((delais['Delai_Remplacement_h'] / delais['Nb_Lignes_Remplacees'].where(delais['Nb_Lignes_Remplacees'] > 0)).rename("Heures"))
+
+def interface_echanges():
+    """Admin : import de l'inventaire (simulation puis application) et exports pour la pharmacie"""
+    import pandas as pd
+    import echanges
+    st.header("📦 Import / Export")
+    st.subheader("Importer l'inventaire")
+    st.caption("Colonnes : ID (obligatoire), Nom, Tiroir, Dotation, Stock_Actuel, Synonymes. Une cellule vide garde la valeur actuelle.")
+    fichier = st.file_uploader("Fichier", type=["csv", "xlsx", "parquet"], key="imp_fichier")
+    supprimer = st.checkbox("Supprimer les articles absents du fichier", key="imp_suppr")
+    if fichier is not None:
+        snap = get_inventaire_snapshot()
+        cle = (fichier.file_id, supprimer, snap.version)
+        # Simulation contre le snapshot de la réplique : aucune lecture, refaite seulement si le fichier ou l'inventaire change
+        if st.session_state.get('imp_cle') != cle:
+            try:
+                fichier.seek(0)
+                st.session_state['imp_rapport'] = echanges.importer_inventaire(db_chariot(chariot_courant()), fichier, actuel=snap.ligne, simulation=True, supprimer_absents=supprimer)
+            except Exception as e:
+                st.session_state['imp_rapport'] = {"echec": str(e)}
+            st.session_state['imp_cle'] = cle
+        r = st.session_state['imp_rapport']
+        if "echec" in r:
+            st.error(f"Fichier illisible : {r['echec']}")
+        else:
+            c1, c2, c3, c4, c5 = st.columns(5)
+            c1.metric("Créés", r['crees']); c2.metric("Modifiés", r['modifies']); c3.metric("Inchangés", r['inchanges'])
+            c4.metric("Supprimés", r['supprimes']); c5.metric("Erreurs", r['n_erreurs'])
+            if r['apercu']: st.dataframe(pd.DataFrame(r['apercu']).astype(str), hide_index=True, use_container_width=True)
+            if r['erreurs']: st.dataframe(pd.DataFrame(r['erreurs']), hide_index=True, use_container_width=True)
+            if r['crees'] + r['modifies'] + r['supprimes'] and st.button("✅ Appliquer l'import", type="primary"):
+                try:
+                    fichier.seek(0)
+                    res = echanges.importer_inventaire(db_chariot(chariot_courant()), fichier, actuel=snap.ligne, supprimer_absents=supprimer)
+                    invalider_cache(cache.INVENTAIRE)
+                    st.session_state.pop('imp_cle', None)
+                    annoncer(f"Inventaire importé : {res['ecritures']} écritures en {res['commits']} commits")
+                    st.rerun()
+                except Exception as e:
+                    print("Erreur import inventaire:", e)
+                    st.error(f"Erreur import : {e}")
+
+    st.divider()
+    st.subheader("Exporter")
+    c1, c2 = st.columns(2)
+    collection = c1.selectbox("Données", ["LOGS", "CHECKLISTS", "INVENTAIRE"], key="exp_coll")
+    fmt = c2.selectbox("Format", ["csv", "parquet"], key="exp_fmt")
+    depuis = jusqua = None
+    if collection != "INVENTAIRE":
+        c1, c2 = st.columns(2)
+        d1 = c1.date_input("Du", datetime.now().date() - timedelta(days=365), key="exp_du")
+        d2 = c2.date_input("Au (inclus)", datetime.now().date(), key="exp_au")
+        depuis, jusqua = datetime.combine(d1, datetime.min.time()), datetime.combine(d2 + timedelta(days=1), datetime.min.time())
+    st.caption("Chaque document exporté compte une lecture. Plusieurs années : `python echanges.py exporter LOGS logs.parquet`.")
+    if st.button("📤 Préparer l'export"):
+        try:
+            tampon = io.BytesIO()
+            res = echanges.exporter(db_chariot(chariot_courant()), collection, tampon, fmt, depuis=depuis, jusqua=jusqua)
+            st.session_state['exp_fichier'] = (f"{collection.lower()}_{chariot_courant()}_{datetime.now():%Y%m%d}.{fmt}", tampon.getvalue(), res)
+        except Exception as e:
+            print("Erreur export:", e)
+            st.error(f"Erreur export : {e}")
+    if st.session_state.get('exp_fichier'):
+        nom, donnees, res = st.session_state['exp_fichier']
+        st.download_button(f"💾 {nom} ({res['lignes']} lignes)", data=donnees, file_name=nom)
+
+@st.fragment(run_every=2)
+def afficher_synchro():
+    """Toasts des écritures de la session + compteur d'écritures du journal pas encore synchronisées"""
+    if not db: return
+    notifier_ecritures()
+    j = get_journal()
+    n = j.en_attente()
+    if n:
+        st.warning(f"⏳ {n} enregistrement(s) en attente de synchronisation")
+        err = j.derniere_erreur()
+        if err: st.caption(f"Dernier essai ({err[1]}) : {err[0][:120]}")
+    # Entrées abandonnées après journal.TENTATIVES_MAX essais : les suivantes du même log restent en attente
+    echecs = j.echecs()
+    if echecs:
+        st.error(f"❌ {len(echecs)} enregistrement(s) en échec, non synchronisé(s)")
+        with st.expander("Détail des échecs"):
+            for cle, type_op, cree, erreur in echecs:
+                st.caption(f"{datetime.fromtimestamp(cree):%d/%m %H:%M} · {type_op} · {(erreur or '')[:120]}")
+            if st.button("🔁 Rejouer", key="journal_rejouer"):
+                st.toast(f"{j.relancer()} enregistrement(s) relancé(s)", icon="🔁")
+
+def panneau_quota():
+    """Consommation Firestore du processus : totaux du jour face à l'offre gratuite, chemins les plus coûteux"""
+    import pandas as pd
+    m = mesures.MESURES
+    with st.expander("📈 Quota Firestore"):
+        jour = m.aujourdhui()
+        for cle, libelle in (("lectures", "Lectures"), ("ecritures", "Écritures"), ("suppressions", "Suppressions")):
+            n, quota = int(jour.get(cle, 0)), mesures.QUOTAS[cle]
+            st.progress(min(1.0, n / quota), text=f"{libelle} : {n:,} / {quota:,}".replace(",", " "))
+
+        chemins = m.par_chemin()
+        if chemins:
+            df = pd.DataFrame.from_dict(chemins, orient='index').fillna(0)
+            df = df.reindex(columns=["lectures", "ecritures", "appels", "ms"], fill_value=0)
+            df["ms"] = df["ms"].round(0)
+            st.caption("Chemins les plus coûteux")
+            st.dataframe(df.sort_values(["lectures", "ecritures"], ascending=False).head(8), use_container_width=True)
+
+        pages = m.par_page()
+        if pages:
+            st.caption("Par page")
+            st.dataframe(pd.DataFrame.from_dict(pages, orient='index').fillna(0)
+                         .reindex(columns=["lectures", "ecritures", "reruns"], fill_value=0), use_container_width=True)
+
+        cache_stats = {f: c for f, c in m.cache.items() if c['appels']}
+        if cache_stats:
+            st.caption("Cache (appels / calculs)")
+            st.write(", ".join(f"{f} : {c['appels']} / {c['calculs']}" for f, c in cache_stats.items()))
+
+        reruns = m.derniers_reruns(mesures._session_streamlit(), n=1)
+        if reruns:
+            r = reruns[-1]
+            st.caption(f"Dernier rerun ({r['page']}) : {r['ms']:.0f} ms, {int(r.get('lectures', 0))} lectures, "
+                       f"{int(r.get('ecritures', 0))} écritures, cache {int(r.get('cache_appels', 0))} / {int(r.get('cache_calculs', 0))}")
+
+        c1, c2 = st.columns(2)
+        c1.download_button("JSON", data=m.exporter_json(), file_name="mesures.json", mime="application/json")
+        c2.download_button("Prometheus", data=m.exporter_prometheus(), file_name="mesures.prom", mime="text/plain")
+
+def changer_chariot():
+    """Panier, checkliste en cours et pagination appartiennent au chariot quitté"""
+    vider_panier()
+    for k in ('h_curseurs', 'h_filtres', 'pdf_ready', 'inventaire_version', 'exp_fichier', 'imp_cle'):
+        st.session_state.pop(k, None)
+    st.session_state['check_state'] = {}
+    # Clé hors widget : le chariot survit aux reruns où la barre latérale n'est pas redessinée
+    st.session_state['chariot'] = st.session_state['choix_chariot']
+
+def choix_chariot():
+    tous = get_chariots()
+    if chariot_courant() not in tous: st.session_state['chariot'] = chariots.DEFAUT
+    if len(tous) > 1:
+        ids = list(tous)
+        st.selectbox("🚑 Chariot", ids, index=ids.index(chariot_courant()), format_func=lambda c: tous[c]['Nom'],
+                     key="choix_chariot", on_change=changer_chariot)
+    else:
+        st.caption(f"🚑 {tous[chariot_courant()]['Nom']}")
+
 # --- MAIN ---
 def main():
     if not st.session_state['logged_in']:
         login_page()
     else:
+        afficher_toasts()
         with st.sidebar:
             st.write(f"👤 {st.session_state.get('user')}")
             st.write(f"Role : {st.session_state.get('role')}")
+            choix_chariot()
             
             # BOUTON CRUCIAL POUR LE QUOTA : Permet de rafraichir manuellement si besoin
             if st.button("🔄 Actualiser les données"):
                 clear_cache_app()
+                get_replica_inventaire(chariot_courant()).relancer()
                 st.rerun()
                 
             if st.button("Déconnexion"):
                 for k in list(st.session_state.keys()): del st.session_state[k]
                 st.rerun()
             
+            afficher_synchro()
+            if st.session_state.get('user_id') == 'admin': panneau_quota()
             st.divider()
-            nav = st.radio("Navigation", ["Consommation", "Remplacer", "Historique", "Checkliste"])
+            pages = ["Consommation", "Remplacer", "Historique", "Checkliste", "Statistiques"]
+            if st.session_state.get('user_id') == 'admin': pages.append("Import / Export")
+            nav = st.radio("Navigation", pages, key="nav")
 
         if nav == "Consommation": interface_consommateur()
         elif nav == "Remplacer": interface_remplacement()
         elif nav == "Historique": interface_historique()
         elif nav == "Checkliste": interface_checklist()
+        elif nav == "Statistiques": interface_statistiques()
+        elif nav == "Import / Export": interface_echanges()
 
 if __name__ == "__main__":
-    main()
+    mesures.MESURES.debut_rerun(st.session_state.get('nav'))
+    try:
+        main()
+    finally:
+        mesures.MESURES.fin_rerun()
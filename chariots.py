@@ -0,0 +1,104 @@
+"""Chariots : un déploiement pour tous les chariots d'urgence de l'hôpital.
+
+Chaque chariot a ses propres collections INVENTAIRE, LOGS, CHECKLISTS, STATS,
+LOGS_ARCHIVES, CHECKLISTS_BASES et PARAMETRES, rangées sous
+CHARIOTS/{id}/... : une session ne lit que les documents de son chariot, et le
+coût d'une page ne dépend pas du nombre de chariots. Le chariot historique
+(DEFAUT) garde les collections à la racine, sans migration.
+
+Le document CHARIOTS/{id} porte le nom du chariot et l'ordre de ses tiroirs.
+Les comptes (UTILISATEURS, PARAMETRES/alias_utilisateurs) restent communs ; le
+champ `chariot` d'un compte choisit le chariot ouvert à la connexion.
+
+    python chariots.py lister
+    python chariots.py ajouter rea-ped --nom "Réa pédiatrique" --tiroirs Dessus "Tiroir 1" "Tiroir 2"
+"""
+import argparse
+
+import stockage
+
+COLLECTION = "CHARIOTS"
+DEFAUT = "principal"
+TOUS = "tous"
+PARTITIONNEES = ("INVENTAIRE", "LOGS", "CHECKLISTS", "STATS", "LOGS_ARCHIVES", "CHECKLISTS_BASES", "PARAMETRES")
+TIROIRS_DEFAUT = ["Dessus", "Tiroir 1", "Tiroir 2", "Tiroir 3", "Tiroir 4", "Tiroir 5"]
+
+
+class StockageChariot:
+    """Stockage vu depuis un chariot : collection(nom) renvoie la partition du chariot, le reste est délégué."""
+
+    def __init__(self, db, chariot_id):
+        self.db = db
+        self.chariot_id = chariot_id
+
+    def collection(self, nom):
+        if self.chariot_id == DEFAUT or nom not in PARTITIONNEES:
+            return self.db.collection(nom)
+        return self.db.collection(COLLECTION).document(self.chariot_id).collection(nom)
+
+    def __getattr__(self, attr):
+        return getattr(self.db, attr)
+
+    def __bool__(self):
+        return bool(self.db)
+
+    def __repr__(self):
+        return f"<chariot {self.chariot_id} {self.db!r}>"
+
+
+def vue(db, chariot_id=DEFAUT):
+    return StockageChariot(db, chariot_id or DEFAUT)
+
+
+def config(data):
+    """Nom et ordre des tiroirs d'un document CHARIOTS (valeurs par défaut si absents)."""
+    data = dict(data or {})
+    data.setdefault("Nom", "Chariot principal")
+    data["Tiroirs"] = list(data.get("Tiroirs") or TIROIRS_DEFAUT)
+    return data
+
+
+def lister(db):
+    """{id: config} de tous les chariots ; le chariot historique y est toujours."""
+    chariots = {doc.id: config(doc.to_dict()) for doc in db.collection(COLLECTION).stream()}
+    chariots.setdefault(DEFAUT, config(None))
+    return dict(sorted(chariots.items(), key=lambda kv: (kv[0] != DEFAUT, kv[1]["Nom"])))
+
+
+def enregistrer(db, chariot_id, nom=None, tiroirs=None):
+    data = {}
+    if nom:
+        data["Nom"] = nom
+    if tiroirs:
+        data["Tiroirs"] = list(tiroirs)
+    db.collection(COLLECTION).document(chariot_id).set(data, merge=True)
+
+
+def vues(db, chariot_id):
+    """Vues à traiter pour une commande en ligne : un chariot, ou tous avec `--chariot tous`."""
+    ids = list(lister(db)) if chariot_id == TOUS else [chariot_id]
+    return [vue(db, i) for i in ids]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["firestore", "memoire"], default=None)
+    sous = parser.add_subparsers(dest="commande", required=True)
+    sous.add_parser("lister", help="chariots et ordre de leurs tiroirs")
+    aj = sous.add_parser("ajouter", help="créer un chariot ou changer son nom / ses tiroirs")
+    aj.add_argument("id")
+    aj.add_argument("--nom")
+    aj.add_argument("--tiroirs", nargs="+", help="tiroirs dans l'ordre du chariot")
+    args = parser.parse_args(argv)
+
+    db = stockage.connecter(args.backend)
+    if args.commande == "ajouter":
+        enregistrer(db, args.id, args.nom, args.tiroirs)
+        print(f"Chariot {args.id} enregistré.")
+    else:
+        for chariot_id, c in lister(db).items():
+            print(f"{chariot_id} : {c['Nom']} ({', '.join(c['Tiroirs'])})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""Checklistes stockées en écarts par rapport à une base d'inventaire.
+
+Une checkliste ne recopie plus tout l'inventaire : son document CHECKLISTS
+porte l'ID d'une base (CHECKLISTS_BASES/base_<hash>, contenu complet, jamais
+modifiée) et les seuls écarts à cette base (lignes modifiées, ajoutées,
+retirées). La base courante est désignée par PARAMETRES/checklist_base ; quand
+les écarts dépassent 10 % des lignes, la checkliste devient la nouvelle base.
+Les bases sont immuables (ID = hash du contenu) : elles sont gardées en mémoire
+du processus.
+
+La liste des archives ne lit que Date et Utilisateur (requête de projection) ;
+le contenu n'est reconstruit qu'à la demande (PDF, export). Les anciens
+documents à contenu complet restent lisibles, et se convertissent d'un coup :
+
+    python checklists.py migrer [--simulation]
+"""
+import argparse
+import hashlib
+import json
+import threading
+from datetime import datetime
+
+import chariots
+import stockage
+
+COLLECTION = "CHECKLISTS"
+BASES = "CHECKLISTS_BASES"
+POINTEUR = ("PARAMETRES", "checklist_base")
+CHAMPS_LISTE = ["Date", "Utilisateur"]
+# Au-delà de max(ECARTS_MIN, ECARTS_PART x lignes) écarts, la checkliste devient la nouvelle base
+ECARTS_MIN = 10
+ECARTS_PART = 0.1
+
+_bases = {}
+_verrou = threading.Lock()
+
+
+def cle(ligne):
+    """Identité d'une ligne : ID d'article ; les anciennes checklistes n'avaient que Tiroir / Nom."""
+    return ligne.get("ID") or f"{ligne.get('Tiroir')}/{ligne.get('Nom')}"
+
+
+def id_base(contenu):
+    brut = json.dumps(contenu, sort_keys=True, default=str, ensure_ascii=False)
+    return "base_" + hashlib.sha256(brut.encode("utf-8")).hexdigest()[:20]
+
+
+# --- ÉCARTS ---
+def ecarts(base, contenu):
+    """{"Modifies": [{Cle, champs changés}], "Ajoutes": [ligne + Position], "Retires": [Cle]}, ou None si les clés ne sont pas uniques."""
+    anciens = {cle(l): l for l in base}
+    nouveaux = [cle(l) for l in contenu]
+    if len(anciens) != len(base) or len(set(nouveaux)) != len(nouveaux):
+        return None
+    modifies, ajoutes = [], []
+    for position, (k, ligne) in enumerate(zip(nouveaux, contenu)):
+        ancienne = anciens.get(k)
+        if ancienne is None:
+            ajoutes.append({**ligne, "Position": position})
+        else:
+            champs = {c: ligne.get(c) for c in set(ligne) | set(ancienne) if ligne.get(c) != ancienne.get(c)}
+            if champs:
+                modifies.append({**champs, "Cle": k})
+    retires = sorted(set(anciens) - set(nouveaux))
+    return {"Modifies": modifies, "Ajoutes": ajoutes, "Retires": retires}
+
+
+def nb_ecarts(e):
+    return len(e["Modifies"]) + len(e["Ajoutes"]) + len(e["Retires"])
+
+
+def reconstruire(base, e):
+    """Contenu complet d'une checkliste à partir de sa base et de ses écarts."""
+    retires = set(e.get("Retires", []))
+    modifies = {m["Cle"]: {c: v for c, v in m.items() if c != "Cle"} for m in e.get("Modifies", [])}
+    contenu = [{**l, **modifies.get(cle(l), {})} for l in base if cle(l) not in retires]
+    for a in sorted(e.get("Ajoutes", []), key=lambda a: a["Position"]):
+        contenu.insert(a["Position"], {c: v for c, v in a.items() if c != "Position"})
+    return contenu
+
+
+# --- BASES ---
+def _ref_pointeur(db):
+    return db.collection(POINTEUR[0]).document(POINTEUR[1])
+
+
+def lire_base(db, base_id):
+    """Contenu d'une base, lu une fois par processus (les bases ne changent jamais)."""
+    with _verrou:
+        if base_id in _bases:
+            return _bases[base_id]
+    doc = db.collection(BASES).document(base_id).get()
+    contenu = list((doc.to_dict() or {}).get("Contenu", [])) if doc.exists else None
+    if contenu is not None:
+        with _verrou:
+            _bases[base_id] = contenu
+    return contenu
+
+
+def base_courante(db):
+    doc = _ref_pointeur(db).get()
+    base_id = (doc.to_dict() or {}).get("Base") if doc.exists else None
+    return base_id, (lire_base(db, base_id) if base_id else None)
+
+
+def preparer(db, contenu, courante=None):
+    """(champs à écrire, nouvelle base ou None, base courante après) pour ce contenu."""
+    base_id, base = courante if courante is not None else base_courante(db)
+    e = ecarts(base, contenu) if base is not None else None
+    if e is not None and nb_ecarts(e) <= max(ECARTS_MIN, int(len(contenu) * ECARTS_PART)):
+        return {"Base": base_id, "Ecarts": e}, None, (base_id, base)
+    e = ecarts(contenu, contenu)
+    if e is None:  # clés en double : contenu complet, comme avant
+        return {"Contenu": contenu}, None, (base_id, base)
+    nouvelle = id_base(contenu)
+    with _verrou:
+        _bases[nouvelle] = list(contenu)
+    return {"Base": nouvelle, "Ecarts": e}, nouvelle, (nouvelle, list(contenu))
+
+
+def _op_base(db, base_id, contenu):
+    return ("set", db.collection(BASES).document(base_id), {"Contenu": contenu, "Nb": len(contenu), "Date": datetime.now()})
+
+
+def enregistrer(db, doc_id, data, contenu):
+    """Écrit la checkliste doc_id (data sans contenu) ; nouvelle base et pointeur éventuels dans le même batch."""
+    champs, nouvelle, _ = preparer(db, contenu)
+    ops = []
+    if nouvelle:
+        ops = [_op_base(db, nouvelle, contenu), ("set", _ref_pointeur(db), {"Base": nouvelle, "Date": datetime.now()})]
+    ops.append(("set", db.collection(COLLECTION).document(doc_id), {**data, **champs}))
+    stockage.ecrire_par_lots(db, ops)
+
+
+# --- LECTURE ---
+def lister(db, limite=5):
+    """[{id_doc, Date, Utilisateur}] des dernières checklistes, sans leur contenu."""
+    q = (db.collection(COLLECTION).select(CHAMPS_LISTE)
+         .order_by("Date", direction=stockage.DESCENDING).limit(limite))
+    return [{**(doc.to_dict() or {}), "id_doc": doc.id} for doc in q.stream()]
+
+
+def completer(db, d):
+    """Document de checkliste avec son Contenu reconstruit (inchangé pour les anciens documents)."""
+    if "Contenu" in d or "Base" not in d:
+        return d
+    base = lire_base(db, d["Base"])
+    if base is None:
+        print("Erreur checkliste : base introuvable", d["Base"])
+        return {**d, "Contenu": []}
+    return {**d, "Contenu": reconstruire(base, d.get("Ecarts", {}))}
+
+
+def charger(db, doc_id):
+    """Checkliste complète (un get, plus la base si elle n'est pas déjà en mémoire)."""
+    doc = db.collection(COLLECTION).document(doc_id).get()
+    if not doc.exists:
+        return None
+    return {**completer(db, doc.to_dict() or {}), "id_doc": doc.id}
+
+
+# --- MIGRATION ---
+def migrer(db, simulation=False, taille=200):
+    """Convertit les checklistes à contenu complet en base + écarts, dans l'ordre chronologique.
+
+    Les bases créées ici ne deviennent pas la base courante : le pointeur reste
+    sur celle des checklistes récentes.
+    """
+    rapport = {"convertis": 0, "bases": 0, "simulation": simulation}
+    courante = (None, None)
+    q = db.collection(COLLECTION).order_by("Date").limit(taille)
+    curseur = None
+    while True:
+        docs = list((q if curseur is None else q.start_after(curseur)).stream())
+        ops = []
+        for doc in docs:
+            d = doc.to_dict() or {}
+            if "Contenu" not in d:
+                continue
+            champs, nouvelle, courante = preparer(db, d["Contenu"], courante)
+            if "Contenu" in champs:
+                continue
+            if nouvelle:
+                ops.append(_op_base(db, nouvelle, d["Contenu"]))
+                rapport["bases"] += 1
+            ops.append(("set", doc.reference, {**{k: v for k, v in d.items() if k != "Contenu"}, **champs}))
+            rapport["convertis"] += 1
+        if ops and not simulation:
+            stockage.ecrire_par_lots(db, ops)
+        if len(docs) < taille:
+            break
+        curseur = docs[-1]
+    return rapport
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("commande", choices=["migrer"])
+    parser.add_argument("--backend", choices=["firestore", "memoire"], default=None)
+    parser.add_argument("--simulation", action="store_true", help="compte sans écrire")
+    parser.add_argument("--chariot", default=chariots.DEFAUT, help="id du chariot, ou « tous »")
+    args = parser.parse_args(argv)
+    db = stockage.connecter(args.backend)
+    for dbc in chariots.vues(db, args.chariot):
+        r = migrer(dbc, args.simulation)
+        print(f"[{dbc.chariot_id}] {r['convertis']} checklistes {'à convertir' if r['simulation'] else 'converties'}, "
+              f"{r['bases']} bases d'inventaire.")
+
+
+if __name__ == "__main__":
+    main()
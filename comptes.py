@@ -0,0 +1,300 @@
+"""Comptes utilisateurs : index des identifiants et mots de passe hachés.
+
+Un document unique (PARAMETRES/alias_utilisateurs) associe chaque
+identifiant normalisé (ID du document, `username`, `identifiant`) à l'ID
+canonique du compte. Il est gardé en mémoire du processus avec un TTL :
+une connexion ne lit plus que le document du compte, au lieu d'enchaîner
+jusqu'à trois requêtes. Un compte absent de l'index (créé dans la console
+Firebase) est cherché comme avant, puis ajouté à l'index. Deux comptes qui se
+normalisent en un même identifiant (`Admin` et `admin`) sont signalés et
+l'identifiant est marqué ambigu (None) : chacun ne se connecte que par son ID exact.
+
+Les mots de passe sont stockés dans un seul champ `password_hash`
+(PBKDF2-SHA256 salé). Les anciens champs en clair sont convertis au premier
+login réussi, ou d'un coup :
+
+    python comptes.py migrer
+    python comptes.py ajouter <id> --prenom ... --role Admin
+"""
+import argparse
+import base64
+import getpass
+import hashlib
+import hmac
+import os
+import threading
+import time
+
+import stockage
+
+COLLECTION = "UTILISATEURS"
+INDEX = ("PARAMETRES", "alias_utilisateurs")
+
+# Champs acceptés comme identifiant de connexion, en plus de l'ID du document
+CHAMPS_ALIAS = ("username", "identifiant")
+# Anciens champs de mot de passe en clair, par ordre de priorité
+CHAMPS_MDP_ANCIENS = ("password", "mdp", "pass", "code", "motdepasse")
+CHAMP_HASH = "password_hash"
+
+# ~50 ms par vérification ; un enregistrement altéré ne peut pas exiger plus que ITERATIONS_MAX
+ITERATIONS = 120_000
+ITERATIONS_MAX = 600_000
+
+
+def normaliser(identifiant):
+    return str(identifiant).strip().casefold()
+
+
+def aliases(id_doc, data):
+    """Identifiants normalisés d'un compte, l'ID du document en premier."""
+    vus = [normaliser(id_doc)]
+    for champ in CHAMPS_ALIAS:
+        val = data.get(champ)
+        if val and normaliser(val) not in vus:
+            vus.append(normaliser(val))
+    return vus
+
+
+# --- MOTS DE PASSE ---
+def _b64(octets):
+    return base64.b64encode(octets).decode('ascii')
+
+
+def hacher(mot_de_passe, iterations=ITERATIONS):
+    sel = os.urandom(16)
+    cle = hashlib.pbkdf2_hmac('sha256', str(mot_de_passe).encode('utf-8'), sel, iterations)
+    return f"pbkdf2_sha256${iterations}${_b64(sel)}${_b64(cle)}"
+
+
+def verifier(mot_de_passe, empreinte):
+    try:
+        algo, iterations, sel, cle = str(empreinte).split('$')
+        iterations = int(iterations)
+        if algo != "pbkdf2_sha256" or not 0 < iterations <= ITERATIONS_MAX:
+            return False
+        calcul = hashlib.pbkdf2_hmac('sha256', str(mot_de_passe).encode('utf-8'), base64.b64decode(sel), iterations)
+        return hmac.compare_digest(calcul, base64.b64decode(cle))
+    except (ValueError, TypeError):
+        return False
+
+
+def mot_de_passe_ancien(data):
+    for champ in CHAMPS_MDP_ANCIENS:
+        if champ in data:
+            return str(data[champ]).strip()
+    return None
+
+
+def champs_mot_de_passe(db, mot_de_passe, data=None):
+    """Mise à jour qui pose le hash et efface les champs en clair présents."""
+    maj = {CHAMP_HASH: hacher(mot_de_passe)}
+    for champ in CHAMPS_MDP_ANCIENS:
+        if data is None or champ in data:
+            maj[champ] = db.supprimer_champ()
+    return maj
+
+
+# --- INDEX DES IDENTIFIANTS ---
+def _ref_index(db):
+    return db.collection(INDEX[0]).document(INDEX[1])
+
+
+def construire_index(db):
+    """Relit tous les comptes ; les IDs de documents sont prioritaires sur les alias.
+
+    Un identifiant revendiqué par plusieurs comptes au même rang (deux IDs, ou deux
+    alias) est signalé et marqué None plutôt que d'en choisir un au hasard.
+    """
+    comptes = [(doc.id, doc.to_dict() or {}) for doc in db.collection(COLLECTION).stream()]
+    index = {}
+    for rang in (0, 1):
+        candidats = {}
+        for id_doc, data in comptes:
+            noms = aliases(id_doc, data)
+            for alias in (noms[:1] if rang == 0 else noms[1:]):
+                if alias not in index:
+                    candidats.setdefault(alias, set()).add(id_doc)
+        for alias, ids in candidats.items():
+            if len(ids) > 1:
+                print("Erreur comptes : identifiant ambigu", alias, sorted(ids))
+                index[alias] = None
+            else:
+                index[alias] = ids.pop()
+    return index
+
+
+def reindexer(db):
+    index = construire_index(db)
+    _ref_index(db).set({"Alias": index, "Date": time.time()})
+    return index
+
+
+class IndexAlias:
+    """Copie en mémoire de l'index, relue au plus toutes les `ttl` secondes."""
+
+    def __init__(self, db, ttl=300, relecture_min=30):
+        self.db = db
+        self.ttl = ttl
+        # Un identifiant inconnu force une relecture (compte ajouté par un autre processus), pas plus souvent que ceci
+        self.relecture_min = relecture_min
+        self._index = None
+        self._lu_a = 0.0
+        self._verrou = threading.Lock()
+
+    def _charger(self):
+        doc = _ref_index(self.db).get()
+        index = (doc.to_dict() or {}).get("Alias") if doc.exists else None
+        if index is None:
+            # Première utilisation : on construit l'index depuis les comptes existants
+            index = reindexer(self.db)
+        self._index, self._lu_a = index, time.monotonic()
+
+    def resoudre(self, identifiant):
+        """ID canonique du compte, ou None."""
+        cle = normaliser(identifiant)
+        with self._verrou:
+            age = time.monotonic() - self._lu_a
+            if self._index is None or age > self.ttl:
+                self._charger()
+            elif cle not in self._index and age > self.relecture_min:
+                self._charger()
+            return self._index.get(cle)
+
+    def ajouter(self, id_doc, data):
+        """Compte trouvé hors de l'index : ses identifiants libres y sont ajoutés, en mémoire et en base."""
+        with self._verrou:
+            index = self._index if self._index is not None else {}
+            nouveaux = {a: id_doc for a in aliases(id_doc, data) if a not in index}
+            index.update(nouveaux)
+        if nouveaux:
+            try:
+                _ref_index(self.db).set({"Alias": nouveaux}, merge=True)
+            except Exception as e:
+                print("Erreur index comptes:", e)
+
+    def invalider(self):
+        with self._verrou:
+            self._index = None
+
+
+# --- ÉCRITURES ---
+def _transaction_compte(transaction, db, id_doc, data, mot_de_passe):
+    ref_compte = db.collection(COLLECTION).document(id_doc)
+    ref_index = _ref_index(db)
+    docs = {d.id: d for d in db.get_all([ref_compte, ref_index], transaction=transaction)}
+    compte = docs.get(id_doc)
+    ancien = (compte.to_dict() or {}) if compte is not None and compte.exists else {}
+    idx = docs.get(INDEX[1])
+    index = dict((idx.to_dict() or {}).get("Alias", {})) if idx is not None and idx.exists else construire_index(db)
+
+    nouveau = {**ancien, **data}
+    for alias in aliases(id_doc, nouveau):
+        if index.get(alias, id_doc) != id_doc:
+            raise ValueError(f"Identifiant déjà utilisé : {alias}")
+    index = {a: i for a, i in index.items() if i != id_doc}
+    index.update(dict.fromkeys(aliases(id_doc, nouveau), id_doc))
+
+    maj = dict(data)
+    if mot_de_passe is not None:
+        maj.update(champs_mot_de_passe(db, mot_de_passe, ancien))
+    transaction.set(ref_compte, maj, merge=True)
+    transaction.set(ref_index, {"Alias": index, "Date": time.time()})
+
+
+def enregistrer_utilisateur(db, id_doc, data, mot_de_passe=None):
+    """Crée ou modifie un compte ; l'index des identifiants suit dans le même commit."""
+    db.executer_transaction(_transaction_compte, db, id_doc, data, mot_de_passe)
+
+
+def chercher_compte(db, identifiant):
+    """Compte absent de l'index : ID du document tel que saisi, puis champs alias (recherche d'avant l'index)."""
+    u = str(identifiant).strip()
+    if not u:
+        return None
+    if "/" not in u:
+        doc = db.collection(COLLECTION).document(u).get()
+        if doc.exists:
+            return doc
+    for champ in CHAMPS_ALIAS:
+        docs = list(db.collection(COLLECTION).where(champ, "==", u).limit(1).stream())
+        if docs:
+            return docs[0]
+    return None
+
+
+def authentifier(db, index, identifiant, mot_de_passe):
+    """(id_doc, données du compte, None) ou (None, None, erreur) ; une seule lecture si l'index est chaud."""
+    id_doc = index.resoudre(identifiant)
+    doc = db.collection(COLLECTION).document(id_doc).get() if id_doc is not None else None
+    if doc is not None and not doc.exists:
+        index.invalider()
+        doc = None
+    if doc is None:
+        # Compte créé dans la console Firebase (ou identifiant ambigu) : recherche directe
+        doc = chercher_compte(db, identifiant)
+        if doc is None:
+            return None, None, "Utilisateur introuvable"
+        id_doc = doc.id
+        index.ajouter(id_doc, doc.to_dict() or {})
+    data = doc.to_dict() or {}
+    mot_de_passe = str(mot_de_passe).strip()
+
+    if CHAMP_HASH in data:
+        ok = verifier(mot_de_passe, data[CHAMP_HASH])
+    else:
+        ancien = mot_de_passe_ancien(data)
+        ok = ancien is not None and hmac.compare_digest(ancien.encode('utf-8'), mot_de_passe.encode('utf-8'))
+        if ok:
+            # Migration au fil de l'eau vers le champ haché
+            try:
+                doc.reference.update(champs_mot_de_passe(db, mot_de_passe, data))
+            except Exception as e:
+                print("Erreur migration mot de passe:", e)
+    if not ok:
+        return None, None, "Mot de passe incorrect"
+    for champ in CHAMPS_MDP_ANCIENS + (CHAMP_HASH,):
+        data.pop(champ, None)
+    return id_doc, data, None
+
+
+def migrer(db):
+    """Hache tous les mots de passe encore en clair et reconstruit l'index."""
+    operations = []
+    for doc in db.collection(COLLECTION).stream():
+        data = doc.to_dict() or {}
+        ancien = mot_de_passe_ancien(data)
+        if CHAMP_HASH not in data and ancien is not None:
+            operations.append(("update", doc.reference, champs_mot_de_passe(db, ancien, data)))
+    stockage.ecrire_par_lots(db, operations)
+    index = reindexer(db)
+    return {"haches": len(operations), "alias": len(index)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["firestore", "memoire"], default=None)
+    sous = parser.add_subparsers(dest="commande", required=True)
+    sous.add_parser("migrer", help="hacher les mots de passe en clair et reconstruire l'index")
+    sous.add_parser("reindexer", help="reconstruire l'index des identifiants")
+    aj = sous.add_parser("ajouter", help="créer ou modifier un compte")
+    aj.add_argument("id")
+    for champ in ("prenom", "nom", "role", "chariot") + CHAMPS_ALIAS:
+        aj.add_argument(f"--{champ}")
+    aj.add_argument("--sans-mot-de-passe", action="store_true", help="ne pas changer le mot de passe")
+    args = parser.parse_args(argv)
+
+    db = stockage.connecter(args.backend)
+    if args.commande == "migrer":
+        res = migrer(db)
+        print(f"{res['haches']} mots de passe hachés, {res['alias']} identifiants indexés.")
+    elif args.commande == "reindexer":
+        print(f"{len(reindexer(db))} identifiants indexés.")
+    else:
+        data = {c: getattr(args, c) for c in ("prenom", "nom", "role", "chariot") + CHAMPS_ALIAS if getattr(args, c)}
+        mdp = None if args.sans_mot_de_passe else getpass.getpass("Mot de passe : ")
+        enregistrer_utilisateur(db, args.id, data, mdp)
+        print(f"Compte {args.id} enregistré.")
+
+
+if __name__ == "__main__":
+    main()
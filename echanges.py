@@ -0,0 +1,409 @@
+"""Import / export en masse : inventaire (CSV, Excel, Parquet), LOGS et CHECKLISTS.
+
+Import : le fichier est lu par tranches, chaque ligne est validée puis
+comparée à l'inventaire actuel ; seuls les champs qui changent sont écrits,
+en batches de 500 opérations. Une cellule vide (ou une colonne absente)
+laisse la valeur actuelle. Les lignes invalides sont ignorées et listées
+dans le rapport ; `--simulation` calcule le rapport sans rien écrire.
+À lancer application au repos de préférence : l'import pose Stock_Actuel
+sans transaction.
+
+Export : la collection est parcourue page par page (curseur start_after) et
+chaque page part aussitôt dans le fichier, la mémoire reste bornée par la
+taille de page quel que soit le volume. Une ligne par article consommé
+(LOGS, archives comprises) ou par article contrôlé (CHECKLISTS).
+
+    python echanges.py importer inventaire.csv [--simulation] [--supprimer-absents]
+    python echanges.py exporter LOGS logs.parquet [--depuis 2024-01-01] [--jusqua 2025-01-01]
+"""
+import argparse
+import csv
+import io
+import os
+from datetime import datetime
+
+import pandas as pd
+
+import archives
+import chariots
+import checklists
+import recherche
+import stockage
+from statistiques import naif
+
+COLLECTION = "INVENTAIRE"
+FORMATS = {".csv": "csv", ".txt": "csv", ".xlsx": "excel", ".xlsm": "excel", ".parquet": "parquet", ".pq": "parquet"}
+
+CHAMPS_TEXTE = ("Nom", "Tiroir", "Synonymes")
+CHAMPS_ENTIERS = ("Dotation", "Stock_Actuel")
+# Champs exigés pour créer un article absent de l'inventaire
+CHAMPS_CREATION = ("Nom", "Tiroir")
+MAX_ERREURS = 200
+MAX_APERCU = 200
+
+# Colonnes d'export : (nom, type) ; le type fixe le schéma Parquet
+SCHEMAS = {
+    "INVENTAIRE": [("ID", "texte"), ("Nom", "texte"), ("Tiroir", "texte"), ("Dotation", "entier"),
+                   ("Stock_Actuel", "entier"), ("Synonymes", "texte")],
+    "LOGS": [("Log", "texte"), ("Date", "date"), ("Utilisateur", "texte"), ("IP_Patient", "texte"),
+             ("Action", "texte"), ("Statut", "texte"), ("ID", "texte"), ("Nom", "texte"),
+             ("Tiroir", "texte"), ("Qte", "entier"), ("Remplace", "booleen")],
+    "CHECKLISTS": [("Checkliste", "texte"), ("Date", "date"), ("Utilisateur", "texte"), ("Statut", "texte"),
+                   ("Nom", "texte"), ("Tiroir", "texte"), ("Dotation", "entier")],
+}
+
+
+def format_fichier(nom, format=None):
+    if format:
+        return format
+    ext = os.path.splitext(str(nom))[1].lower()
+    if ext not in FORMATS:
+        raise ValueError(f"Format non reconnu : {ext or nom} (csv, xlsx, parquet)")
+    return FORMATS[ext]
+
+
+# --- LECTURE PAR TRANCHES ---
+def lire_tranches(source, format, taille=stockage.MAX_OPS_BATCH, encodage="utf-8-sig"):
+    """Lignes du fichier (dicts) par paquets de `taille` ; source = chemin ou fichier binaire."""
+    if format == "csv":
+        # sep=None : séparateur détecté (les exports Excel français utilisent « ; »)
+        for df in pd.read_csv(source, sep=None, engine="python", dtype=str, keep_default_na=False,
+                              encoding=encodage, chunksize=taille):
+            yield df.to_dict("records")
+    elif format == "parquet":
+        import pyarrow.parquet as pq
+        for lot in pq.ParquetFile(source).iter_batches(batch_size=taille):
+            yield lot.to_pylist()
+    elif format == "excel":
+        try:
+            import openpyxl
+        except ImportError:
+            raise ValueError("Import Excel : le paquet openpyxl n'est pas installé")
+        classeur = openpyxl.load_workbook(source, read_only=True, data_only=True)
+        try:
+            lignes = classeur.active.iter_rows(values_only=True)
+            entete = [str(c).strip() if c is not None else "" for c in next(lignes, ())]
+            tranche = []
+            for valeurs in lignes:
+                tranche.append(dict(zip(entete, valeurs)))
+                if len(tranche) >= taille:
+                    yield tranche
+                    tranche = []
+            if tranche:
+                yield tranche
+        finally:
+            classeur.close()
+    else:
+        raise ValueError(f"Format non supporté : {format}")
+
+
+# --- VALIDATION ET DIFFÉRENCES ---
+def _vide(val):
+    return val is None or (isinstance(val, float) and pd.isna(val)) or str(val).strip() == ""
+
+
+def _entier(val, champ):
+    try:
+        f = float(str(val).strip().replace(",", "."))
+    except ValueError:
+        raise ValueError(f"{champ} n'est pas un nombre : {val!r}")
+    if f != int(f) or f < 0:
+        raise ValueError(f"{champ} doit être un entier positif : {val!r}")
+    return int(f)
+
+
+def valider(ligne):
+    """(ID, champs typés) d'une ligne du fichier ; ValueError si elle est inutilisable."""
+    ligne = {str(k).strip(): v for k, v in ligne.items() if k is not None}
+    item_id = "" if _vide(ligne.get("ID")) else str(ligne["ID"]).strip()
+    if not item_id:
+        raise ValueError("ID manquant")
+    if "/" in item_id or item_id in (".", "..") or item_id.startswith("__"):
+        raise ValueError(f"ID invalide pour Firestore : {item_id!r}")
+    champs = {}
+    for champ in CHAMPS_TEXTE:
+        if not _vide(ligne.get(champ)):
+            champs[champ] = str(ligne[champ]).strip()
+    for champ in CHAMPS_ENTIERS:
+        if not _vide(ligne.get(champ)):
+            champs[champ] = _entier(ligne[champ], champ)
+    return item_id, champs
+
+
+def _egal(champ, actuel, nouveau):
+    if champ == "Synonymes":
+        return recherche.synonymes({champ: actuel}) == recherche.synonymes({champ: nouveau})
+    if champ in CHAMPS_ENTIERS:
+        try:
+            return int(actuel) == nouveau
+        except (TypeError, ValueError):
+            return False
+    return actuel is not None and str(actuel) == nouveau
+
+
+def differences(champs, actuel):
+    """Champs à écrire ; actuel = document existant (dict) ou None pour une création."""
+    if actuel is None:
+        manquants = [c for c in CHAMPS_CREATION if c not in champs]
+        if manquants:
+            raise ValueError(f"Article inconnu, {', '.join(manquants)} requis pour le créer")
+        actuel, diff = {}, {"Dotation": 0, "Stock_Actuel": 0, **champs}
+    else:
+        diff = {c: v for c, v in champs.items() if not _egal(c, actuel.get(c), v)}
+    if diff:
+        stock = diff.get("Stock_Actuel", actuel.get("Stock_Actuel", 0))
+        dotation = diff.get("Dotation", actuel.get("Dotation", 0))
+        if int(stock or 0) > int(dotation or 0):
+            raise ValueError(f"Stock_Actuel ({stock}) supérieur à la Dotation ({dotation})")
+    return diff
+
+
+# --- IMPORT ---
+def importer_inventaire(db, source, format=None, actuel=None, simulation=False, supprimer_absents=False,
+                        taille=stockage.MAX_OPS_BATCH, encodage="utf-8-sig"):
+    """Importe un fichier d'inventaire ; renvoie le rapport (compteurs, erreurs, aperçu des changements).
+
+    actuel(item_id) -> dict ou None : état de référence (snapshot de la réplique,
+    aucune lecture). Sans lui, chaque tranche est relue par get_all.
+    """
+    format = format_fichier(getattr(source, "name", source), format)
+    rapport = {"lignes": 0, "crees": 0, "modifies": 0, "inchanges": 0, "supprimes": 0,
+               "commits": 0, "ecritures": 0, "n_erreurs": 0, "erreurs": [], "apercu": [], "simulation": simulation}
+    vus = set()
+    n_ligne = 1  # ligne d'en-tête
+    for tranche in lire_tranches(source, format, taille, encodage):
+        valides = []
+        for ligne in tranche:
+            n_ligne += 1
+            rapport["lignes"] += 1
+            try:
+                item_id, champs = valider(ligne)
+                if item_id in vus:
+                    raise ValueError(f"ID en double dans le fichier : {item_id}")
+                vus.add(item_id)
+                valides.append((n_ligne, item_id, champs))
+            except ValueError as e:
+                _noter_erreur(rapport, n_ligne, e)
+
+        refs = {i: db.collection(COLLECTION).document(i) for _, i, _ in valides}
+        if actuel is None:
+            docs = {d.id: (d.to_dict() or {}) for d in stockage.lire_par_lots(db, refs.values(), taille) if d.exists}
+            etat = docs.get
+        else:
+            etat = actuel
+
+        operations = []
+        for n, item_id, champs in valides:
+            avant = etat(item_id)
+            try:
+                diff = differences(champs, avant)
+            except ValueError as e:
+                _noter_erreur(rapport, n, e)
+                continue
+            if not diff:
+                rapport["inchanges"] += 1
+                continue
+            rapport["crees" if avant is None else "modifies"] += 1
+            operations.append(("merge", refs[item_id], diff))
+            for champ, val in diff.items():
+                if len(rapport["apercu"]) < MAX_APERCU:
+                    rapport["apercu"].append({"ID": item_id, "Champ": champ,
+                                              "Avant": None if avant is None else avant.get(champ), "Après": val})
+        if operations and not simulation:
+            rapport["commits"] += stockage.ecrire_par_lots(db, operations, taille)
+            rapport["ecritures"] += len(operations)
+
+    rapport["erreurs"].sort(key=lambda e: e["Ligne"])
+    if supprimer_absents:
+        # Une ligne rejetée ne doit pas faire disparaître l'article qu'elle décrivait
+        if rapport["n_erreurs"]:
+            rapport["erreurs"].append({"Ligne": None, "Erreur": "Suppression des absents annulée : le fichier contient des erreurs"})
+        else:
+            absents = [d.reference for d in db.collection(COLLECTION).select([]).stream() if d.id not in vus]
+            rapport["supprimes"] = len(absents)
+            for ref in absents[:max(0, MAX_APERCU - len(rapport["apercu"]))]:
+                rapport["apercu"].append({"ID": ref.id, "Champ": "(supprimé)", "Avant": None, "Après": None})
+            if absents and not simulation:
+                rapport["commits"] += stockage.ecrire_par_lots(db, [("delete", r, None) for r in absents], taille)
+                rapport["ecritures"] += len(absents)
+    return rapport
+
+
+def _noter_erreur(rapport, n_ligne, e):
+    rapport["n_erreurs"] += 1
+    if len(rapport["erreurs"]) < MAX_ERREURS:
+        rapport["erreurs"].append({"Ligne": n_ligne, "Erreur": str(e)})
+
+
+# --- EXPORT ---
+def pages(db, collection, taille=500, depuis=None, jusqua=None):
+    """Documents (id, dict) de la collection, une page à la fois, dans l'ordre des dates.
+
+    Pour LOGS, les logs archivés (plus anciens) passent d'abord, un mois à la fois.
+    Les CHECKLISTS sont rendues avec leur Contenu reconstruit (base + écarts).
+    """
+    if collection == "LOGS":
+        page = []
+        for log in archives.parcourir(db, depuis, jusqua):
+            page.append((log.get("id"), log))
+            if len(page) >= taille:
+                yield page
+                page = []
+        if page:
+            yield page
+    q = db.collection(collection)
+    if collection != COLLECTION:
+        if depuis is not None:
+            q = q.where("Date", ">=", depuis)
+        if jusqua is not None:
+            q = q.where("Date", "<", jusqua)
+        q = q.order_by("Date")
+    q = q.limit(taille)
+    curseur = None
+    while True:
+        page = list((q if curseur is None else q.start_after(curseur)).stream())
+        if page:
+            docs = [(doc.id, doc.to_dict() or {}) for doc in page]
+            if collection == checklists.COLLECTION:
+                docs = [(i, checklists.completer(db, d)) for i, d in docs]
+            yield docs
+        if len(page) < taille:
+            return
+        curseur = page[-1]
+
+
+def lignes_export(collection, doc_id, d):
+    """Lignes à plat d'un document pour l'export."""
+    if collection == COLLECTION:
+        syn = recherche.synonymes(d)
+        return [{"ID": doc_id, "Nom": d.get("Nom"), "Tiroir": d.get("Tiroir"), "Dotation": d.get("Dotation"),
+                 "Stock_Actuel": d.get("Stock_Actuel"), "Synonymes": ", ".join(syn) if syn else None}]
+    if collection == "LOGS":
+        entete = {"Log": doc_id, "Date": naif(d.get("Date")), "Utilisateur": d.get("Utilisateur"),
+                  "IP_Patient": d.get("IP_Patient"), "Action": d.get("Action"), "Statut": d.get("Statut")}
+        details = d.get("Details_Struct") or [{}]
+        return [{**entete, "ID": l.get("ID"), "Nom": l.get("Nom"), "Tiroir": l.get("Tiroir"),
+                 "Qte": l.get("Qte"), "Remplace": l.get("EstRemplace")} for l in details]
+    entete = {"Checkliste": doc_id, "Date": naif(d.get("Date")), "Utilisateur": d.get("Utilisateur"),
+              "Statut": d.get("Statut")}
+    contenu = d.get("Contenu") or [{}]
+    return [{**entete, "Nom": c.get("Nom"), "Tiroir": c.get("Tiroir"), "Dotation": c.get("Dotation")} for c in contenu]
+
+
+def _typer(val, type_):
+    if val is None or val == "":
+        return None
+    try:
+        if type_ == "entier":
+            return int(val)
+        if type_ == "booleen":
+            return bool(val)
+        if type_ == "date":
+            return naif(val) if isinstance(val, datetime) else None
+    except (TypeError, ValueError):
+        return None
+    return str(val)
+
+
+class _EcrivainCSV:
+    """CSV « ; » avec BOM : ouvert tel quel par Excel et relu par l'import."""
+
+    def __init__(self, destination, colonnes):
+        self._fermer = isinstance(destination, (str, os.PathLike))
+        brut = open(destination, "wb") if self._fermer else destination
+        self._texte = io.TextIOWrapper(brut, encoding="utf-8-sig", newline="")
+        self._csv = csv.DictWriter(self._texte, fieldnames=colonnes, delimiter=";")
+        self._csv.writeheader()
+
+    def ecrire(self, lignes):
+        for l in lignes:
+            self._csv.writerow({k: (v.isoformat(sep=" ", timespec="seconds") if isinstance(v, datetime) else v)
+                                for k, v in l.items()})
+        self._texte.flush()
+
+    def fermer(self):
+        self._texte.flush()
+        if self._fermer:
+            self._texte.close()
+        else:
+            self._texte.detach()
+
+
+class _EcrivainParquet:
+    def __init__(self, destination, schema):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self._pa = pa
+        types = {"texte": pa.string(), "entier": pa.int64(), "booleen": pa.bool_(), "date": pa.timestamp("ms")}
+        self._schema = pa.schema([(nom, types[t]) for nom, t in schema])
+        self._writer = pq.ParquetWriter(destination, self._schema)
+
+    def ecrire(self, lignes):
+        self._writer.write_table(self._pa.Table.from_pylist(lignes, schema=self._schema))
+
+    def fermer(self):
+        self._writer.close()
+
+
+def exporter(db, collection, destination, format=None, taille_page=500, depuis=None, jusqua=None):
+    """Écrit la collection dans `destination` (chemin ou fichier binaire), page par page."""
+    if collection not in SCHEMAS:
+        raise ValueError(f"Collection non exportable : {collection}")
+    format = format_fichier(getattr(destination, "name", destination), format)
+    schema = SCHEMAS[collection]
+    if format == "csv":
+        ecrivain = _EcrivainCSV(destination, [nom for nom, _ in schema])
+    elif format == "parquet":
+        ecrivain = _EcrivainParquet(destination, schema)
+    else:
+        raise ValueError(f"Export {format} non supporté (csv, parquet)")
+    rapport = {"documents": 0, "lignes": 0, "pages": 0}
+    try:
+        for page in pages(db, collection, taille_page, depuis, jusqua):
+            lignes = [{nom: _typer(l.get(nom), t) for nom, t in schema}
+                      for doc_id, d in page for l in lignes_export(collection, doc_id, d)]
+            ecrivain.ecrire(lignes)
+            rapport["pages"] += 1
+            rapport["documents"] += len(page)
+            rapport["lignes"] += len(lignes)
+    finally:
+        ecrivain.fermer()
+    return rapport
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["firestore", "memoire"], default=None)
+    parser.add_argument("--chariot", default=chariots.DEFAUT, help="id du chariot importé / exporté")
+    sous = parser.add_subparsers(dest="commande", required=True)
+    imp = sous.add_parser("importer", help="importer un fichier d'inventaire (csv, xlsx, parquet)")
+    imp.add_argument("fichier")
+    imp.add_argument("--format", choices=sorted(set(FORMATS.values())))
+    imp.add_argument("--encodage", default="utf-8-sig", help="CSV uniquement (ex. cp1252)")
+    imp.add_argument("--simulation", action="store_true", help="calcule le rapport sans écrire")
+    imp.add_argument("--supprimer-absents", action="store_true", help="supprimer les articles absents du fichier")
+    exp = sous.add_parser("exporter", help="exporter une collection (csv, parquet)")
+    exp.add_argument("collection", choices=sorted(SCHEMAS))
+    exp.add_argument("fichier")
+    exp.add_argument("--format", choices=["csv", "parquet"])
+    exp.add_argument("--depuis", type=datetime.fromisoformat, help="date ISO incluse")
+    exp.add_argument("--jusqua", type=datetime.fromisoformat, help="date ISO exclue")
+    exp.add_argument("--page", type=int, default=500, help="documents lus par requête")
+    args = parser.parse_args(argv)
+
+    db = chariots.vue(stockage.connecter(args.backend), args.chariot)
+    if args.commande == "importer":
+        r = importer_inventaire(db, args.fichier, args.format, simulation=args.simulation,
+                                supprimer_absents=args.supprimer_absents, encodage=args.encodage)
+        print(f"{r['lignes']} lignes : {r['crees']} créés, {r['modifies']} modifiés, {r['inchanges']} inchangés, "
+              f"{r['supprimes']} supprimés, {r['n_erreurs']} en erreur"
+              + (" (simulation, rien d'écrit)" if r["simulation"] else f" ; {r['ecritures']} écritures en {r['commits']} commits"))
+        for e in r["erreurs"]:
+            print(f"  ligne {e['Ligne']} : {e['Erreur']}" if e["Ligne"] else f"  {e['Erreur']}")
+    else:
+        r = exporter(db, args.collection, args.fichier, args.format, args.page, args.depuis, args.jusqua)
+        print(f"{r['documents']} documents {args.collection} -> {r['lignes']} lignes dans {args.fichier} ({r['pages']} pages).")
+
+
+if __name__ == "__main__":
+    main()
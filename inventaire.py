@@ -0,0 +1,397 @@
+"""Réplique de l'inventaire partagée par toutes les sessions du processus.
+
+Un écouteur on_snapshot (Firestore) ou le flux de changements du backend
+mémoire maintient une copie locale de la collection INVENTAIRE : seuls les
+documents modifiés sont relus, au lieu de re-streamer toute la collection à
+chaque expiration de cache.
+
+Chaque version de la réplique est exposée sous forme de SnapshotInventaire :
+un objet en lecture seule, aux types compacts, avec les vues par tiroir déjà
+calculées, partagé tel quel par toutes les sessions (aucune copie par rerun).
+Il porte aussi l'index des péremptions : tous les lots triés par date, pour
+répondre à « périme avant telle date » (global ou par tiroir) par recherche
+dichotomique plutôt qu'en parcourant les articles, et le contrôle de
+checkliste (`controle`) : stock, dotation et péremption comparés en une passe
+vectorisée, pour ne présenter que les articles en écart.
+
+Avec un cache partagé entre répliques (cache.py), ReplicaPartagee ne fait
+écouter la collection que par une réplique, le meneur : il publie dans le tier
+les seuls documents changés, les autres les appliquent sans lecture en base.
+"""
+import sys
+import threading
+import uuid
+from types import MappingProxyType
+
+import numpy as np
+import pandas as pd
+
+import lots
+import recherche
+from chariots import TIROIRS_DEFAUT
+
+# Champs qui invalident l'index de recherche (un mouvement de stock ne le touche pas)
+CHAMPS_RECHERCHE = ('Nom', 'Synonymes')
+
+
+def compacter(df, ordre_tiroirs=TIROIRS_DEFAUT):
+    """Types compacts : Tiroir catégoriel, Stock_Actuel / Dotation en int32."""
+    df = df.copy()
+    for col in ('ID', 'Nom', 'Tiroir'):
+        if col not in df.columns:
+            df[col] = pd.Series(dtype=object)
+    for col in ('Stock_Actuel', 'Dotation'):
+        serie = df[col] if col in df.columns else pd.Series(0, index=df.index)
+        df[col] = pd.to_numeric(serie, errors='coerce').fillna(0).astype('int32')
+    tiroirs = df['Tiroir'].fillna('?').astype(str)
+    autres = sorted(set(tiroirs) - set(ordre_tiroirs))
+    df['Tiroir'] = pd.Categorical(tiroirs, categories=list(ordre_tiroirs) + autres, ordered=True)
+    return df.reset_index(drop=True)
+
+
+class SnapshotInventaire:
+    """Vue figée d'une version de l'inventaire ; ne jamais la modifier."""
+
+    def __init__(self, df, version=0, ordre_tiroirs=TIROIRS_DEFAUT):
+        self.version = version
+        self.ordre_tiroirs = tuple(ordre_tiroirs)
+        self.df = compacter(df, ordre_tiroirs)
+        self.empty = self.df.empty
+        n = len(self.df)
+
+        stock = self.df['Stock_Actuel'].to_numpy()
+        dotation = self.df['Dotation'].to_numpy()
+        self.sous_dotation = stock < dotation
+        for arr in (stock, dotation, self.sous_dotation):
+            arr.setflags(write=False)
+
+        # Lots triés par date : (dates, positions des articles, lots), un élément par lot
+        lots_articles = [lots.normaliser(l) for l in self.df['Lots']] if 'Lots' in self.df.columns else [[]] * n
+        self.df['Peremption'] = pd.Series([l[0]['Peremption'] if l else None for l in lots_articles], index=self.df.index, dtype=object)
+        index = sorted(((l['Peremption'], p, l) for p, ls in enumerate(lots_articles) for l in ls), key=lambda e: e[:2])
+        self._dates_lots = np.array([d for d, _, _ in index], dtype='datetime64[D]')
+        self._positions_lots = np.array([p for _, p, _ in index], dtype=np.int64)
+        self._lots = tuple(l for _, _, l in index)
+        self._prochaines = np.array(self.df['Peremption'].tolist(), dtype='datetime64[D]')
+        for arr in (self._dates_lots, self._positions_lots, self._prochaines):
+            arr.setflags(write=False)
+        self._controles = {}
+
+        # Lignes sous forme de mappings en lecture seule : plus d'iterrows() à chaque rerun
+        self.lignes = tuple(MappingProxyType(r) for r in self.df.to_dict('records'))
+        self._par_id = {r['ID']: r for r in self.lignes}
+
+        # Index tiroir -> positions, dans l'ordre du chariot
+        codes = self.df['Tiroir'].cat.codes.to_numpy()
+        self._positions = {}
+        for code, tiroir in enumerate(self.df['Tiroir'].cat.categories):
+            pos = np.flatnonzero(codes == code) if n else np.empty(0, dtype=np.int64)
+            if len(pos):
+                pos.setflags(write=False)
+                self._positions[tiroir] = pos
+        self.tiroirs = list(self._positions)
+        self._lignes_tiroir = {t: tuple(self.lignes[p] for p in pos) for t, pos in self._positions.items()}
+        # Dates des lots de chaque tiroir, toujours triées (sous-suite de l'index global)
+        codes_lots = codes[self._positions_lots] if n else np.empty(0, dtype=np.int8)
+        categories = list(self.df['Tiroir'].cat.categories)
+        self._dates_tiroir = {t: self._dates_lots[codes_lots == categories.index(t)] for t in self.tiroirs}
+
+    def __len__(self):
+        return len(self.lignes)
+
+    @property
+    def ids(self):
+        return list(self._par_id)
+
+    def ligne(self, item_id):
+        return self._par_id.get(item_id)
+
+    def lignes_tiroir(self, tiroir):
+        return self._lignes_tiroir.get(tiroir, ())
+
+    def positions_tiroir(self, tiroir):
+        return self._positions.get(tiroir, np.empty(0, dtype=np.int64))
+
+    def sous_dotation_tiroir(self, tiroir):
+        """Nombre d'articles du tiroir sous leur dotation."""
+        return int(self.sous_dotation[self.positions_tiroir(tiroir)].sum())
+
+    def _borne(self, dates, avant):
+        return int(np.searchsorted(dates, np.datetime64(lots.iso(avant), 'D'), side='right'))
+
+    def peremptions(self, avant):
+        """Lots périmant au plus tard le jour `avant`, du premier au dernier : [{ID, Nom, Tiroir, Lot, Peremption, Qte}]."""
+        fin = self._borne(self._dates_lots, avant)
+        res = []
+        for p, l in zip(self._positions_lots[:fin], self._lots[:fin]):
+            r = self.lignes[p]
+            res.append({"ID": r['ID'], "Nom": r['Nom'], "Tiroir": r['Tiroir'], **l})
+        return res
+
+    def peremptions_tiroir(self, tiroir, avant):
+        """Nombre de lots du tiroir périmant au plus tard le jour `avant`."""
+        dates = self._dates_tiroir.get(tiroir)
+        return 0 if dates is None else self._borne(dates, avant)
+
+    def controle(self, limite=None):
+        """Précontrôle de checkliste : (IDs en écart par tiroir, nombre d'articles par tiroir).
+
+        Écart = stock sous la dotation, ou premier lot périmant au plus tard le jour
+        `limite`. Calculé une fois par snapshot et par limite, partagé par les sessions.
+        """
+        cle = lots.iso(limite) if limite is not None else None
+        res = self._controles.get(cle)
+        if res is None:
+            ecart = self.sous_dotation.copy()
+            if cle is not None and len(self._prochaines):
+                ecart |= self._prochaines <= np.datetime64(cle, 'D')  # NaT (pas de lot) : toujours faux
+            ecarts = {t: tuple(self.lignes[p]['ID'] for p in pos[ecart[pos]]) for t, pos in self._positions.items()}
+            res = self._controles[cle] = (ecarts, {t: len(pos) for t, pos in self._positions.items()})
+        return res
+
+    def memoire(self):
+        """Empreinte approximative en octets (DataFrame + lignes partagées)."""
+        df = int(self.df.memory_usage(deep=True).sum())
+        # Les chaînes des lignes sont celles du DataFrame : on ne compte que les dicts
+        lignes = sum(sys.getsizeof(dict(r)) for r in self.lignes)
+        return {"dataframe": df, "total": df + lignes}
+
+
+class ReplicaInventaire:
+    def __init__(self, db, collection="INVENTAIRE"):
+        self.db = db
+        self.collection = collection
+        self.version = 0
+        self.version_noms = 0
+        self._items = {}
+        self._snapshot = None
+        self._index = None
+        self._index_version = -1
+        self._verrou = threading.RLock()
+        self._pret = threading.Event()
+        self._ecoute = None
+
+    # --- Cycle de vie ---
+    def demarrer(self, attente=10):
+        """Branche l'écouteur et attend le snapshot initial (au plus `attente` s)."""
+        with self._verrou:
+            if self._ecoute is None:
+                self._ecoute = self.db.collection(self.collection).on_snapshot(self._sur_snapshot)
+        return self._pret.wait(attente)
+
+    def arreter(self):
+        with self._verrou:
+            if self._ecoute is not None:
+                self._ecoute.unsubscribe()
+                self._ecoute = None
+            self._pret.clear()
+
+    def relancer(self, attente=10):
+        """Reprend de zéro (écouteur coupé par une erreur réseau, données douteuses...)."""
+        self.arreter()
+        with self._verrou:
+            self._items = {}
+            self.version += 1
+            self.version_noms += 1
+        return self.demarrer(attente)
+
+    def pret(self):
+        return self._pret.is_set()
+
+    # --- Application des changements ---
+    def _sur_snapshot(self, docs, changements, read_time):
+        with self._verrou:
+            noms_modifies = False
+            for ch in changements:
+                doc = ch.document
+                ancien = self._items.get(doc.id)
+                if ch.type.name == "REMOVED":
+                    self._items.pop(doc.id, None)
+                    noms_modifies = True
+                else:
+                    data = doc.to_dict() or {}
+                    data['ID'] = doc.id
+                    self._items[doc.id] = data
+                    if ancien is None or any(ancien.get(c) != data.get(c) for c in CHAMPS_RECHERCHE):
+                        noms_modifies = True
+            if changements:
+                self.version += 1
+            if noms_modifies:
+                self.version_noms += 1
+        self._pret.set()
+
+    # --- Lecture ---
+    def snapshot(self, ordre_tiroirs=TIROIRS_DEFAUT):
+        """Snapshot trié par ID, reconstruit seulement quand la version (ou l'ordre des tiroirs) change."""
+        with self._verrou:
+            s = self._snapshot
+            if s is None or s.version != self.version or s.ordre_tiroirs != tuple(ordre_tiroirs):
+                items = [self._items[k] for k in sorted(self._items)]
+                self._snapshot = SnapshotInventaire(pd.DataFrame(items), self.version, ordre_tiroirs)
+            return self._snapshot
+
+    def index_recherche(self):
+        """Index accent-insensible, reconstruit seulement quand un nom ou un alias change."""
+        with self._verrou:
+            if self._index_version != self.version_noms:
+                self._index = recherche.IndexRecherche(self._items[k] for k in sorted(self._items))
+                self._index_version = self.version_noms
+            return self._index
+
+
+class ReplicaPartagee(ReplicaInventaire):
+    """Réplique dont une seule instance, le meneur (bail dans le tier partagé), écoute la base.
+
+    Le meneur publie chaque lot de changements sous un numéro de séquence
+    (compteur `version` du tier) : documents modifiés et IDs retirés, soit la
+    taille du lot, pas celle de l'inventaire. Les autres répliques appliquent
+    les deltas dans l'ordre. Un contenu complet ({ID: article}) n'est publié
+    qu'à la prise de la tête puis tous les POINT_COMPLET deltas : c'est lui que
+    relit une réplique qui démarre, ou qui trouve un delta manquant (expiré
+    après DUREE_DELTA, ou perdu avec un meneur arrêté en pleine publication).
+    Si le meneur s'arrête, son bail expire et une autre réplique prend l'écoute.
+    """
+    BAIL = 15            # s
+    SONDAGE = 1.0        # s entre deux tours (prolongation du bail ou relecture de la version publiée)
+    POINT_COMPLET = 100  # deltas entre deux contenus complets
+    DUREE_DELTA = 600    # s de conservation d'un delta dans le tier
+
+    def __init__(self, db, collection, tier, espace):
+        super().__init__(db, collection)
+        self.tier = tier
+        self.espace = espace
+        self.titulaire = uuid.uuid4().hex
+        self.meneur = False
+        self._publiee = None
+        self._noms_publies = None
+        self._premier_lot = False
+        self._complet = False
+        self._depuis_complet = 0
+        self._arret = threading.Event()
+        self._boucle = None
+
+    def _cle(self, nom):
+        return f"{self.espace}/replique/{self.collection}/{nom}"
+
+    # --- Cycle de vie ---
+    def demarrer(self, attente=10):
+        with self._verrou:
+            if self._boucle is None:
+                self._arret.clear()
+                self._boucle = threading.Thread(target=self._tourner, name=f"replique-{self.espace}", daemon=True)
+                self._boucle.start()
+        return self._pret.wait(attente)
+
+    def arreter(self):
+        self._arret.set()
+        with self._verrou:
+            boucle, self._boucle = self._boucle, None
+        if boucle is not None:
+            boucle.join(self.SONDAGE * 5)
+        self._quitter_la_tete()
+        try:
+            self.tier.liberer(self._cle("meneur"), self.titulaire)
+        except Exception as e:
+            print("Erreur réplique partagée (bail):", e)
+        self._pret.clear()
+
+    def _quitter_la_tete(self):
+        with self._verrou:
+            if self._ecoute is not None:
+                self._ecoute.unsubscribe()
+                self._ecoute = None
+            self.meneur = False
+            self._publiee = None  # la copie repartira du contenu complet du nouveau meneur
+
+    def _tourner(self):
+        while not self._arret.is_set():
+            try:
+                if self.tier.verrouiller(self._cle("meneur"), self.titulaire, self.BAIL):
+                    with self._verrou:
+                        if self._ecoute is None:
+                            self.meneur = True
+                            self._premier_lot = self._complet = True
+                            self._ecoute = self.db.collection(self.collection).on_snapshot(self._sur_snapshot)
+                else:
+                    if self.meneur:  # bail perdu (processus figé trop longtemps) : un autre écoute déjà
+                        self._quitter_la_tete()
+                    self._synchroniser()
+            except Exception as e:
+                print("Erreur réplique partagée:", e)
+            self._arret.wait(self.SONDAGE)
+
+    # --- Publication (meneur) ---
+    def _sur_snapshot(self, docs, changements, read_time):
+        if not self.meneur:
+            return super()._sur_snapshot(docs, changements, read_time)
+        with self._verrou:
+            if self._premier_lot:
+                # Premier lot de l'écoute : toute la collection (la copie de suiveur peut garder des supprimés)
+                self._items, self._premier_lot = {}, False
+            noms = self.version_noms
+            super()._sur_snapshot(docs, changements, read_time)
+            if not changements:
+                return
+            complet = self._complet or self._depuis_complet >= self.POINT_COMPLET
+            if complet:
+                publication = (dict(self._items), self.titulaire, self.version_noms)
+            else:
+                ids = {ch.document.id for ch in changements}
+                publication = ({i: self._items[i] for i in ids if i in self._items},
+                               [i for i in ids if i not in self._items], self.version_noms != noms)
+        try:
+            # Numéro d'abord, contenu ensuite : un suiveur qui voit le numéro avant le delta réessaie au tour suivant
+            n = self.tier.incrementer(self._cle("version"))
+            if complet:
+                self.tier.ranger(self._cle("contenu"), (*publication, n))
+                self._complet, self._depuis_complet = False, 0
+            else:
+                self.tier.ranger(self._cle(f"delta/{n}"), publication, self.DUREE_DELTA)
+                self._depuis_complet += 1
+        except Exception as e:
+            print("Erreur réplique partagée (publication):", e)
+
+    # --- Relecture (autres répliques) ---
+    def _synchroniser(self):
+        publiee = self.tier.version(self._cle("version"))
+        if self._publiee is not None and publiee < self._publiee:
+            self._publiee = None  # tier vidé : on repart du contenu complet
+        if self._publiee is None and not self._adopter_complet(0):
+            return
+        n = self._publiee + 1
+        while n <= publiee:
+            delta = self.tier.charger(self._cle(f"delta/{n}"))
+            if delta is None:
+                # Contenu complet à ce numéro, delta expiré ou perdu : on repart du dernier contenu complet
+                # s'il couvre ce numéro, sinon (delta en cours d'écriture) au tour suivant
+                if not self._adopter_complet(n):
+                    return
+                n = self._publiee + 1
+                continue
+            modifies, retires, noms = delta
+            with self._verrou:
+                self._items.update(modifies)
+                for i in retires:
+                    self._items.pop(i, None)
+                self.version += 1
+                if noms:
+                    self.version_noms += 1
+                self._publiee = n
+            n += 1
+        self._pret.set()
+
+    def _adopter_complet(self, minimum):
+        """Remplace la copie par le dernier contenu complet publié, s'il porte un numéro >= minimum."""
+        contenu = self.tier.charger(self._cle("contenu"))
+        if contenu is None or contenu[3] < minimum:
+            return False
+        items, titulaire, noms, n = contenu
+        with self._verrou:
+            self._items = items
+            self.version += 1
+            if (titulaire, noms) != self._noms_publies:
+                self.version_noms += 1
+                self._noms_publies = (titulaire, noms)
+            self._publiee = n
+        self._pret.set()
+        return True
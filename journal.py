@@ -0,0 +1,256 @@
+"""Journal local des écritures (SQLite en mode WAL).
+
+Chaque écriture de l'application (consommation, remplacement, checkliste)
+est d'abord ajoutée ici avec une clé d'idempotence, puis rejouée vers la base
+par un thread de fond, avec des relances espacées tant que le réseau ne
+répond pas. L'interface confirme dès que l'entrée est sur disque.
+
+Les entrées sont rejouées dans l'ordre de leur groupe (une consommation
+avant son remplacement : le groupe est l'ID du log) ; une entrée en échec ne
+retient que les suivantes de son groupe. Après TENTATIVES_MAX essais, elle
+passe en ECHEC : elle n'est plus rejouée jusqu'à relancer().
+
+Les gestionnaires doivent être idempotents (la clé sert d'ID de document ou
+de marqueur), un rejeu après un accusé de réception perdu ne doit rien changer.
+"""
+import json
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from datetime import datetime
+
+ATTENTE = "attente"
+FAIT = "fait"
+ECHEC = "echec"
+
+DELAI_MAX = 60                    # secondes entre deux essais, au plus
+TENTATIVES_MAX = 10               # environ 6 minutes d'essais avant ECHEC
+CONSERVATION = 7 * 24 * 3600      # les entrées synchronisées sont purgées après une semaine
+
+
+def nouvelle_cle():
+    return uuid.uuid4().hex
+
+
+def _encoder(o):
+    if isinstance(o, datetime):
+        return {"$date": o.isoformat()}
+    if hasattr(o, 'item'):  # scalaires numpy
+        return o.item()
+    raise TypeError(f"Type non journalisable : {type(o).__name__}")
+
+
+def _decoder(d):
+    if len(d) == 1 and "$date" in d:
+        return datetime.fromisoformat(d["$date"])
+    return d
+
+
+class Journal:
+    def __init__(self, chemin=":memory:"):
+        self.chemin = chemin
+        self._conn = sqlite3.connect(chemin, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS journal (
+            cle TEXT PRIMARY KEY, type TEXT NOT NULL, charge TEXT NOT NULL,
+            cree REAL NOT NULL, tentatives INTEGER NOT NULL DEFAULT 0,
+            prochain_essai REAL NOT NULL, statut TEXT NOT NULL, erreur TEXT, fait REAL, groupe TEXT)""")
+        # Journaux créés avant les groupes : chaque ancienne entrée est son propre groupe
+        if "groupe" not in {c[1] for c in self._conn.execute("PRAGMA table_info(journal)")}:
+            self._conn.execute("ALTER TABLE journal ADD COLUMN groupe TEXT")
+        self._conn.execute("UPDATE journal SET groupe = cle WHERE groupe IS NULL")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS journal_file ON journal (statut, cree)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS journal_groupe ON journal (groupe, cree)")
+        self._verrou = threading.Lock()
+        self._gestionnaires = {}
+        self._reveil = threading.Event()
+        self._arret = threading.Event()
+        self._thread = None
+        self._suivis = {}
+        # Appelé après chaque entrée synchronisée : apres(type, charge)
+        self.apres = None
+
+    def enregistrer(self, type_op, gestionnaire):
+        """gestionnaire(cle, charge) applique l'écriture ; toute exception la fait rejouer plus tard."""
+        self._gestionnaires[type_op] = gestionnaire
+
+    # --- File ---
+    def ajouter(self, type_op, charge, cle=None, groupe=None):
+        """Enregistre l'écriture sur disque et réveille le flusher. Une clé déjà connue est ignorée.
+
+        groupe : les entrées d'un même groupe sont rejouées dans l'ordre (par défaut, la clé).
+        """
+        cle = cle or nouvelle_cle()
+        maintenant = time.time()
+        with self._verrou:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO journal (cle, type, charge, cree, prochain_essai, statut, groupe) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (cle, type_op, json.dumps(charge, default=_encoder), maintenant, maintenant, ATTENTE, groupe or cle))
+        self._reveil.set()
+        return cle
+
+    def en_attente(self):
+        with self._verrou:
+            return self._conn.execute("SELECT COUNT(*) FROM journal WHERE statut = ?", (ATTENTE,)).fetchone()[0]
+
+    def derniere_erreur(self):
+        """(erreur, tentatives) de la plus ancienne entrée en attente qui a déjà échoué, ou None."""
+        with self._verrou:
+            ligne = self._conn.execute(
+                "SELECT erreur, tentatives FROM journal WHERE statut = ? AND erreur IS NOT NULL ORDER BY cree LIMIT 1",
+                (ATTENTE,)).fetchone()
+        return ligne
+
+    def echecs(self):
+        """[(cle, type, cree, erreur)] des entrées abandonnées après TENTATIVES_MAX essais."""
+        with self._verrou:
+            return self._conn.execute(
+                "SELECT cle, type, cree, erreur FROM journal WHERE statut = ? ORDER BY cree", (ECHEC,)).fetchall()
+
+    def relancer(self, cle=None):
+        """Remet en attente une entrée en ECHEC (toutes si cle est None) ; renvoie le nombre d'entrées relancées."""
+        with self._verrou:
+            n = self._conn.execute(
+                "UPDATE journal SET statut = ?, tentatives = 0, prochain_essai = ? WHERE statut = ? AND (? IS NULL OR cle = ?)",
+                (ATTENTE, time.time(), ECHEC, cle, cle)).rowcount
+        self._reveil.set()
+        return n
+
+    def statut(self, cle):
+        with self._verrou:
+            ligne = self._conn.execute("SELECT statut FROM journal WHERE cle = ?", (cle,)).fetchone()
+        return ligne[0] if ligne else None
+
+    def erreur(self, cle):
+        """Dernière erreur d'une entrée encore en attente (None si aucun échec)."""
+        with self._verrou:
+            ligne = self._conn.execute("SELECT erreur FROM journal WHERE cle = ? AND statut = ?", (cle, ATTENTE)).fetchone()
+        return ligne[0] if ligne else None
+
+    def suivre(self, cle):
+        """Future résolue quand l'entrée est synchronisée (True) ou passe en ECHEC (False)."""
+        with self._verrou:
+            futur = self._suivis.get(cle)
+            if futur is None:
+                futur = Future()
+                ligne = self._conn.execute("SELECT statut FROM journal WHERE cle = ?", (cle,)).fetchone()
+                if ligne and ligne[0] in (FAIT, ECHEC):
+                    futur.set_result(ligne[0] == FAIT)
+                else:
+                    self._suivis[cle] = futur
+            return futur
+
+    # --- Synchronisation ---
+    # Entrée rejouable : en attente, sans entrée plus ancienne de son groupe encore en attente ou en échec
+    _LIBRE = ("j.statut = :attente AND NOT EXISTS (SELECT 1 FROM journal p WHERE p.groupe = j.groupe "
+              "AND p.cree < j.cree AND p.statut IN (:attente, :echec))")
+
+    def vidanger(self):
+        """Rejoue les entrées prêtes, dans l'ordre de création ; une entrée qui échoue ne retient que son groupe.
+
+        Renvoie le délai (s) avant le prochain essai utile, ou None s'il n'y a rien à rejouer.
+        """
+        params = {"attente": ATTENTE, "echec": ECHEC}
+        while True:
+            with self._verrou:
+                ligne = self._conn.execute(
+                    "SELECT cle, type, charge, tentatives FROM journal j WHERE " + self._LIBRE +
+                    " AND j.prochain_essai <= :maintenant ORDER BY j.cree LIMIT 1",
+                    {**params, "maintenant": time.time()}).fetchone()
+                if ligne is None:
+                    prochain = self._conn.execute(
+                        "SELECT MIN(prochain_essai) FROM journal j WHERE " + self._LIBRE, params).fetchone()[0]
+            if ligne is None:
+                if prochain is None:
+                    self._purger()
+                    return None
+                return max(0.0, prochain - time.time())
+            cle, type_op, charge, tentatives = ligne
+            charge = json.loads(charge, object_hook=_decoder)
+            try:
+                self._gestionnaires[type_op](cle, charge)
+            except Exception as e:
+                print("Erreur journal:", type_op, e)
+                self._echouer(cle, tentatives + 1, e)
+                continue
+            # Caches invalidés avant de déclarer l'entrée faite : qui voit FAIT relit des données à jour
+            if self.apres:
+                try:
+                    self.apres(type_op, charge)
+                except Exception as e:
+                    print("Erreur journal (après):", e)
+            with self._verrou:
+                self._conn.execute("UPDATE journal SET statut = ?, fait = ?, erreur = NULL WHERE cle = ?",
+                                   (FAIT, time.time(), cle))
+                futur = self._suivis.pop(cle, None)
+            if futur is not None:
+                futur.set_result(True)
+
+    def _echouer(self, cle, tentatives, erreur):
+        """Nouvel essai espacé, ou ECHEC au-delà de TENTATIVES_MAX (la future de suivi est résolue à False)."""
+        futur = None
+        with self._verrou:
+            if tentatives >= TENTATIVES_MAX:
+                self._conn.execute("UPDATE journal SET tentatives = ?, statut = ?, erreur = ? WHERE cle = ?",
+                                   (tentatives, ECHEC, str(erreur)[:500], cle))
+                futur = self._suivis.pop(cle, None)
+            else:
+                delai = min(DELAI_MAX, 2 ** tentatives) * random.uniform(0.5, 1.0)
+                self._conn.execute(
+                    "UPDATE journal SET tentatives = ?, prochain_essai = ?, erreur = ? WHERE cle = ?",
+                    (tentatives, time.time() + delai, str(erreur)[:500], cle))
+        if futur is not None:
+            futur.set_result(False)
+
+    def _purger(self):
+        with self._verrou:
+            self._conn.execute("DELETE FROM journal WHERE statut = ? AND fait < ?", (FAIT, time.time() - CONSERVATION))
+
+    def _boucle(self):
+        while not self._arret.is_set():
+            delai = self.vidanger()
+            self._reveil.wait(timeout=5 if delai is None else min(delai, 5))
+            self._reveil.clear()
+
+    def demarrer(self):
+        """Lance le thread de synchronisation (reprend les entrées laissées par un arrêt précédent)."""
+        if self._thread is None or not self._thread.is_alive():
+            self._arret.clear()
+            self._thread = threading.Thread(target=self._boucle, name="journal-ecritures", daemon=True)
+            self._thread.start()
+        return self
+
+    def arreter(self):
+        self._arret.set()
+        self._reveil.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def attendre(self, delai=10):
+        """Attend que la file soit vide (scripts, banc de mesure). Renvoie True si c'est le cas."""
+        fin = time.monotonic() + delai
+        while self.en_attente():
+            if time.monotonic() > fin:
+                return False
+            self._reveil.set()
+            time.sleep(0.01)
+        return True
+
+
+_ouverts = {}
+_ouverts_verrou = threading.Lock()
+
+
+def partage(chemin):
+    """Journal unique par fichier dans le processus : deux flushers sur la même file
+    rejoueraient les mêmes entrées en parallèle."""
+    with _ouverts_verrou:
+        if chemin not in _ouverts:
+            _ouverts[chemin] = Journal(chemin)
+        return _ouverts[chemin]
@@ -0,0 +1,117 @@
+"""Lots et dates de péremption des articles d'INVENTAIRE.
+
+Un article peut porter `Lots` : [{"Lot": "A123", "Peremption": "2027-03-31", "Qte": 4}, ...],
+rangés du premier au dernier périmé (dates ISO : triables telles quelles, et
+sérialisables par le journal). Stock_Actuel reste le total de l'article ; les
+unités sans lot connu (Stock_Actuel - somme des lots) ne périment jamais.
+
+La consommation sort les lots FEFO (premier périmé, premier sorti) et le log
+garde les lots sortis ; le remplacement remet les unités sur le lot déclaré,
+ou à défaut sur les lots sortis par la consommation.
+"""
+from datetime import date, datetime
+
+
+def iso(valeur):
+    """Date ISO (AAAA-MM-JJ) d'une date, d'un datetime ou d'une chaîne ; None si illisible."""
+    if isinstance(valeur, datetime):
+        return valeur.date().isoformat()
+    if isinstance(valeur, date):
+        return valeur.isoformat()
+    if isinstance(valeur, str) and valeur.strip():
+        try:
+            return date.fromisoformat(valeur.strip()[:10]).isoformat()
+        except ValueError:
+            return None
+    return None
+
+
+def _deja_normal(lots):
+    """Vrai si les lots sont tels que normaliser les écrit (cas de tous les lots enregistrés par l'application)."""
+    precedent = None
+    for l in lots:
+        if type(l) is not dict: return False
+        p, q, lot = l.get("Peremption"), l.get("Qte"), l.get("Lot")
+        if type(p) is not str or len(p) != 10 or type(q) is not int or q <= 0 or type(lot) is not str or len(l) != 3:
+            return False
+        try:
+            date.fromisoformat(p)
+        except ValueError:
+            return False
+        if precedent is not None and (p, lot) <= precedent:
+            return False
+        precedent = (p, lot)
+    return True
+
+
+def normaliser(lots):
+    """Lots valides (date lisible, Qte > 0), triés FEFO ; les doublons (Lot, Peremption) sont fusionnés."""
+    if isinstance(lots, list) and _deja_normal(lots):
+        return lots
+    fusion = {}
+    for l in lots if isinstance(lots, list) else []:
+        if not isinstance(l, dict):
+            continue
+        peremption = iso(l.get("Peremption"))
+        try:
+            qte = int(l.get("Qte", 0))
+        except (TypeError, ValueError):
+            continue
+        if peremption is None or qte <= 0:
+            continue
+        cle = (peremption, str(l.get("Lot") or ""))
+        fusion[cle] = fusion.get(cle, 0) + qte
+    return [{"Lot": lot, "Peremption": p, "Qte": q} for (p, lot), q in sorted(fusion.items())]
+
+
+def total(lots):
+    return sum(l["Qte"] for l in normaliser(lots))
+
+
+def prochaine(lots):
+    """Date ISO du premier lot à périmer, ou None."""
+    lots = normaliser(lots)
+    return lots[0]["Peremption"] if lots else None
+
+
+def sortir(lots, qte):
+    """(lots restants, lots sortis) après consommation FEFO de qte unités.
+
+    Si les lots ne couvrent pas qte, le reste est pris sur les unités sans lot.
+    """
+    restants, sortis = [], []
+    for l in normaliser(lots):
+        pris = min(qte, l["Qte"])
+        if pris:
+            sortis.append({**l, "Qte": pris})
+            qte -= pris
+        if l["Qte"] > pris:
+            restants.append({**l, "Qte": l["Qte"] - pris})
+    return restants, sortis
+
+
+def rentrer(lots, ajouts, qte):
+    """Lots après remise de qte unités prises sur `ajouts` (dans l'ordre) ; le reste rentre sans lot."""
+    nouveaux = list(normaliser(lots))
+    for a in normaliser(ajouts):
+        if qte <= 0:
+            break
+        pris = min(qte, a["Qte"])
+        nouveaux.append({**a, "Qte": pris})
+        qte -= pris
+    return normaliser(nouveaux)
+
+
+def plafonner(lots, stock):
+    """Lots ramenés au stock de l'article : les derniers périmés sont retirés en premier."""
+    lots = list(normaliser(lots))
+    exces = sum(l["Qte"] for l in lots) - max(0, int(stock))
+    while exces > 0 and lots:
+        dernier = lots[-1]
+        retire = min(exces, dernier["Qte"])
+        exces -= retire
+        if dernier["Qte"] > retire:
+            lots[-1] = {**dernier, "Qte": dernier["Qte"] - retire}
+        else:
+            lots.pop()
+    return lots
@@ -0,0 +1,381 @@
+"""Instrumentation : opérations Firestore, temps et cache, par rerun, page et session.
+
+`instrumenter(db)` enveloppe le stockage : chaque lecture (get, stream,
+get_all, écouteur), écriture (set, update, add, commit de batch ou de
+transaction) et suppression est comptée selon les règles de facturation
+Firestore, avec sa durée, sous un « chemin » (collection.opération).
+
+Le contexte (session, page) est posé par main() au début de chaque rerun ;
+les threads de fond (journal, écouteur, pool d'écritures) comptent sous la
+page « arrière-plan ». Les compteurs vivent dans le processus : ils repartent
+de zéro au redémarrage.
+"""
+import functools
+import json
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from datetime import date
+
+# Offre gratuite Firestore, par jour
+QUOTAS = {"lectures": 50_000, "ecritures": 20_000, "suppressions": 20_000}
+
+ARRIERE_PLAN = "arrière-plan"
+
+_contexte = threading.local()
+
+
+class Mesures:
+    def __init__(self, historique=200):
+        self._verrou = threading.Lock()
+        self.depart = time.time()
+        self.jours = defaultdict(Counter)          # date ISO -> lectures / ecritures / suppressions
+        self.detail = defaultdict(Counter)         # (page, chemin) -> compteurs + ms
+        self.sessions = defaultdict(Counter)       # session -> compteurs
+        self.cache = defaultdict(Counter)          # fonction -> appels / calculs
+        self.pages = defaultdict(Counter)          # page -> reruns / ms
+        self.reruns = deque(maxlen=historique)     # derniers reruns (toutes sessions)
+
+    def enregistrer(self, chemin, lectures=0, ecritures=0, suppressions=0, duree=0.0):
+        session, page, courant = _contexte_courant()
+        ops = {"lectures": lectures, "ecritures": ecritures, "suppressions": suppressions}
+        with self._verrou:
+            self.jours[date.today().isoformat()].update(ops)
+            d = self.detail[(page, chemin)]
+            d.update(ops)
+            d["appels"] += 1
+            d["ms"] += duree * 1000
+            self.sessions[session].update(ops)
+            if courant is not None:
+                courant.update(ops)
+                courant["ms_stockage"] += duree * 1000
+
+    def compter_cache(self, fonction, calcul=False):
+        _, _, courant = _contexte_courant()
+        cle = "calculs" if calcul else "appels"
+        with self._verrou:
+            self.cache[fonction][cle] += 1
+            if courant is not None:
+                courant["cache_" + cle] += 1
+
+    # --- Reruns ---
+    def debut_rerun(self, page):
+        _contexte.session, _contexte.page = _session_streamlit() or "-", page or "?"
+        _contexte.rerun = Counter()
+        _contexte.t0 = time.perf_counter()
+
+    def fin_rerun(self):
+        courant = getattr(_contexte, "rerun", None)
+        if courant is None:
+            return None
+        ms = (time.perf_counter() - _contexte.t0) * 1000
+        rerun = {"session": _contexte.session, "page": _contexte.page, "debut": time.time() - ms / 1000,
+                 "ms": round(ms, 1), **{k: round(v, 1) for k, v in courant.items()}}
+        with self._verrou:
+            self.reruns.append(rerun)
+            self.pages[_contexte.page]["reruns"] += 1
+            self.pages[_contexte.page]["ms"] += ms
+        _contexte.rerun = None
+        _contexte.session = None
+        return rerun
+
+    # --- Lecture / export ---
+    def aujourdhui(self):
+        with self._verrou:
+            return dict(self.jours.get(date.today().isoformat(), Counter()))
+
+    def par_chemin(self, page=None):
+        """{chemin: compteurs} (toutes pages, ou une seule)."""
+        out = defaultdict(Counter)
+        with self._verrou:
+            for (p, chemin), c in self.detail.items():
+                if page is None or p == page:
+                    out[chemin].update(c)
+        return out
+
+    def par_page(self):
+        out = defaultdict(Counter)
+        with self._verrou:
+            for (p, _), c in self.detail.items():
+                out[p].update(c)
+            for p, c in self.pages.items():
+                out[p]["reruns"] += c["reruns"]
+                out[p]["ms_reruns"] += c["ms"]
+        return out
+
+    def derniers_reruns(self, session=None, n=20):
+        with self._verrou:
+            reruns = [r for r in self.reruns if session is None or r["session"] == session]
+        return reruns[-n:]
+
+    def exporter(self):
+        with self._verrou:
+            return {
+                "depuis": self.depart,
+                "quotas": QUOTAS,
+                "jours": {j: dict(c) for j, c in self.jours.items()},
+                "detail": [{"page": p, "chemin": ch, **{k: round(v, 1) for k, v in c.items()}}
+                           for (p, ch), c in sorted(self.detail.items())],
+                "sessions": {s: dict(c) for s, c in self.sessions.items()},
+                "cache": {f: dict(c) for f, c in self.cache.items()},
+                "pages": {p: {"reruns": c["reruns"], "ms": round(c["ms"], 1)} for p, c in self.pages.items()},
+                "reruns": list(self.reruns),
+            }
+
+    def exporter_json(self):
+        return json.dumps(self.exporter(), ensure_ascii=False, indent=2)
+
+    def exporter_prometheus(self):
+        """Format texte d'exposition Prometheus (compteurs cumulés depuis le démarrage)."""
+        lignes = []
+
+        def serie(nom, aide, valeurs):
+            lignes.append(f"# HELP {nom} {aide}")
+            lignes.append(f"# TYPE {nom} counter")
+            for labels, v in valeurs:
+                lab = ",".join(f'{k}="{_echapper(x)}"' for k, x in labels.items())
+                lignes.append(f"{nom}{{{lab}}} {round(v, 3)}")
+
+        with self._verrou:
+            detail = sorted(self.detail.items())
+            cache = sorted(self.cache.items())
+            pages = sorted(self.pages.items())
+        for cle, aide in (("lectures", "Documents lus (facturés)"), ("ecritures", "Documents écrits"),
+                          ("suppressions", "Documents supprimés"), ("appels", "Appels au stockage")):
+            serie(f"chariot_firestore_{cle}_total", aide,
+                  [({"page": p, "chemin": ch}, c[cle]) for (p, ch), c in detail])
+        serie("chariot_firestore_secondes_total", "Temps passé dans le stockage",
+              [({"page": p, "chemin": ch}, c["ms"] / 1000) for (p, ch), c in detail])
+        serie("chariot_cache_appels_total", "Appels aux fonctions cachées", [({"fonction": f}, c["appels"]) for f, c in cache])
+        serie("chariot_cache_calculs_total", "Appels non servis par le cache (miss)",
+              [({"fonction": f}, c["calculs"]) for f, c in cache])
+        serie("chariot_reruns_total", "Reruns de script", [({"page": p}, c["reruns"]) for p, c in pages])
+        serie("chariot_reruns_secondes_total", "Durée cumulée des reruns", [({"page": p}, c["ms"] / 1000) for p, c in pages])
+        return "\n".join(lignes) + "\n"
+
+    def reinitialiser(self):
+        self.__init__(self.reruns.maxlen)
+
+
+def _echapper(valeur):
+    return str(valeur).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _session_streamlit():
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx(suppress_warning=True)
+        return ctx.session_id if ctx else None
+    except Exception:
+        return None
+
+
+def _contexte_courant():
+    session = getattr(_contexte, "session", None)
+    if session is not None:
+        return session, _contexte.page, getattr(_contexte, "rerun", None)
+    # Fragment relancé seul (run_every, st.rerun(fragment)) : nouveau thread, même session
+    session = _session_streamlit()
+    if session is not None:
+        return session, "fragment", None
+    return "-", ARRIERE_PLAN, None
+
+
+MESURES = Mesures()
+
+
+# --- CACHE ---
+def cache_data(**options):
+    """st.cache_data qui compte les appels et les calculs (miss) de la fonction."""
+    import streamlit as st
+
+    def decorateur(fn):
+        nom = fn.__name__
+
+        @functools.wraps(fn)
+        def calcul(*args, **kwargs):
+            MESURES.compter_cache(nom, calcul=True)
+            return fn(*args, **kwargs)
+
+        cachee = st.cache_data(**options)(calcul)
+
+        @functools.wraps(fn)
+        def appel(*args, **kwargs):
+            MESURES.compter_cache(nom)
+            return cachee(*args, **kwargs)
+        appel.clear = cachee.clear
+        return appel
+    return decorateur
+
+
+# --- STOCKAGE INSTRUMENTÉ ---
+# Méthodes qui renvoient une nouvelle requête / référence : on enveloppe le résultat
+_CHAINAGE = {"where", "order_by", "limit", "limit_to_last", "offset", "start_after", "start_at",
+             "end_before", "end_at", "select"}
+
+
+def _brut(objet):
+    return objet._cible if isinstance(objet, _Enveloppe) else objet
+
+
+def _bruts(args, kwargs):
+    return [_brut(a) for a in args], {k: _brut(v) for k, v in kwargs.items()}
+
+
+def _iterer(iterable, chemin, t0, lectures=None):
+    """Compte les documents au fil de l'itération ; enregistre à la fin (ou à l'abandon)."""
+    n = 0
+    try:
+        for doc in iterable:
+            n += 1
+            yield doc
+    finally:
+        # Une requête sans résultat est facturée une lecture
+        MESURES.enregistrer(chemin, lectures=max(1, n) if lectures is None else lectures,
+                            duree=time.perf_counter() - t0)
+
+
+class _Enveloppe:
+    def __init__(self, cible, chemin):
+        self._cible = cible
+        self._chemin = chemin
+
+    def __getattr__(self, nom):
+        return getattr(self._cible, nom)
+
+    def __repr__(self):
+        return f"<instrumenté {self._chemin} {self._cible!r}>"
+
+
+class _Requete(_Enveloppe):
+    """Collection, requête ou référence de document."""
+
+    def __getattr__(self, nom):
+        attr = getattr(self._cible, nom)
+        if nom in _CHAINAGE:
+            def chainer(*args, **kwargs):
+                args, kwargs = _bruts(args, kwargs)
+                return _Requete(attr(*args, **kwargs), self._chemin)
+            return chainer
+        return attr
+
+    def collection(self, nom):
+        return _Requete(self._cible.collection(nom), f"{self._chemin}/{nom}")
+
+    def document(self, *args):
+        return _Requete(self._cible.document(*args), self._chemin)
+
+    def stream(self, *args, **kwargs):
+        t0 = time.perf_counter()
+        return _iterer(self._cible.stream(*args, **kwargs), f"{self._chemin}.stream", t0)
+
+    def get(self, *args, **kwargs):
+        args, kwargs = _bruts(args, kwargs)
+        t0 = time.perf_counter()
+        res = self._cible.get(*args, **kwargs)
+        n = max(1, len(res)) if isinstance(res, list) else 1
+        MESURES.enregistrer(f"{self._chemin}.get", lectures=n, duree=time.perf_counter() - t0)
+        return res
+
+    def _ecrire(self, op, *args, **kwargs):
+        args, kwargs = _bruts(args, kwargs)
+        t0 = time.perf_counter()
+        res = getattr(self._cible, op)(*args, **kwargs)
+        cle = "suppressions" if op == "delete" else "ecritures"
+        MESURES.enregistrer(f"{self._chemin}.{op}", duree=time.perf_counter() - t0, **{cle: 1})
+        return res
+
+    def set(self, *args, **kwargs): return self._ecrire("set", *args, **kwargs)
+    def update(self, *args, **kwargs): return self._ecrire("update", *args, **kwargs)
+    def create(self, *args, **kwargs): return self._ecrire("create", *args, **kwargs)
+    def delete(self, *args, **kwargs): return self._ecrire("delete", *args, **kwargs)
+
+    def add(self, *args, **kwargs):
+        t0 = time.perf_counter()
+        res = self._cible.add(*args, **kwargs)
+        MESURES.enregistrer(f"{self._chemin}.add", ecritures=1, duree=time.perf_counter() - t0)
+        return res
+
+    def on_snapshot(self, callback):
+        chemin = f"{self._chemin}.on_snapshot"
+        premier = [True]
+
+        def compte(docs, changements, read_time):
+            # Écoute initiale : tous les documents (au moins une lecture) ; ensuite : les changements
+            n = max(1, len(changements)) if premier[0] else len(changements)
+            premier[0] = False
+            if n:
+                MESURES.enregistrer(chemin, lectures=n)
+            return callback(docs, changements, read_time)
+        return self._cible.on_snapshot(compte)
+
+
+class _Ecrivain(_Enveloppe):
+    """Batch ou transaction : les écritures sont comptées au commit."""
+
+    def __init__(self, cible, chemin):
+        super().__init__(cible, chemin)
+        self.en_attente = Counter()
+        self.collections = Counter()
+
+    def _ajouter(self, op, ref, *args, **kwargs):
+        ref = _brut(ref)
+        args, kwargs = _bruts(args, kwargs)
+        self.en_attente["suppressions" if op == "delete" else "ecritures"] += 1
+        self.collections[_nom_collection(ref)] += 1
+        return getattr(self._cible, op)(ref, *args, **kwargs)
+
+    def set(self, ref, *args, **kwargs): return self._ajouter("set", ref, *args, **kwargs)
+    def update(self, ref, *args, **kwargs): return self._ajouter("update", ref, *args, **kwargs)
+    def create(self, ref, *args, **kwargs): return self._ajouter("create", ref, *args, **kwargs)
+    def delete(self, ref, *args, **kwargs): return self._ajouter("delete", ref, *args, **kwargs)
+
+    def chemin_commit(self):
+        return f"{'+'.join(sorted(self.collections)) or '?'}.{self._chemin}"
+
+    def commit(self, *args, **kwargs):
+        t0 = time.perf_counter()
+        res = self._cible.commit(*args, **kwargs)
+        MESURES.enregistrer(self.chemin_commit(), duree=time.perf_counter() - t0, **self.en_attente)
+        return res
+
+
+def _nom_collection(ref):
+    # Chemin de collection du document (sous-collections comprises), sans les IDs
+    return "/".join((getattr(ref, "path", "") or "?").split("/")[0::2])
+
+
+class StockageInstrumente(_Enveloppe):
+    def __init__(self, cible):
+        super().__init__(cible, "db")
+
+    def collection(self, nom):
+        return _Requete(self._cible.collection(nom), nom)
+
+    def batch(self):
+        return _Ecrivain(self._cible.batch(), "batch")
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        refs = [_brut(r) for r in references]
+        colls = sorted({_nom_collection(r) for r in refs})
+        t0 = time.perf_counter()
+        res = self._cible.get_all(refs, field_paths=field_paths, transaction=_brut(transaction))
+        return _iterer(res, f"{'+'.join(colls) or '?'}.get_all", t0, lectures=len(refs))
+
+    def executer_transaction(self, fonction, *args, **kwargs):
+        essais = []
+
+        def instrumentee(transaction, *a, **k):
+            # Firestore rejoue la fonction en cas de conflit : seul le dernier essai est commité
+            t = _Ecrivain(transaction, "transaction")
+            essais.append(t)
+            return fonction(t, *a, **k)
+        t0 = time.perf_counter()
+        res = self._cible.executer_transaction(instrumentee, *args, **kwargs)
+        if essais:
+            MESURES.enregistrer(essais[-1].chemin_commit(), duree=time.perf_counter() - t0, **essais[-1].en_attente)
+        return res
+
+
+def instrumenter(db):
+    return None if db is None else StockageInstrumente(db)
@@ -0,0 +1,154 @@
+"""PDF de checkliste (fpdf2), importé à la demande par chariot.py.
+
+Les logos sont décodés et réduits à leur taille d'impression une fois par
+processus (logo_service.png fait 1188 x 1280 px pour 30 mm de large).
+`empreinte` donne la clé de contenu sous laquelle chariot.py garde les PDF déjà
+rendus. La colonne Péremption donne le premier lot à périmer de chaque article
+(vide pour les checklistes sans suivi de lots).
+
+`exporter_lot` rend plusieurs checklistes d'un coup, en un PDF unique ou en un
+ZIP d'un PDF par checkliste, dans un pool de processus si on lui en donne un.
+"""
+import hashlib
+import json
+import os
+import threading
+import zipfile
+
+from fpdf import FPDF
+
+LOGOS = (("logo_chu.png", 170), ("logo_service.png", 10))  # (fichier, x en mm)
+LARGEUR_LOGO = 30   # mm
+DPI_LOGO = 200
+
+_logos = None
+_verrou_logos = threading.Lock()
+
+
+def logos():
+    """[(image PIL réduite, x)] : lecture, décodage et redimensionnement une seule fois par processus."""
+    global _logos
+    with _verrou_logos:
+        if _logos is None:
+            from PIL import Image
+            largeur = round(LARGEUR_LOGO / 25.4 * DPI_LOGO)
+            charges = []
+            for fichier, x in LOGOS:
+                if not os.path.exists(fichier):
+                    continue
+                try:
+                    img = Image.open(fichier)
+                    img.load()
+                    if img.width > largeur:
+                        img = img.resize((largeur, round(img.height * largeur / img.width)), Image.LANCZOS)
+                    charges.append((img, x))
+                except Exception as e:
+                    print("Erreur logo", fichier, e)
+            _logos = charges
+        return _logos
+
+
+class PDF(FPDF):
+    def header(self):
+        for img, x in logos():
+            self.image(img, x, 8, LARGEUR_LOGO)
+        self.set_font('Helvetica', 'B', 15)
+        self.cell(0, 10, 'CHECKLISTE CHARIOT URGENCE', 0, 1, 'C')
+        self.set_font('Helvetica', 'I', 10)
+        self.cell(0, 10, 'Service Réanimation Mère-Enfant - CHU Hassan II', 0, 1, 'C')
+        self.ln(20)
+
+    def footer(self):
+        self.set_y(-15)
+        self.set_font('Helvetica', 'I', 8)
+        self.cell(0, 10, f'Page {self.page_no()}', 0, 0, 'C')
+
+
+def empreinte(data_checklist, user, date_check):
+    """Hash du contenu rendu : deux checklistes identiques partagent le même PDF."""
+    brut = json.dumps([data_checklist, user, date_check], sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(brut.encode("utf-8")).hexdigest()
+
+
+def _ecrire(pdf, data_checklist, user, date_check):
+    pdf.add_page()
+    pdf.set_font("Helvetica", size=12)
+    date_fmt = date_check.strftime("%d/%m/%Y à %H:%M")
+    pdf.multi_cell(0, 10, f"Checkliste faite le {date_fmt} par {user}.\nStatut : VALIDÉE (Conforme)", align='C')
+    pdf.ln(10)
+    pdf.set_fill_color(200, 220, 255)
+    pdf.set_font("Helvetica", 'B', 10)
+    pdf.cell(80, 10, "Matériel", 1, 0, 'C', True)
+    pdf.cell(25, 10, "Tiroir", 1, 0, 'C', True)
+    pdf.cell(20, 10, "Dotation", 1, 0, 'C', True)
+    pdf.cell(30, 10, "Péremption", 1, 0, 'C', True)
+    pdf.cell(25, 10, "État", 1, 1, 'C', True)
+    pdf.set_font("Helvetica", size=9)
+    for item in data_checklist:
+        nom = str(item.get('Nom', '')).encode('latin-1', 'replace').decode('latin-1')
+        per = item.get('Peremption') or ''
+        pdf.cell(80, 8, nom, 1)
+        pdf.cell(25, 8, str(item.get('Tiroir', '')), 1, 0, 'C')
+        pdf.cell(20, 8, str(item.get('Dotation', '')), 1, 0, 'C')
+        pdf.cell(30, 8, f"{per[8:10]}/{per[5:7]}/{per[:4]}" if per else "", 1, 0, 'C')
+        pdf.cell(25, 8, "[X] OK", 1, 1, 'C')
+
+    pdf.ln(5)
+    pdf.set_font("Helvetica", 'B', 9)
+    pdf.cell(0, 8, "Sécurité : Tiroirs verrouillés + Clé/Ciseaux attachés [X] OUI", 0, 1, 'L')
+
+
+def _octets(pdf):
+    pdf_str = pdf.output(dest='S')
+    if isinstance(pdf_str, str): return pdf_str.encode('latin-1', 'replace')
+    return bytes(pdf_str)
+
+
+def generer(data_checklist, user, date_check):
+    pdf = PDF()
+    _ecrire(pdf, data_checklist, user, date_check)
+    return _octets(pdf)
+
+
+def generer_fusion(checklists):
+    """Un seul document, une checkliste par page(s) : les logos n'y sont incorporés qu'une fois."""
+    pdf = PDF()
+    if not checklists:
+        pdf.add_page()
+        pdf.set_font("Helvetica", size=12)
+        pdf.cell(0, 10, "Aucune checkliste sur la période.", 0, 1, 'C')
+    for c in checklists:
+        _ecrire(pdf, c.get('Contenu', []), c.get('Utilisateur'), c.get('Date'))
+    return _octets(pdf)
+
+
+# --- EXPORT PAR LOT ---
+def nom_fichier(c):
+    return f"Check_{c['Date']:%Y%m%d_%H%M}_{c.get('id_doc', '')}.pdf"
+
+
+def _rendre(c):
+    """Tâche du pool : (nom du fichier, PDF)."""
+    return nom_fichier(c), generer(c.get('Contenu', []), c.get('Utilisateur'), c.get('Date'))
+
+
+def exporter_lot(checklists, destination, format="pdf", pool=None):
+    """Écrit les checklistes (dicts Date / Utilisateur / Contenu / id_doc) dans destination.
+
+    format "pdf" : un PDF fusionné, rendu d'un bloc (dans un processus du pool s'il
+    y en a un, pour ne pas occuper le serveur) ; "zip" : un PDF par checkliste, rendus
+    en parallèle et ajoutés à l'archive au fil de l'eau. Renvoie le nombre de checklistes.
+    """
+    checklists = sorted(checklists, key=lambda c: c['Date'])
+    if format == "pdf":
+        donnees = pool.submit(generer_fusion, checklists).result() if pool else generer_fusion(checklists)
+        destination.write(donnees)
+    elif format == "zip":
+        resultats = pool.map(_rendre, checklists, chunksize=8) if pool else map(_rendre, checklists)
+        # Les PDF sont déjà compressés : ZIP_STORED évite de les recompresser pour rien
+        with zipfile.ZipFile(destination, "w", zipfile.ZIP_STORED) as archive:
+            for nom, donnees in resultats:
+                archive.writestr(nom, donnees)
+    else:
+        raise ValueError(f"Format d'export inconnu : {format}")
+    return len(checklists)
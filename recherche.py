@@ -0,0 +1,99 @@
+"""Index de recherche de l'inventaire, construit une fois par snapshot.
+
+Les noms (et les alias facultatifs du champ `Synonymes` : DCI, abréviations)
+sont normalisés sans accents puis indexés par préfixe de mot et par trigramme.
+Une requête se résout par quelques lookups de dictionnaire au lieu d'un
+str.contains sur tout le DataFrame à chaque frappe.
+"""
+import heapq
+import re
+import unicodedata
+from collections import Counter, defaultdict
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+# Seuil de similarité (trigrammes communs / trigrammes du mot cherché) pour le repli flou
+SEUIL_TRIGRAMMES = 0.6
+
+
+def normaliser(texte):
+    """'Sérum Physio 0,9%' -> 'serum physio 0 9'"""
+    texte = unicodedata.normalize("NFKD", str(texte))
+    texte = "".join(c for c in texte if not unicodedata.combining(c))
+    return _NON_ALNUM.sub(" ", texte.lower()).strip()
+
+
+def trigrammes(mot):
+    mot = f" {mot} "
+    return {mot[i:i + 3] for i in range(len(mot) - 2)}
+
+
+def synonymes(item):
+    """Alias d'un article : liste ou texte séparé par des virgules / points-virgules."""
+    val = item.get('Synonymes')
+    if isinstance(val, str):
+        return [v for v in re.split(r"[,;]", val) if v.strip()]
+    if isinstance(val, (list, tuple)):
+        return [str(v) for v in val if v]
+    return []
+
+
+class IndexRecherche:
+    def __init__(self, items):
+        """items : itérable de dicts avec au moins 'ID' et 'Nom'."""
+        self.ids = []
+        self._noms = []
+        self._prefixes = defaultdict(set)
+        self._mots = defaultdict(set)
+        self._trigrammes = defaultdict(set)
+        for pos, item in enumerate(items):
+            self.ids.append(item['ID'])
+            nom = normaliser(item.get('Nom', ''))
+            self._noms.append(nom)
+            for texte in [nom] + [normaliser(s) for s in synonymes(item)]:
+                for mot in texte.split():
+                    self._mots[mot].add(pos)
+                    for i in range(1, len(mot) + 1):
+                        self._prefixes[mot[:i]].add(pos)
+                    for tri in trigrammes(mot):
+                        self._trigrammes[tri].add(pos)
+
+    @classmethod
+    def depuis_dataframe(cls, df):
+        colonnes = [c for c in ('ID', 'Nom', 'Synonymes') if c in df.columns]
+        return cls(df[colonnes].to_dict('records'))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _scores_mot(self, mot):
+        """{position: score} pour un mot de la requête."""
+        scores = dict.fromkeys(self._prefixes.get(mot, ()), 2.0)
+        for pos in self._mots.get(mot, ()):
+            scores[pos] = 3.0
+        if scores or len(mot) < 3:
+            return scores
+        # Repli flou : fautes de frappe, fragments en milieu de mot
+        tris = trigrammes(mot)
+        communs = Counter()
+        for tri in tris:
+            communs.update(self._trigrammes.get(tri, ()))
+        return {pos: n / len(tris) for pos, n in communs.items() if n / len(tris) >= SEUIL_TRIGRAMMES}
+
+    def chercher(self, requete, limite=None):
+        """IDs des articles contenant tous les mots de la requête, les meilleurs en premier."""
+        mots = normaliser(requete).split()
+        if not mots:
+            return []
+        total = None
+        for mot in mots:
+            scores = self._scores_mot(mot)
+            if total is None:
+                total = scores
+            else:
+                total = {pos: total[pos] + sc for pos, sc in scores.items() if pos in total}
+            if not total:
+                return []
+        cle = lambda pos: (-total[pos], self._noms[pos])
+        rang = sorted(total, key=cle) if limite is None else heapq.nsmallest(limite, total, key=cle)
+        return [self.ids[pos] for pos in rang]
@@ -0,0 +1,210 @@
+"""Agrégats de consommation pré-calculés (collection STATS).
+
+Un document par jour (`jour_AAAA-MM-JJ`) et par mois (`mois_AAAA-MM`) porte
+des compteurs par article et par tiroir. Ils sont incrémentés dans le même
+commit que valider_panier / les remplacements, si bien que le tableau de bord
+lit une poignée de documents quel que soit le volume de LOGS.
+
+Pour reconstruire les agrégats depuis les LOGS existants (application au
+repos de préférence, le recalcul écrase les compteurs) :
+
+    python statistiques.py backfill
+"""
+import argparse
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+import archives
+import chariots
+import stockage
+
+COLLECTION = "STATS"
+
+
+def naif(d):
+    """Les dates sont écrites sans fuseau (datetime.now()) et relues en UTC."""
+    if d is None:
+        return None
+    return d.replace(tzinfo=None) if getattr(d, 'tzinfo', None) else d
+
+
+def cle_jour(d):
+    return f"jour_{d:%Y-%m-%d}"
+
+
+def cle_mois(d):
+    return f"mois_{d:%Y-%m}"
+
+
+def _entete(periode, d):
+    debut = datetime(d.year, d.month, d.day) if periode == "jour" else datetime(d.year, d.month, 1)
+    return {"Periode": periode, "Debut": debut}
+
+
+def _ops_periodes(db, date, champs):
+    date = naif(date)
+    return [
+        ("merge", db.collection(COLLECTION).document(cle_jour(date)), {**_entete("jour", date), **champs}),
+        ("merge", db.collection(COLLECTION).document(cle_mois(date)), {**_entete("mois", date), **champs}),
+    ]
+
+
+def ecritures_consommation(db, date, lignes):
+    """Opérations à ajouter au commit d'une consommation (lignes = Details_Struct)."""
+    articles, tiroirs = Counter(), Counter()
+    for l in lignes:
+        articles[l['ID']] += int(l.get('Qte', 0))
+        tiroirs[str(l.get('Tiroir', '?'))] += int(l.get('Qte', 0))
+    if not articles:
+        return []
+    return _ops_periodes(db, date, {
+        "Conso_Articles": {k: db.increment(v) for k, v in articles.items()},
+        "Conso_Tiroirs": {k: db.increment(v) for k, v in tiroirs.items()},
+        "Nb_Consommations": db.increment(1),
+    })
+
+
+def ecritures_remplacement(db, date, remplacements):
+    """Opérations à ajouter au commit d'un remplacement.
+
+    remplacements : [(ligne Details_Struct, date de la consommation d'origine)]
+    """
+    articles, delai_h, n = Counter(), 0.0, 0
+    for ligne, date_conso in remplacements:
+        articles[ligne['ID']] += int(ligne.get('Qte', 0))
+        if date_conso is not None:
+            delai_h += (naif(date) - naif(date_conso)).total_seconds() / 3600
+            n += 1
+    if not articles:
+        return []
+    return _ops_periodes(db, date, {
+        "Rempl_Articles": {k: db.increment(v) for k, v in articles.items()},
+        "Nb_Lignes_Remplacees": db.increment(n),
+        "Delai_Remplacement_h": db.increment(round(delai_h, 3)),
+    })
+
+
+# --- LECTURE (TABLEAU DE BORD) ---
+def lire_jours(db, fin, n_jours):
+    """Les n_jours documents journaliers jusqu'à `fin` incluse : n_jours lectures."""
+    jours = [fin - timedelta(days=i) for i in range(n_jours - 1, -1, -1)]
+    refs = [db.collection(COLLECTION).document(cle_jour(j)) for j in jours]
+    return _lire(db, refs, [f"{j:%Y-%m-%d}" for j in jours])
+
+
+def lire_mois(db, fin, n_mois):
+    mois = []
+    a, m = fin.year, fin.month
+    for _ in range(n_mois):
+        mois.append(datetime(a, m, 1))
+        a, m = (a, m - 1) if m > 1 else (a - 1, 12)
+    mois.reverse()
+    refs = [db.collection(COLLECTION).document(cle_mois(m)) for m in mois]
+    return _lire(db, refs, [f"{m:%Y-%m}" for m in mois])
+
+
+def _lire(db, refs, libelles):
+    docs = {d.id: (d.to_dict() or {}) for d in db.get_all(refs) if d.exists}
+    return [dict(docs.get(ref.id, {}), Libelle=lib) for ref, lib in zip(refs, libelles)]
+
+
+def tableau(docs, champ):
+    """DataFrame périodes x clés (articles ou tiroirs) pour un champ de compteurs."""
+    import pandas as pd
+    df = pd.DataFrame.from_records([d.get(champ) or {} for d in docs], index=[d['Libelle'] for d in docs])
+    return df.fillna(0)
+
+
+# --- RECALCUL COMPLET ---
+def _date_remplacement(log):
+    """Date de remplacement d'un log : approximation à partir des traces enregistrées."""
+    if log.get('Date_Remplacement'):
+        return log['Date_Remplacement']
+    traces = [t.get('Date') for t in log.get('Historique_Remplacements') or [] if isinstance(t, dict) and t.get('Date')]
+    return max(traces, key=naif) if traces else log.get('Date')
+
+
+def recalculer(db, taille_page=500, ecrire=True):
+    """Reconstruit tous les agrégats depuis LOGS et ses archives, page par page (mémoire bornée par le nombre de jours)."""
+    agregats = defaultdict(lambda: {"Conso_Articles": Counter(), "Conso_Tiroirs": Counter(),
+                                    "Rempl_Articles": Counter(), "Nb_Consommations": 0,
+                                    "Nb_Lignes_Remplacees": 0, "Delai_Remplacement_h": 0.0})
+    entetes = {}
+
+    def cumuler(date, fn):
+        date = naif(date)
+        for periode, cle in (("jour", cle_jour(date)), ("mois", cle_mois(date))):
+            entetes[cle] = _entete(periode, date)
+            fn(agregats[cle])
+
+    n_logs = 0
+
+    def traiter(log):
+        nonlocal n_logs
+        date = log.get('Date')
+        if date is None:
+            return
+        n_logs += 1
+        lignes = [l for l in log.get('Details_Struct') or [] if l.get('ID')]
+
+        def conso(a):
+            a["Nb_Consommations"] += 1
+            for l in lignes:
+                a["Conso_Articles"][l['ID']] += int(l.get('Qte', 0))
+                a["Conso_Tiroirs"][str(l.get('Tiroir', '?'))] += int(l.get('Qte', 0))
+        cumuler(date, conso)
+
+        remplacees = [l for l in lignes if l.get('EstRemplace')]
+        date_r = _date_remplacement(log)
+        if remplacees and date_r is not None:
+            delai = max(0.0, (naif(date_r) - naif(date)).total_seconds() / 3600)
+
+            def rempl(a):
+                for l in remplacees:
+                    a["Rempl_Articles"][l['ID']] += int(l.get('Qte', 0))
+                a["Nb_Lignes_Remplacees"] += len(remplacees)
+                a["Delai_Remplacement_h"] += delai * len(remplacees)
+            cumuler(date_r, rempl)
+
+    curseur = None
+    while True:
+        q = db.collection("LOGS").order_by("Date").limit(taille_page)
+        if curseur is not None:
+            q = q.start_after(curseur)
+        docs = list(q.stream())
+        for doc in docs:
+            traiter(doc.to_dict() or {})
+        if len(docs) < taille_page:
+            break
+        curseur = docs[-1]
+    # Logs déplacés par archives.py compacter
+    for log in archives.parcourir(db):
+        traiter(log)
+
+    if ecrire:
+        ops = [("set", db.collection(COLLECTION).document(cle), {
+            **entetes[cle], **{k: (dict(v) if isinstance(v, Counter) else v) for k, v in a.items()}
+        }) for cle, a in agregats.items()]
+        # Périodes qui n'ont plus de logs (suppressions) : on les efface
+        anciens = {d.id for d in db.collection(COLLECTION).select([]).stream()}
+        ops += [("delete", db.collection(COLLECTION).document(cle), None) for cle in anciens - set(agregats)]
+        stockage.ecrire_par_lots(db, ops)
+    return {"logs": n_logs, "documents": len(agregats)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("commande", choices=["backfill"])
+    parser.add_argument("--backend", choices=["firestore", "memoire"], default=None)
+    parser.add_argument("--page", type=int, default=500, help="logs lus par requête")
+    parser.add_argument("--simulation", action="store_true", help="calcule sans écrire")
+    parser.add_argument("--chariot", default=chariots.DEFAUT, help="id du chariot, ou « tous »")
+    args = parser.parse_args(argv)
+    db = stockage.connecter(args.backend)
+    for dbc in chariots.vues(db, args.chariot):
+        res = recalculer(dbc, taille_page=args.page, ecrire=not args.simulation)
+        print(f"[{dbc.chariot_id}] {res['logs']} logs agrégés en {res['documents']} documents {COLLECTION}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,724 @@
+"""Couche de stockage du chariot : Firestore en production, mémoire en local.
+
+Les deux implémentations exposent le même sous-ensemble de l'API du client
+Firestore (collection, document, batch, get_all, transaction...) afin que
+chariot.py n'ait qu'une seule façon d'écrire ses requêtes. Le backend mémoire
+compte chaque opération facturable, ce qui permet de mesurer le coût réel
+d'une page (voir bench.py).
+"""
+import copy
+import os
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import Future
+from datetime import datetime
+from enum import Enum
+
+ASCENDING = "ASCENDING"
+DESCENDING = "DESCENDING"
+# Tri et curseur sur l'ID du document (FieldPath.document_id() de Firestore)
+ID_DOCUMENT = "__name__"
+
+# Limite Firestore d'opérations par commit (batch ou transaction)
+MAX_OPS_BATCH = 500
+
+
+class ConflitTransaction(Exception):
+    """Un document lu dans la transaction a été modifié avant le commit."""
+
+
+# --- INTERFACE ---
+class Stockage:
+    """Sous-ensemble commun de l'API Firestore utilisé par l'application."""
+    nom = "?"
+    ASCENDING = ASCENDING
+    DESCENDING = DESCENDING
+
+    def collection(self, nom):
+        raise NotImplementedError
+
+    def batch(self):
+        raise NotImplementedError
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        raise NotImplementedError
+
+    def executer_transaction(self, fonction, *args, **kwargs):
+        """Exécute fonction(transaction, *args) avec relance en cas de conflit."""
+        raise NotImplementedError
+
+    def increment(self, valeur):
+        raise NotImplementedError
+
+    def supprimer_champ(self):
+        """Valeur sentinelle qui efface le champ (update / set merge)."""
+        raise NotImplementedError
+
+
+# --- FIRESTORE ---
+class FirestoreStockage(Stockage):
+    """Enveloppe fine autour du client firebase_admin."""
+    nom = "firestore"
+
+    def __init__(self, client):
+        self.client = client
+
+    def __getattr__(self, attr):
+        return getattr(self.client, attr)
+
+    def collection(self, nom):
+        return self.client.collection(nom)
+
+    def batch(self):
+        return self.client.batch()
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        return self.client.get_all(references, field_paths=field_paths, transaction=transaction)
+
+    def executer_transaction(self, fonction, *args, **kwargs):
+        from firebase_admin import firestore
+        return firestore.transactional(fonction)(self.client.transaction(), *args, **kwargs)
+
+    def increment(self, valeur):
+        from firebase_admin import firestore
+        return firestore.Increment(valeur)
+
+    def supprimer_champ(self):
+        from firebase_admin import firestore
+        return firestore.DELETE_FIELD
+
+
+class ConnexionDifferee:
+    """Stockage ouvert dans un thread de fond (imports, identifiants, client réseau).
+
+    Se comporte comme le stockage qu'il enveloppe ; le premier accès attend la
+    fin de l'ouverture. Faux (bool) si elle a échoué, `erreur` dit pourquoi.
+    """
+
+    def __init__(self, futur):
+        self._futur = futur
+        self.erreur = None
+
+    @classmethod
+    def ouvrir(cls, fonction, *args):
+        futur = Future()
+
+        def _ouvrir():
+            try:
+                futur.set_result(fonction(*args))
+            except Exception as e:
+                futur.set_exception(e)
+        threading.Thread(target=_ouvrir, name="ouverture-stockage", daemon=True).start()
+        return cls(futur)
+
+    @classmethod
+    def prete(cls, db):
+        futur = Future()
+        futur.set_result(db)
+        return cls(futur)
+
+    def pret(self):
+        return self._futur.done()
+
+    def resoudre(self):
+        try:
+            return self._futur.result()
+        except Exception as e:
+            if self.erreur is None:
+                print("Erreur ouverture stockage:", e)
+                self.erreur = str(e)
+            return None
+
+    def __bool__(self):
+        return self.resoudre() is not None
+
+    def __getattr__(self, attr):
+        db = self.resoudre()
+        if db is None:
+            raise ConnectionError(self.erreur or "Base de données non connectée")
+        return getattr(db, attr)
+
+
+# --- MÉMOIRE (STAND-IN FIRESTORE) ---
+class _Increment:
+    def __init__(self, valeur):
+        self.valeur = valeur
+
+
+class _SupprimerChamp:
+    pass
+
+
+_SUPPRIMER_CHAMP = _SupprimerChamp()
+
+
+def _lire_champ(data, chemin):
+    val = data
+    for part in chemin.split("."):
+        if not isinstance(val, dict) or part not in val:
+            return None
+        val = val[part]
+    return val
+
+
+def _ecrire_champ(data, chemin, valeur):
+    parts = chemin.split(".")
+    cible = data
+    for part in parts[:-1]:
+        if not isinstance(cible.get(part), dict):
+            cible[part] = {}
+        cible = cible[part]
+    if isinstance(valeur, _SupprimerChamp):
+        cible.pop(parts[-1], None)
+        return
+    if isinstance(valeur, _Increment):
+        ancien = cible.get(parts[-1])
+        valeur = (ancien if isinstance(ancien, (int, float)) else 0) + valeur.valeur
+    cible[parts[-1]] = valeur
+
+
+def _resoudre(data):
+    """Copie profonde en appliquant les transformations (Increment)."""
+    out = {}
+    _fusionner(out, data)
+    return out
+
+
+def _fusionner(cible, data):
+    # Fusion récursive des maps, comme set(..., merge=True) côté Firestore
+    for k, v in data.items():
+        if isinstance(v, dict) and isinstance(cible.get(k), dict):
+            _fusionner(cible[k], v)
+        elif isinstance(v, dict):
+            cible[k] = {}
+            _fusionner(cible[k], v)
+        elif isinstance(v, (_Increment, _SupprimerChamp)):
+            _ecrire_champ(cible, k, v)
+        else:
+            cible[k] = copy.deepcopy(v)
+
+
+def _cle_tri(val):
+    # Ordre des types inspiré de Firestore : null < bool < nombre < date < texte < reste
+    if val is None: return (0, 0)
+    if isinstance(val, bool): return (1, val)
+    if isinstance(val, (int, float)): return (2, val)
+    if isinstance(val, datetime): return (3, val.timestamp())
+    if isinstance(val, str): return (4, val)
+    return (5, str(val))
+
+
+_OPERATEURS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a is not None and a != b,
+    "<": lambda a, b: a is not None and _cle_tri(a) < _cle_tri(b),
+    "<=": lambda a, b: a is not None and _cle_tri(a) <= _cle_tri(b),
+    ">": lambda a, b: a is not None and _cle_tri(a) > _cle_tri(b),
+    ">=": lambda a, b: a is not None and _cle_tri(a) >= _cle_tri(b),
+    "in": lambda a, b: a in b,
+    "not-in": lambda a, b: a is not None and a not in b,
+    "array-contains": lambda a, b: isinstance(a, list) and b in a,
+    "array-contains-any": lambda a, b: isinstance(a, list) and any(x in a for x in b),
+}
+
+
+class _DocumentSnapshot:
+    def __init__(self, reference, data, champs=None):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+        self._champs = champs
+
+    def to_dict(self):
+        if self._data is None:
+            return None
+        if self._champs is None:
+            return copy.deepcopy(self._data)
+        out = {}
+        for c in self._champs:
+            v = _lire_champ(self._data, c)
+            if v is not None:
+                _ecrire_champ(out, c, copy.deepcopy(v))
+        return out
+
+    def get(self, champ):
+        return copy.deepcopy(_lire_champ(self._data or {}, champ))
+
+
+class _DocumentReference:
+    def __init__(self, client, chemin_collection, doc_id):
+        self._client = client
+        self._coll = chemin_collection
+        self.id = doc_id
+        self.path = f"{chemin_collection}/{doc_id}"
+
+    def __eq__(self, autre):
+        return isinstance(autre, _DocumentReference) and autre.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    @property
+    def parent(self):
+        return _CollectionReference(self._client, self._coll)
+
+    def collection(self, nom):
+        return _CollectionReference(self._client, f"{self.path}/{nom}")
+
+    def get(self, field_paths=None, transaction=None):
+        return next(iter(self._client.get_all([self], field_paths=field_paths, transaction=transaction)))
+
+    def set(self, data, merge=False):
+        self._client._commit([("set", self, data, merge)])
+
+    def create(self, data):
+        self._client._commit([("create", self, data, False)])
+
+    def update(self, data):
+        self._client._commit([("update", self, data, False)])
+
+    def delete(self):
+        self._client._commit([("delete", self, None, False)])
+
+
+class _Query:
+    def __init__(self, client, chemin, filtres=(), tris=(), limite=None, apres=None, champs=None):
+        self._client = client
+        self._chemin = chemin
+        self._filtres = tuple(filtres)
+        self._tris = tuple(tris)
+        self._limite = limite
+        self._apres = apres
+        self._champs = champs
+
+    def _copie(self, **kw):
+        base = dict(filtres=self._filtres, tris=self._tris, limite=self._limite,
+                    apres=self._apres, champs=self._champs)
+        base.update(kw)
+        return _Query(self._client, self._chemin, **base)
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        if op_string not in _OPERATEURS:
+            raise ValueError(f"Opérateur non supporté : {op_string}")
+        return self._copie(filtres=self._filtres + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction=ASCENDING):
+        return self._copie(tris=self._tris + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copie(limite=count)
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copie(apres=document_fields_or_snapshot)
+
+    def select(self, field_paths):
+        return self._copie(champs=list(field_paths))
+
+    def _correspond(self, data):
+        for champ, op, val in self._filtres:
+            if not _OPERATEURS[op](_lire_champ(data, champ), val):
+                return False
+        return all(c == ID_DOCUMENT or _lire_champ(data, c) is not None for c, _ in self._tris)
+
+    def _cle(self, doc_id, data):
+        cle = []
+        for champ, direction in self._tris:
+            k = _cle_tri(doc_id if champ == ID_DOCUMENT else _lire_champ(data, champ))
+            cle.append(_Inverse(k) if direction == DESCENDING else k)
+        cle.append(doc_id)
+        return tuple(cle)
+
+    def _executer(self):
+        docs = self._client._collection_brute(self._chemin)
+        resultats = [(self._cle(i, d), i, d) for i, d in docs.items() if self._correspond(d)]
+        resultats.sort(key=lambda r: r[0])
+        if self._apres is not None:
+            if isinstance(self._apres, _DocumentSnapshot):
+                curseur = self._cle(self._apres.id, self._apres._data or {})
+                resultats = [r for r in resultats if r[0] > curseur]
+            else:
+                # Curseur sous forme de dict : comparaison sur les seuls champs triés
+                n = len(self._tris)
+                doc_id = self._apres.get(ID_DOCUMENT, "")
+                curseur = self._cle(getattr(doc_id, "id", doc_id), self._apres)[:n]
+                resultats = [r for r in resultats if r[0][:n] > curseur]
+        if self._limite is not None:
+            resultats = resultats[:self._limite]
+        return [(i, d) for _, i, d in resultats]
+
+    def stream(self, transaction=None):
+        self._client._aller_retour()
+        with self._client._verrou:
+            resultats = self._executer()
+            if transaction is not None:
+                for i, _ in resultats:
+                    transaction._noter_lecture(f"{self._chemin}/{i}")
+        # Firestore facture au minimum une lecture par requête
+        self._client._compter("lectures", max(1, len(resultats)))
+        for i, d in resultats:
+            yield _DocumentSnapshot(_DocumentReference(self._client, self._chemin, i), d, self._champs)
+
+    def get(self, transaction=None):
+        return list(self.stream(transaction=transaction))
+
+    def on_snapshot(self, callback):
+        return self._client._ecouter(self, callback)
+
+
+class _Inverse:
+    """Inverse l'ordre de comparaison (tri DESCENDING)."""
+    __slots__ = ("k",)
+
+    def __init__(self, k):
+        self.k = k
+
+    def __lt__(self, autre): return self.k > autre.k
+    def __gt__(self, autre): return self.k < autre.k
+    def __eq__(self, autre): return self.k == autre.k
+    def __le__(self, autre): return self.k >= autre.k
+    def __ge__(self, autre): return self.k <= autre.k
+
+
+class _CollectionReference(_Query):
+    def __init__(self, client, chemin):
+        super().__init__(client, chemin)
+        self.id = chemin.rsplit("/", 1)[-1]
+
+    def document(self, document_id=None):
+        return _DocumentReference(self._client, self._chemin, document_id or uuid.uuid4().hex[:20])
+
+    def add(self, document_data, document_id=None):
+        ref = self.document(document_id)
+        ref.create(document_data)
+        return datetime.now(), ref
+
+    def list_documents(self):
+        with self._client._verrou:
+            ids = list(self._client._collection_brute(self._chemin))
+        return [self.document(i) for i in ids]
+
+
+class _Ecritures:
+    """Base commune batch / transaction : les écritures sont mises en attente."""
+
+    def __init__(self, client):
+        self._client = client
+        self._ops = []
+
+    def set(self, reference, document_data, merge=False):
+        self._ops.append(("set", reference, document_data, merge))
+
+    def create(self, reference, document_data):
+        self._ops.append(("create", reference, document_data, False))
+
+    def update(self, reference, field_updates):
+        self._ops.append(("update", reference, field_updates, False))
+
+    def delete(self, reference):
+        self._ops.append(("delete", reference, None, False))
+
+    def __len__(self):
+        return len(self._ops)
+
+
+class _WriteBatch(_Ecritures):
+    def commit(self):
+        ops, self._ops = self._ops, []
+        return self._client._commit(ops)
+
+
+class _Transaction(_Ecritures):
+    def __init__(self, client):
+        super().__init__(client)
+        self._lus = {}
+
+    def _noter_lecture(self, chemin):
+        self._lus.setdefault(chemin, self._client._versions.get(chemin, 0))
+
+    def get(self, ref_or_query):
+        if isinstance(ref_or_query, _DocumentReference):
+            return ref_or_query.get(transaction=self)
+        return ref_or_query.stream(transaction=self)
+
+
+class _TypeChangement(Enum):
+    ADDED = 1
+    REMOVED = 2
+    MODIFIED = 3
+
+
+class _Changement:
+    def __init__(self, type_, document):
+        self.type = type_
+        self.document = document
+
+
+class _Ecoute:
+    def __init__(self, client, requete, callback):
+        self._client = client
+        self.requete = requete
+        self.callback = callback
+
+    def unsubscribe(self):
+        with self._client._verrou:
+            if self in self._client._ecoutes:
+                self._client._ecoutes.remove(self)
+
+
+class MemoireStockage(Stockage):
+    """Stand-in Firestore en mémoire, thread-safe, qui compte les opérations.
+
+    `stats` suit les unités facturées par Firestore (lectures, écritures,
+    suppressions) ainsi que le nombre d'allers-retours réseau simulés ;
+    `latence` ajoute un délai par aller-retour pour les mesures de temps ;
+    `panne` fait échouer tout aller-retour (réseau coupé).
+    """
+    nom = "memoire"
+
+    def __init__(self, latence=0.0):
+        self.latence = latence
+        self.panne = False
+        self.stats = Counter()
+        self._donnees = {}
+        self._versions = {}
+        self._ecoutes = []
+        self._verrou = threading.RLock()
+
+    # API client
+    def collection(self, nom):
+        return _CollectionReference(self, nom)
+
+    def document(self, chemin):
+        coll, doc_id = chemin.rsplit("/", 1)
+        return _DocumentReference(self, coll, doc_id)
+
+    def batch(self):
+        return _WriteBatch(self)
+
+    def transaction(self):
+        return _Transaction(self)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        references = list(references)
+        self._aller_retour()
+        with self._verrou:
+            snaps = []
+            for ref in references:
+                data = self._collection_brute(ref._coll).get(ref.id)
+                if transaction is not None:
+                    transaction._noter_lecture(ref.path)
+                snaps.append(_DocumentSnapshot(ref, data, field_paths))
+        self._compter("lectures", len(references))
+        return iter(snaps)
+
+    def executer_transaction(self, fonction, *args, max_tentatives=5, **kwargs):
+        for tentative in range(max_tentatives):
+            transaction = self.transaction()
+            resultat = fonction(transaction, *args, **kwargs)
+            try:
+                self._commit(transaction._ops, lus=transaction._lus)
+                return resultat
+            except ConflitTransaction:
+                self._compter("conflits")
+                if tentative == max_tentatives - 1:
+                    raise
+                # Attente exponentielle aléatoire, comme firestore.transactional
+                time.sleep(random.uniform(0, max(self.latence, 0.001) * 2 ** (tentative + 1)))
+
+    def increment(self, valeur):
+        return _Increment(valeur)
+
+    def supprimer_champ(self):
+        return _SUPPRIMER_CHAMP
+
+    # Outils locaux
+    def reinitialiser_stats(self):
+        with self._verrou:
+            self.stats.clear()
+
+    def vider(self):
+        with self._verrou:
+            self._donnees.clear()
+            self._versions.clear()
+            self._ecoutes.clear()
+            self.stats.clear()
+
+    def charger(self, collection, documents):
+        """Insère {id: data} directement, sans compter d'écritures (amorçage)."""
+        with self._verrou:
+            coll = self._donnees.setdefault(collection, {})
+            for doc_id, data in documents.items():
+                coll[str(doc_id)] = _resoudre(data)
+                chemin = f"{collection}/{doc_id}"
+                self._versions[chemin] = self._versions.get(chemin, 0) + 1
+
+    # Interne
+    def _collection_brute(self, chemin):
+        return self._donnees.get(chemin, {})
+
+    def _compter(self, cle, n=1):
+        if not n:
+            return
+        with self._verrou:
+            self.stats[cle] += n
+
+    def _aller_retour(self):
+        if self.panne:
+            raise ConnectionError("Réseau indisponible (panne simulée)")
+        self._compter("allers_retours")
+        if self.latence:
+            time.sleep(self.latence)
+
+    def _commit(self, ops, lus=None):
+        if len(ops) > MAX_OPS_BATCH:
+            raise ValueError(f"maximum {MAX_OPS_BATCH} writes allowed per request")
+        self._aller_retour()
+        with self._verrou:
+            for chemin, version in (lus or {}).items():
+                if self._versions.get(chemin, 0) != version:
+                    raise ConflitTransaction(chemin)
+            # Validation complète avant application : le commit est atomique
+            etat = {}
+            for op, ref, data, merge in ops:
+                avant = etat[ref.path] if ref.path in etat else self._collection_brute(ref._coll).get(ref.id)
+                if op == "create" and avant is not None:
+                    raise ValueError(f"Document already exists: {ref.path}")
+                if op == "update" and avant is None:
+                    raise LookupError(f"No document to update: {ref.path}")
+                if op == "delete":
+                    etat[ref.path] = None
+                elif op == "update":
+                    nouveau = copy.deepcopy(avant)
+                    for k, v in data.items():
+                        _ecrire_champ(nouveau, k, v if isinstance(v, (_Increment, _SupprimerChamp)) else copy.deepcopy(v))
+                    etat[ref.path] = nouveau
+                elif op == "set" and merge and avant is not None:
+                    nouveau = copy.deepcopy(avant)
+                    _fusionner(nouveau, data)
+                    etat[ref.path] = nouveau
+                else:
+                    etat[ref.path] = _resoudre(data)
+            refs = {ref.path: ref for _, ref, _, _ in ops}
+            anciens = {}
+            for chemin, data in etat.items():
+                ref = refs[chemin]
+                coll = self._donnees.setdefault(ref._coll, {})
+                anciens[chemin] = coll.get(ref.id)
+                if data is None:
+                    coll.pop(ref.id, None)
+                else:
+                    coll[ref.id] = data
+                self._versions[chemin] = self._versions.get(chemin, 0) + 1
+            ecoutes = list(self._ecoutes)
+        n_suppr = sum(1 for op in ops if op[0] == "delete")
+        self._compter("ecritures", len(ops) - n_suppr)
+        self._compter("suppressions", n_suppr)
+        self._notifier(ecoutes, refs, anciens, etat)
+        return [datetime.now()] * len(ops)
+
+    def _ecouter(self, requete, callback):
+        ecoute = _Ecoute(self, requete, callback)
+        with self._verrou:
+            self._ecoutes.append(ecoute)
+            resultats = requete._executer()
+        self._compter("lectures", max(1, len(resultats)))
+        docs = [_DocumentSnapshot(_DocumentReference(self, requete._chemin, i), d) for i, d in resultats]
+        changements = [_Changement(_TypeChangement.ADDED, s) for s in docs]
+        callback(docs, changements, datetime.now())
+        return ecoute
+
+    def _notifier(self, ecoutes, refs, anciens, nouveaux):
+        for ecoute in ecoutes:
+            q = ecoute.requete
+            changements = []
+            for chemin, data in nouveaux.items():
+                ref = refs[chemin]
+                if ref._coll != q._chemin:
+                    continue
+                avant = anciens[chemin] is not None and q._correspond(anciens[chemin])
+                apres = data is not None and q._correspond(data)
+                if not avant and not apres:
+                    continue
+                type_ = (_TypeChangement.MODIFIED if avant and apres
+                         else _TypeChangement.ADDED if apres else _TypeChangement.REMOVED)
+                changements.append(_Changement(type_, _DocumentSnapshot(ref, data if apres else anciens[chemin])))
+            if not changements:
+                continue
+            self._compter("lectures", len(changements))
+            with self._verrou:
+                docs = [_DocumentSnapshot(_DocumentReference(self, q._chemin, i), d) for i, d in q._executer()]
+            ecoute.callback(docs, changements, datetime.now())
+
+
+# --- OUTILS COMMUNS ---
+def lire_par_lots(db, references, taille=MAX_OPS_BATCH):
+    """get_all découpé en lots : un aller-retour par tranche de `taille` documents."""
+    references = list(references)
+    for i in range(0, len(references), taille):
+        yield from db.get_all(references[i:i + taille])
+
+
+def ecrire_par_lots(db, operations, taille=MAX_OPS_BATCH):
+    """Applique [(op, ref, data)] (op : set / merge / update / delete) en batches de `taille`.
+
+    Chaque batch est atomique, pas l'ensemble : l'appelant ordonne les
+    opérations pour qu'un arrêt en cours de route reste sans danger.
+    Renvoie le nombre de commits effectués.
+    """
+    commits = 0
+    for i in range(0, len(operations), taille):
+        batch = db.batch()
+        for op, ref, data in operations[i:i + taille]:
+            appliquer(batch, op, ref, data)
+        batch.commit()
+        commits += 1
+    return commits
+
+
+def appliquer(ecrivain, op, ref, data=None):
+    """Ajoute une opération (set / merge / update / delete) à un batch ou une transaction."""
+    if op == "delete":
+        ecrivain.delete(ref)
+    elif op == "merge":
+        ecrivain.set(ref, data, merge=True)
+    else:
+        getattr(ecrivain, op)(ref, data)
+
+
+def connecter(backend=None, chemin_cle="firestore_key.json"):
+    """Connexion hors Streamlit (scripts en ligne de commande).
+
+    Firestore : clé de service locale si présente, sinon identifiants par
+    défaut de l'environnement (GOOGLE_APPLICATION_CREDENTIALS).
+    """
+    backend = backend or os.environ.get("CHARIOT_BACKEND", "firestore")
+    if backend == "memoire":
+        return memoire_partagee()
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+    if not firebase_admin._apps:
+        if os.path.exists(chemin_cle):
+            cred = credentials.Certificate(chemin_cle)
+        else:
+            cred = credentials.ApplicationDefault()
+        firebase_admin.initialize_app(cred)
+    return FirestoreStockage(firestore.client())
+
+
+_memoire = None
+_memoire_verrou = threading.Lock()
+
+
+def memoire_partagee():
+    """Instance mémoire unique du processus (partagée avec bench.py)."""
+    global _memoire
+    with _memoire_verrou:
+        if _memoire is None:
+            _memoire = MemoireStockage()
+        return _memoire
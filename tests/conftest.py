@@ -0,0 +1,7 @@
+"""Tests sur le backend mémoire : pas de Firestore ni de réseau."""
+import os
+import sys
+
+os.environ.setdefault("CHARIOT_BACKEND", "memoire")
+os.environ.setdefault("CHARIOT_JOURNAL", ":memory:")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,50 @@
+"""Suppression d'un log archivé : l'index du mois reste exact."""
+from datetime import datetime, timedelta
+
+import archives
+import stockage
+
+DEBUT = datetime(2026, 1, 5, 8)
+
+
+def _logs(db, n, depart=0):
+    for i in range(depart, depart + n):
+        db.collection("LOGS").document(f"log{i:04d}").set({
+            "Date": DEBUT + timedelta(hours=i), "Statut": "Remplacé", "Utilisateur": "U", "Details_Struct": []})
+
+
+def test_supprimer_puis_compacter_complete_la_derniere_partie(monkeypatch):
+    monkeypatch.setattr(archives, "TAILLE_PARTIE", 5)
+    db = stockage.MemoireStockage()
+    _logs(db, 10)
+    archives.compacter(db, maintenant=DEBUT + timedelta(days=200))
+    etat = archives.lire_index(db)["2026-01"]
+    assert (etat["Parties"], etat["Nb"], etat["Derniere"]) == (2, 10, 5)
+
+    # Les plus récents sont archivés d'abord : log0000, borne Premier du mois, est dans la dernière partie
+    derniere = archives.id_partie("2026-01", 1)
+    assert "log0000" in [l["id"] for l in db.collection(archives.COLLECTION).document(derniere).get().to_dict()["Logs"]]
+    archives.supprimer_log(db, derniere, "log0000")
+    etat = archives.lire_index(db)["2026-01"]
+    assert (etat["Parties"], etat["Nb"], etat["Derniere"]) == (2, 9, 4)
+    assert (etat["Premier"], etat["Dernier"]) == (DEBUT + timedelta(hours=1), DEBUT + timedelta(hours=9))
+
+    # La compaction suivante remplit la place libérée au lieu d'ouvrir une troisième partie
+    _logs(db, 1, depart=100)
+    archives.compacter(db, maintenant=DEBUT + timedelta(days=200))
+    etat = archives.lire_index(db)["2026-01"]
+    assert (etat["Parties"], etat["Nb"], etat["Derniere"]) == (2, 10, 5)
+    assert len(db.collection(archives.COLLECTION).document(derniere).get().to_dict()["Logs"]) == 5
+
+
+def test_supprimer_dans_une_partie_pleine(monkeypatch):
+    monkeypatch.setattr(archives, "TAILLE_PARTIE", 5)
+    db = stockage.MemoireStockage()
+    _logs(db, 7)
+    archives.compacter(db, maintenant=DEBUT + timedelta(days=200))
+    premiere = archives.id_partie("2026-01", 0)
+    archives.supprimer_log(db, premiere, "log0005")
+    etat = archives.lire_index(db)["2026-01"]
+    # Partie 0 n'est pas la dernière : Derniere ne bouge pas, ni les bornes (log0005 n'en est pas une)
+    assert (etat["Nb"], etat["Derniere"]) == (6, 2)
+    assert (etat["Premier"], etat["Dernier"]) == (DEBUT, DEBUT + timedelta(hours=6))
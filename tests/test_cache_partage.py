@@ -0,0 +1,163 @@
+"""Tier partagé entre répliques : invalidation, calcul unique, bail du meneur d'inventaire.
+
+Chaque « réplique » a ses propres objets (VersionsChariots, Tier, ReplicaPartagee)
+sur un même stockage : RedisLocal (adaptateur Redis) ou un fichier SQLite.
+"""
+import threading
+import time
+
+import pytest
+
+import cache
+import inventaire
+import stockage
+
+
+@pytest.fixture(params=["redis", "sqlite"])
+def tiers(request, tmp_path):
+    """Fabrique de tiers vus par des répliques différentes, sur le même stockage."""
+    if request.param == "redis":
+        client = cache.RedisLocal()
+        return lambda: cache.TierRedis(client)
+    chemin = str(tmp_path / "cache.db")
+    return lambda: cache.TierSQLite(chemin)
+
+
+def _attendre(condition, delai=5.0):
+    fin = time.monotonic() + delai
+    while time.monotonic() < fin:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+# --- VERSIONS ---
+def test_invalidation_vue_par_les_autres_repliques(tiers, monkeypatch):
+    monkeypatch.setattr(cache, "FRAICHEUR", 0.0)
+    a, b = cache.VersionsChariots(tiers()), cache.VersionsChariots(tiers())
+    avant = b.chariot("ped").version(cache.INVENTAIRE)
+    autre = b.chariot("principal").version(cache.INVENTAIRE)
+    a.chariot("ped").invalider(cache.INVENTAIRE, cache.LOGS_OUVERTS)
+    assert b.chariot("ped").version(cache.INVENTAIRE) == avant + 1
+    assert b.chariot("ped").version(cache.LOGS_OUVERTS) == 1
+    # Les versions sont par chariot
+    assert b.chariot("principal").version(cache.INVENTAIRE) == autre
+
+
+def test_version_relue_apres_fraicheur(tiers, monkeypatch):
+    monkeypatch.setattr(cache, "FRAICHEUR", 0.2)
+    a, b = cache.VersionsChariots(tiers()), cache.VersionsChariots(tiers())
+    v = b.chariot("ped").version(cache.STATS)
+    a.chariot("ped").invalider(cache.STATS)
+    assert b.chariot("ped").version(cache.STATS) == v  # encore dans la fenêtre de fraîcheur
+    assert _attendre(lambda: b.chariot("ped").version(cache.STATS) == v + 1)
+
+
+# --- CALCUL UNIQUE ---
+def test_obtenir_calcule_une_seule_fois(tiers):
+    appels = []
+    resultats = []
+
+    def calcul():
+        appels.append(1)
+        time.sleep(0.2)  # lecture en base lente : les autres répliques arrivent pendant le calcul
+        return {"logs": [1, 2, 3]}
+
+    def replique():
+        resultats.append(tiers().obtenir("ped/LOGS_OUVERTS/7", calcul, ttl=60))
+
+    repliques = [threading.Thread(target=replique) for _ in range(8)]
+    for t in repliques: t.start()
+    for t in repliques: t.join()
+    assert len(appels) == 1
+    assert resultats == [{"logs": [1, 2, 3]}] * 8
+    # Valeur déjà rangée : plus aucun calcul
+    assert tiers().obtenir("ped/LOGS_OUVERTS/7", calcul) == {"logs": [1, 2, 3]}
+    assert len(appels) == 1
+
+
+# --- MENEUR DE L'INVENTAIRE ---
+@pytest.fixture
+def base():
+    db = stockage.MemoireStockage()
+    db.charger("INVENTAIRE", {f"ART{i:03d}": {"Nom": f"Article {i}", "Tiroir": "Dessus", "Dotation": 5, "Stock_Actuel": 5}
+                              for i in range(50)})
+    return db
+
+
+def _replique(db, tier):
+    r = inventaire.ReplicaPartagee(db, "INVENTAIRE", tier, "ped")
+    r.SONDAGE, r.BAIL = 0.02, 0.5
+    return r
+
+
+def _stock(r, item_id):
+    with r._verrou:
+        return r._items.get(item_id, {}).get("Stock_Actuel")
+
+
+def test_un_seul_meneur_et_deltas(base, tiers):
+    tier = tiers()
+    a, b = _replique(base, tier), _replique(base, tiers())
+    try:
+        assert a.demarrer() and b.demarrer()
+        assert _attendre(lambda: a.meneur != b.meneur)
+        meneur, suiveur = (a, b) if a.meneur else (b, a)
+        base.collection("INVENTAIRE").document("ART007").update({"Stock_Actuel": 2})
+        base.collection("INVENTAIRE").document("ART008").delete()
+        assert _attendre(lambda: _stock(suiveur, "ART007") == 2 and _stock(suiveur, "ART008") is None)
+        # Chaque lot publié ne porte que ses documents, pas l'inventaire entier
+        n = tier.version("ped/replique/INVENTAIRE/version")
+        modifies, retires, _ = tier.charger(f"ped/replique/INVENTAIRE/delta/{n}")
+        assert (list(modifies), retires) == ([], ["ART008"])
+        assert len(suiveur.snapshot()) == len(meneur.snapshot()) == 49
+    finally:
+        a.arreter(); b.arreter()
+
+
+def test_bascule_du_bail(base, tiers):
+    a, b = _replique(base, tiers()), _replique(base, tiers())
+    try:
+        assert a.demarrer()
+        assert _attendre(lambda: a.meneur)
+        assert b.demarrer() and not b.meneur
+        # Meneur figé : il n'écoute plus et ne prolonge plus son bail, sans le libérer
+        a._arret.set()
+        a._boucle.join()
+        a._quitter_la_tete()
+        base.collection("INVENTAIRE").document("ART001").update({"Stock_Actuel": 1})
+        assert _attendre(lambda: b.meneur, delai=a.BAIL * 4)
+        assert _attendre(lambda: _stock(b, "ART001") == 1)
+
+        # Une réplique qui démarre après la bascule repart du contenu complet du nouveau meneur
+        c = _replique(base, tiers())
+        try:
+            base.collection("INVENTAIRE").document("ART002").update({"Stock_Actuel": 0})
+            assert c.demarrer() and not c.meneur
+            assert _attendre(lambda: _stock(c, "ART001") == 1 and _stock(c, "ART002") == 0)
+        finally:
+            c.arreter()
+    finally:
+        a.arreter(); b.arreter()
+
+
+def test_delta_perdu_repart_du_contenu_complet(base, tiers):
+    tier = tiers()
+    a, b = _replique(base, tier), _replique(base, tiers())
+    a.POINT_COMPLET = 3
+    try:
+        assert a.demarrer() and _attendre(lambda: a.meneur)
+        assert b.demarrer()
+        b._arret.set(); b._boucle.join()  # suiveur en pause
+        for i in range(5):
+            base.collection("INVENTAIRE").document(f"ART{i:03d}").update({"Stock_Actuel": 0})
+        # Un delta a disparu (expiré) : le contenu complet publié depuis le couvre
+        premier = b._publiee + 1
+        tier.ecrire(f"ped/replique/INVENTAIRE/delta/{premier}", b"", ttl=0.001)
+        time.sleep(0.01)
+        b._synchroniser()
+        assert all(_stock(b, f"ART{i:03d}") == 0 for i in range(5))
+        assert b._publiee == tier.version("ped/replique/INVENTAIRE/version")
+    finally:
+        a.arreter(); b.arreter()
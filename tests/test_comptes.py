@@ -0,0 +1,34 @@
+"""Connexion par l'index des identifiants : comptes créés hors application, identifiants ambigus."""
+import comptes
+import stockage
+
+
+def test_compte_cree_dans_la_console():
+    db = stockage.MemoireStockage()
+    comptes.enregistrer_utilisateur(db, "alice", {}, "a")
+    index = comptes.IndexAlias(db, relecture_min=0)
+    assert comptes.authentifier(db, index, "alice", "a")[0] == "alice"
+    # Écrits directement, sans passer par l'index
+    db.collection("UTILISATEURS").document("nouveau").set({"password": "x"})
+    db.collection("UTILISATEURS").document("Console").set({"password": "y", "username": "cons"})
+    assert comptes.authentifier(db, index, "nouveau", "x")[0] == "nouveau"
+    assert comptes.authentifier(db, index, "cons", "y")[0] == "Console"
+    # Ajoutés à l'index : la connexion suivante ne fait plus de recherche
+    assert index.resoudre("NOUVEAU") == "nouveau"
+    assert comptes.IndexAlias(db).resoudre("console") == "Console"
+    assert comptes.authentifier(db, index, "inconnu", "x") == (None, None, "Utilisateur introuvable")
+
+
+def test_identifiants_ambigus(capsys):
+    db = stockage.MemoireStockage()
+    db.collection("UTILISATEURS").document("Admin").set({"password": "A"})
+    db.collection("UTILISATEURS").document("admin").set({"password": "a"})
+    index = comptes.reindexer(db)
+    assert index["admin"] is None
+    assert "ambigu" in capsys.readouterr().out
+    idx = comptes.IndexAlias(db)
+    assert comptes.authentifier(db, idx, "Admin", "A")[0] == "Admin"
+    assert comptes.authentifier(db, idx, "admin", "a")[0] == "admin"
+    # Ni l'un ni l'autre ne revendique la forme normalisée
+    assert idx.resoudre("admin") is None
+    assert comptes.authentifier(db, idx, "ADMIN", "a")[2] == "Utilisateur introuvable"
@@ -0,0 +1,61 @@
+"""Validation de panier concurrente : aucun décrément perdu, rejeu d'une clé sans effet."""
+import threading
+from datetime import datetime
+
+import pytest
+
+import journal
+import stockage
+
+
+@pytest.fixture
+def chariot():
+    import chariot
+    db = stockage.memoire_partagee()
+    db.latence = 0.001  # assez pour entrelacer les transactions des postes
+    yield chariot
+    db.latence = 0.0
+
+
+def _charge(article, qte=1):
+    return {"Panier": {article: qte}, "IP": "IP-TEST", "Utilisateur": "Test", "Date": datetime.now()}
+
+
+def _stock(article):
+    return stockage.memoire_partagee().collection("INVENTAIRE").document(article).get().to_dict()["Stock_Actuel"]
+
+
+def test_postes_concurrents_sans_decrement_perdu(chariot):
+    n_postes, n_par_poste = 8, 15
+    stock_initial = n_postes * n_par_poste
+    stockage.memoire_partagee().charger("INVENTAIRE", {"CONCURRENT": {
+        "Nom": "Concurrent", "Tiroir": "Dessus", "Dotation": stock_initial, "Stock_Actuel": stock_initial}})
+    reussies = []
+
+    def poste():
+        for _ in range(n_par_poste):
+            try:
+                chariot.appliquer_consommation(journal.nouvelle_cle(), _charge("CONCURRENT"))
+                reussies.append(True)
+            except stockage.ConflitTransaction:
+                reussies.append(False)  # relances épuisées : rien n'a été écrit
+
+    postes = [threading.Thread(target=poste) for _ in range(n_postes)]
+    for t in postes: t.start()
+    for t in postes: t.join()
+
+    assert len(reussies) == stock_initial
+    assert sum(reussies) > 0
+    assert _stock("CONCURRENT") == stock_initial - sum(reussies)
+
+
+def test_rejeu_meme_cle_decremente_une_fois(chariot):
+    stockage.memoire_partagee().charger("INVENTAIRE", {"REJEU": {
+        "Nom": "Rejeu", "Tiroir": "Dessus", "Dotation": 10, "Stock_Actuel": 10}})
+    cle = journal.nouvelle_cle()
+    charge = _charge("REJEU", 3)
+    chariot.appliquer_consommation(cle, charge)
+    chariot.appliquer_consommation(cle, charge)
+    assert _stock("REJEU") == 7
+    logs = stockage.memoire_partagee().collection("LOGS").document(cle).get()
+    assert logs.exists and logs.to_dict()["Details_Struct"][0]["Qte"] == 3